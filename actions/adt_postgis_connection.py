@@ -8,7 +8,12 @@ defined and the data returned.
 ***************************************************************************/
 """
 
-from qgis.core import QgsVectorLayer, QgsDataSourceUri, QgsProviderRegistry
+from PyQt5.QtCore import QVariant
+from qgis.core import QgsVectorLayer, QgsDataSourceUri, QgsProviderRegistry, QgsFeatureRequest, QgsWkbTypes
+
+# Columns of the v_fita_mem view needed to compute the MMC attributes of a point
+FITA_MEM_COLUMNS = ('id_punt', 'id_linia', 'id_u_fita', 'point_x', 'point_y', 'num_fita', 'num_sector', 'num_termes',
+                    'trobada')
 
 
 class PgADTConnection:
@@ -21,26 +26,35 @@ class PgADTConnection:
         self.schema = schema
         self.user = user
         self.pwd = password
+        # Layers opened by get_features, reused with a different subset string in every call
+        self.features_layers = {}
 
     def connect(self):
         """ Connect to the ADT PostGIS Database """
         self.uri = QgsDataSourceUri()
         self.uri.setConnection(self.host, "5432", self.dbname, self.user, self.pwd)
+        self.features_layers = {}
 
-    def get_table(self, table_name):
+    def get_table(self, table_name, where='', akey=''):
         """
         Return a table from the ADT PostGIS Database
 
         :param table_name: Name of the table to get from the database
         :type table_name: str
 
+        :param where: SQL WHERE clause, without the WHERE keyword, that the database applies to the table
+        :type where: str
+
+        :param akey: Unique ID of the table. It's needed to open the views
+        :type akey: str
+
         :return QgsVectorLayer: Layer of the table to get from the database
         :rtype QgsVectorLayer: QgsVectorLayer
         """
-        self.uri.setDataSource(self.schema, table_name, None)
+        self.uri.setDataSource(self.schema, table_name, None, where, aKeyColumn=akey)
         return QgsVectorLayer(self.uri.uri(False), table_name, "postgres")
 
-    def get_layer(self, layer_name, akey=''):
+    def get_layer(self, layer_name, akey='', where=''):
         """
         Return a layer from the ADT PostGIS Database
 
@@ -50,10 +64,242 @@ class PgADTConnection:
         :param akey: Unique ID of the layer
         :type akey: str
 
+        :param where: SQL WHERE clause, without the WHERE keyword, that the database applies to the layer
+        :type where: str
+
         :return QgsVectorLayer: Layer to get from the database
         :rtype QgsVectorLayer: QgsVectorLayer
         """
         # Geometry column -- shape
-        self.uri.setDataSource(self.schema, layer_name, 'shape', '', aKeyColumn=akey)
+        self.uri.setDataSource(self.schema, layer_name, 'shape', where, aKeyColumn=akey)
         self.uri.setSrid('25831')
         return QgsVectorLayer(self.uri.uri(False), layer_name, "postgres")
+
+    def get_query_layer(self, query, akey, geometry_column='shape', wkb_type=QgsWkbTypes.Unknown):
+        """
+        Return a layer made from a SQL query run in the ADT PostGIS Database
+
+        :param query: SQL SELECT query. The tables must be qualified with the schema
+        :type query: str
+
+        :param akey: Unique ID of the query's rows
+        :type akey: str
+
+        :param geometry_column: Name of the query's geometry column, or None if the query doesn't have geometry
+        :type geometry_column: str
+
+        :param wkb_type: Geometry type of the query's geometry column. It's needed when the provider can't
+                         determine it from the query
+        :type wkb_type: QgsWkbTypes.Type
+
+        :return QgsVectorLayer: Layer of the query's rows
+        :rtype QgsVectorLayer: QgsVectorLayer
+        """
+        # The geometry type is set in a copy of the URI, so that it doesn't change the tables opened later
+        uri = QgsDataSourceUri(self.uri)
+        uri.setDataSource('', f'({query})', geometry_column, '', aKeyColumn=akey)
+        uri.setWkbType(wkb_type)
+        if geometry_column:
+            uri.setSrid('25831')
+        return QgsVectorLayer(uri.uri(False), 'query', "postgres")
+
+    def get_max_value(self, table_name, field_name, where=''):
+        """
+        Return the maximum value of a table's field, computed by the ADT PostGIS Database
+
+        :param table_name: Name of the table
+        :type table_name: str
+
+        :param field_name: Name of the field
+        :type field_name: str
+
+        :param where: SQL WHERE clause, without the WHERE keyword
+        :type where: str
+
+        :return: Maximum value of the field as text, or None if the table doesn't have any matching row
+        :rtype: str
+        """
+        query = f'SELECT 1 AS id, max("{field_name}")::text AS max_value FROM {self.schema}.{table_name}'
+        if where:
+            query = f'{query} WHERE {where}'
+        layer = self.get_query_layer(query, 'id', None)
+        for feature in layer.getFeatures():
+            if feature['max_value']:
+                return str(feature['max_value'])
+
+        return None
+
+    def get_features(self, table_name, where='', columns=None, akey='', geometry=False):
+        """
+        Return the features of a table or layer from the ADT PostGIS Database that match the given WHERE clause.
+        The filter is sent to the database as the subset string of a layer that is reused between calls, and only
+        the requested columns are fetched, so only the matching rows and columns come over the wire.
+
+        :param table_name: Name of the table or layer to get from the database
+        :type table_name: str
+
+        :param where: SQL WHERE clause, without the WHERE keyword
+        :type where: str
+
+        :param columns: Name of the columns to fetch. If not given, all the columns are fetched
+        :type columns: tuple
+
+        :param akey: Unique ID of the layer. It's needed to open the views
+        :type akey: str
+
+        :param geometry: Indicates whether to fetch the features' geometry or not
+        :type geometry: bool
+
+        :return: List with the matching features
+        :rtype: list
+        """
+        layer = self.get_features_layer(table_name, akey, geometry)
+        layer.setSubsetString(where)
+
+        request = QgsFeatureRequest()
+        if columns:
+            request.setSubsetOfAttributes(list(columns), layer.fields())
+        if not geometry:
+            request.setFlags(QgsFeatureRequest.NoGeometry)
+
+        return list(layer.getFeatures(request))
+
+    def get_features_layer(self, table_name, akey='', geometry=False):
+        """
+        Return the layer used by get_features to fetch the features of a table or layer, opening it only the first
+        time it's requested, so that the loops that fetch the features item by item don't open a new layer each time
+
+        :param table_name: Name of the table or layer to get from the database
+        :type table_name: str
+
+        :param akey: Unique ID of the layer
+        :type akey: str
+
+        :param geometry: Indicates whether the layer has geometry or not
+        :type geometry: bool
+
+        :return QgsVectorLayer: Layer of the table or layer
+        :rtype QgsVectorLayer: QgsVectorLayer
+        """
+        key = (table_name, akey, geometry)
+        layer = self.features_layers.get(key)
+        if layer is None:
+            layer = self.get_layer(table_name, akey) if geometry else self.get_table(table_name, akey=akey)
+            self.features_layers[key] = layer
+
+        return layer
+
+    def get_grouped_features(self, table_name, key_field, values, where='', columns=None, akey='', geometry=False,
+                             key_type=int):
+        """
+        Return the features of a table or layer whose key field is in the given list of values, fetched with a
+        single query and grouped by the key field.
+
+        :param table_name: Name of the table or layer to get from the database
+        :type table_name: str
+
+        :param key_field: Name of the field used to filter and group the features
+        :type key_field: str
+
+        :param values: Values of the key field to fetch
+        :type values: tuple
+
+        :param where: Additional SQL WHERE clause, without the WHERE keyword
+        :type where: str
+
+        :param columns: Name of the columns to fetch. If not given, all the columns are fetched
+        :type columns: tuple
+
+        :param akey: Unique ID of the layer. It's needed to open the views
+        :type akey: str
+
+        :param geometry: Indicates whether to fetch the features' geometry or not
+        :type geometry: bool
+
+        :param key_type: Type the key values are converted to, in order to group them
+        :type key_type: type
+
+        :return: grouped_features: Dictionary with the key value as key and the list of its features as value
+        :rtype: dict
+        """
+        in_clause = get_in_clause(key_field, values)
+        if where:
+            in_clause = f'{in_clause} and ({where})'
+        if columns and key_field not in columns:
+            columns = (key_field, *columns)
+
+        grouped_features = {key_type(value): [] for value in values}
+        for feature in self.get_features(table_name, in_clause, columns, akey, geometry):
+            # The features without key can't be grouped
+            if is_null(feature[key_field]):
+                continue
+            grouped_features.setdefault(key_type(feature[key_field]), []).append(feature)
+
+        return grouped_features
+
+    def get_fites_mem(self, key_field, values):
+        """
+        Return the points of the v_fita_mem view whose key field is in the given list of values, fetched with a
+        single query and grouped by the key field
+
+        :param key_field: Name of the field used to filter and group the points, as id_punt or id_linia
+        :type key_field: str
+
+        :param values: Values of the key field to fetch
+        :type values: tuple
+
+        :return: Dictionary with the key value as key and the list of its points as value
+        :rtype: dict
+        """
+        key_type = int if key_field == 'id_linia' else str
+        return self.get_grouped_features('v_fita_mem', key_field, values, columns=FITA_MEM_COLUMNS, akey='id_fita',
+                                         key_type=key_type)
+
+
+def get_in_clause(field_name, values):
+    """
+    Return a SQL clause that filters the given field by a list of values
+
+    :param field_name: Name of the field to filter
+    :type field_name: str
+
+    :param values: Values that the field can take
+    :type values: tuple
+
+    :return: SQL IN clause
+    :rtype: str
+    """
+    if not values:
+        # An empty IN list is not valid SQL
+        return 'FALSE'
+    values_str = ', '.join(quote_value(value) for value in values)
+
+    return f'"{field_name}" IN ({values_str})'
+
+
+def is_null(value):
+    """
+    Check if an attribute value is NULL
+
+    :param value: Attribute value
+    :type value: object
+
+    :return: Indicates if the value is NULL
+    :rtype: bool
+    """
+    return value is None or (isinstance(value, QVariant) and value.isNull())
+
+
+def quote_value(value):
+    """
+    Quote a value as a SQL literal
+
+    :param value: Value to quote
+    :type value: str or int
+
+    :return: Quoted value
+    :rtype: str
+    """
+    value_str = str(value).replace("'", "''")
+
+    return f"'{value_str}'"
@@ -9,6 +9,7 @@ maps to the previous layer of the Municipal Map of Catalonia.
 ***************************************************************************/
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import os
 import shutil
@@ -17,22 +18,39 @@ from qgis.core import (QgsVectorLayer,
                        QgsVectorFileWriter,
                        QgsCoordinateReferenceSystem,
                        QgsField,
+                       QgsFields,
                        QgsFeature,
                        QgsGeometry,
                        QgsProject,
                        QgsMessageLog,
                        Qgis)
-from qgis.core.additions.edit import edit
 from PyQt5.QtWidgets import QMessageBox
 
 from ..config import *
+from .master_mmc import MasterMMC
+
+# Number of input directories read at the same time
+READER_WORKERS = 8
+# Name of the input entities and the pattern and extension of the file where each one is read from
+INPUT_ENTITIES = (('polygons', '-poligon-', '.shp'),
+                  ('points', '-fita-', '.shp'),
+                  ('lines', '-liniaterme-', '.shp'),
+                  ('coast_lines', '-liniacosta-', '.shp'),
+                  ('lines_table', '-liniatermetaula-', '.dbf'),
+                  ('coast_lines_table', '-liniacostataula-', '.dbf'),
+                  ('bt5_full_table', '-tallfullbt5m-', '.dbf'))
 
 
 class AgregadorMMC:
     """ MMC Agregation class """
 
-    def __init__(self):
-        """ Constructor """
+    def __init__(self, master=False):
+        """
+        Constructor
+
+        :param master: Indicates whether to work with the master GeoPackage instead of the temporal work layers
+        :type master: bool
+        """
         # Initialize instance attributes
         # Common
         self.current_date = datetime.now().strftime("%Y%m%d")
@@ -48,10 +66,15 @@ class AgregadorMMC:
         self.bt5_full_work_table = QgsVectorLayer(os.path.join(AGREGADOR_WORK_DIR, 'bt5m_temp.dbf'), 'Fulls BT5M')
         self.layers = (self.points_work_table, self.lines_work_table, self.coast_lines_work_table, self.bt5_full_work_table,
                        self.lines_work_layer, self.polygons_work_layer, self.coast_lines_work_layer, self.points_work_layer)
-        # Set input layers
-        self.points_input_layer, self.lines_input_layer, self.polygons_input_layer, self.coast_lines_input_layer, self.coast_lines_input_table, self.lines_input_table, self.bt5_full_input_table = (None, ) * 7
+        # Master GeoPackage
+        self.master = None
+        if master:
+            self.master = MasterMMC()
+            self.layers = tuple(self.master.get_layers().values())
         # Output directory
         self.output_directory = None
+        # Sets of the IDs of the features already in the work layers, used to avoid adding duplicated features
+        self.points_id_set, self.lines_layer_id_set, self.lines_table_id_set, self.points_table_id_set = (None,) * 4
 
     # #######################
     # Add data
@@ -67,151 +90,231 @@ class AgregadorMMC:
             - BT5M
         """
         QgsMessageLog.logMessage('Procés iniciat: addició de mapes al Mapa Municipal de Catalunya', level=Qgis.Info)
-
-        input_list_dir = os.listdir(AGREGADOR_INPUT_DIR)
-        for input_dir in input_list_dir:
-            QgsMessageLog.logMessage(f'Carpeta: {input_dir}', level=Qgis.Info)
-            self.reset_input_layers()
-            input_dir_path = os.path.join(AGREGADOR_INPUT_DIR, input_dir)
-            self.set_input_layers(input_dir_path)
-            # Add geometries
-            QgsMessageLog.logMessage(f'Afegint geometries...', level=Qgis.Info)
-            self.add_polygons()
-            self.add_points()
-            self.add_lines_layer()
-            self.add_coast_lines_layer()
-            # Add tables
-            QgsMessageLog.logMessage(f'Afegint taules...', level=Qgis.Info)
-            self.add_lines_table()
-            self.add_points_table()
-            self.add_coast_lines_table()
-            self.add_bt5_full_table()
-
-            QgsMessageLog.logMessage(f'Dades de la carpeta {input_dir} afegides', level=Qgis.Info)
+        if not self.master:
+            self.set_id_sets()
+
+        # The input directories are read concurrently into plain records, but their features are built and added in
+        # the main thread, one directory at a time and always in the same order
+        input_list_dir = sorted(os.listdir(AGREGADOR_INPUT_DIR))
+        input_dir_paths = [os.path.join(AGREGADOR_INPUT_DIR, input_dir) for input_dir in input_list_dir]
+        with ThreadPoolExecutor(max_workers=READER_WORKERS) as executor:
+            for input_dir, input_records in zip(input_list_dir, executor.map(read_input_directory, input_dir_paths)):
+                QgsMessageLog.logMessage(f'Carpeta: {input_dir}', level=Qgis.Info)
+                input_data = get_input_data(input_records)
+                if self.master:
+                    # Add or replace the municipal map in the master GeoPackage
+                    self.master.upsert(input_data)
+                    QgsMessageLog.logMessage(f'Dades de la carpeta {input_dir} afegides', level=Qgis.Info)
+                    continue
+                # Add geometries
+                QgsMessageLog.logMessage(f'Afegint geometries...', level=Qgis.Info)
+                self.add_polygons(*input_data['polygons'])
+                self.add_points(*input_data['points'])
+                self.add_lines_layer(*input_data['lines'])
+                self.add_coast_lines_layer(*input_data['coast_lines'])
+                # Add tables
+                QgsMessageLog.logMessage(f'Afegint taules...', level=Qgis.Info)
+                self.add_lines_table(*input_data['lines_table'])
+                self.add_points_table(*input_data['points'])
+                self.add_coast_lines_table(*input_data['coast_lines_table'])
+                self.add_bt5_full_table(*input_data['bt5_full_table'])
+
+                QgsMessageLog.logMessage(f'Dades de la carpeta {input_dir} afegides', level=Qgis.Info)
 
         QgsMessageLog.logMessage('Procés finalitzat: addició de mapes al Mapa Municipal de Catalunya', level=Qgis.Info)
 
-    def reset_input_layers(self):
-        """ Reset the input QgsVectorLayers to None to avoid over writing """
-        self.points_input_layer, self.lines_input_layer, self.polygons_input_layer, self.coast_lines_input_layer, self.coast_lines_input_table, self.lines_input_table, self.bt5_full_input_table = (None,) * 7
+    def add_polygons(self, fields, features):
+        """
+        Add the input polygons to the Municipal Map of Catalonia
+
+        :param fields: Fields of the input polygons
+        :type fields: QgsFields
+
+        :param features: Input polygons
+        :type features: list
+        """
+        self.append_features(self.polygons_work_layer, fields, features)
+
+    def add_points(self, fields, features):
+        """
+        Add the input points to the Municipal Map of Catalonia
+
+        :param fields: Fields of the input points
+        :type fields: QgsFields
+
+        :param features: Input points
+        :type features: list
+        """
+        # The points layer only keeps the IdFita field, so it's done in order to avoid adding duplicated features
+        self.append_features(self.points_work_layer, fields, features, self.points_id_set,
+                             lambda point: point['IdFita'])
+
+    def add_lines_layer(self, fields, features):
+        """
+        Add the input lines to the Municipal Map of Catalonia
+
+        :param fields: Fields of the input lines
+        :type fields: QgsFields
+
+        :param features: Input lines
+        :type features: list
+        """
+        self.append_features(self.lines_work_layer, fields, features, self.lines_layer_id_set,
+                             lambda line: line['IdLinia'])
+
+    def add_coast_lines_layer(self, fields, features):
+        """
+        Add the input coast lines to the Municipal Map of Catalonia
+
+        :param fields: Fields of the input coast lines
+        :type fields: QgsFields
+
+        :param features: Input coast lines
+        :type features: list
+        """
+        self.append_features(self.coast_lines_work_layer, fields, features)
+
+    def add_lines_table(self, fields, features):
+        """
+        Add the input lines to the table of the Municipal Map of Catalonia
+
+        :param fields: Fields of the input lines table
+        :type fields: QgsFields
+
+        :param features: Input lines table records
+        :type features: list
+        """
+        self.append_features(self.lines_work_table, fields, features, self.lines_table_id_set,
+                             lambda line: line['IdLinia'])
+
+    def add_points_table(self, fields, features):
+        """
+        Add the input points to the table of the Municipal Map of Catalonia
+
+        :param fields: Fields of the input points
+        :type fields: QgsFields
+
+        :param features: Input points
+        :type features: list
+        """
+        # A fita 3 termes is in the points table once for every line, so the ID of the points table is the
+        # pair of fita and line IDs
+        self.append_features(self.points_work_table, fields, features, self.points_table_id_set,
+                             lambda point: (point['IdFita'], point['IdLinia']))
+
+    def add_coast_lines_table(self, fields, features):
+        """
+        Add the input coast lines to the table of the Municipal Map of Catalonia
+
+        :param fields: Fields of the input coast lines table
+        :type fields: QgsFields
+
+        :param features: Input coast lines table records
+        :type features: list
+        """
+        self.append_features(self.coast_lines_work_table, fields, features)
+
+    def add_bt5_full_table(self, fields, features):
+        """
+        Add the input BT5M table of the Municipal Map of Catalonia
+
+        :param fields: Fields of the input BT5M table
+        :type fields: QgsFields
 
-    def set_input_layers(self, directory_path):
+        :param features: Input BT5M table records
+        :type features: list
         """
-        Set the input QgsVectorLayers that are going to be added to the working layers
+        self.append_features(self.bt5_full_work_table, fields, features)
 
-        :param directory_path: Directory where the input layers are located
-        :type directory_path: str
+    @staticmethod
+    def append_features(work_layer, fields, features, id_set=None, get_feature_id=None):
         """
-        files = [f for f in os.listdir(directory_path) if os.path.isfile(os.path.join(directory_path, f))]
-        for file in files:
-            if '-fita-' in file and file.endswith('.shp'):
-                self.points_input_layer = QgsVectorLayer(os.path.join(directory_path, file))
-            elif '-liniaterme-' in file and file.endswith('.shp'):
-                self.lines_input_layer = QgsVectorLayer(os.path.join(directory_path, file))
-            elif '-poligon-' in file and file.endswith('.shp'):
-                self.polygons_input_layer = QgsVectorLayer(os.path.join(directory_path, file))
-            elif '-liniacosta-' in file and file.endswith('.shp'):
-                self.coast_lines_input_layer = QgsVectorLayer(os.path.join(directory_path, file))
-            elif '-liniatermetaula-' in file and file.endswith('.dbf'):
-                self.lines_input_table = QgsVectorLayer(os.path.join(directory_path, file))
-            elif '-liniacostataula-' in file and file.endswith('.dbf'):
-                self.coast_lines_input_table = QgsVectorLayer(os.path.join(directory_path, file))
-            elif '-tallfullbt5m-' in file and file.endswith('.dbf'):
-                self.bt5_full_input_table = QgsVectorLayer(os.path.join(directory_path, file))
-
-    def add_polygons(self):
-        """ Add the input polygons to the Municipal Map of Catalonia """
-        polygons_features = self.polygons_input_layer.getFeatures()
-        with edit(self.polygons_work_layer):
-            for polygon in polygons_features:
-                self.polygons_work_layer.addFeature(polygon)
-
-    def add_points(self):
-        """ Add the input points to the Municipal Map of Catalonia """
-        points_features = self.points_input_layer.getFeatures()
-        with edit(self.points_work_layer):
-            for point in points_features:
-                # Get a list with all the points ID
-                fita_id_list = self.get_points_id_list()
-                # This is done in order to avoid adding duplicated features
-                if not point['IdFita'] in fita_id_list:
-                    geom = point.geometry()
-                    fet = QgsFeature()
-                    fet.setGeometry(geom)
-                    fet.setAttributes([point['IdFita']])
-                    self.points_work_layer.addFeature(fet)
-
-    def add_lines_layer(self):
-        """ Add the input lines to the Municipal Map of Catalonia """
-        line_id_list = self.get_lines_id_list('layer')
-
-        lines_features = self.lines_input_layer.getFeatures()
-        with edit(self.lines_work_layer):
-            for line in lines_features:
-                if not line['IdLinia'] in line_id_list:
-                    self.lines_work_layer.addFeature(line)
-
-    def add_coast_lines_layer(self):
-        """ Add the input coast lines to the Municipal Map of Catalonia """
-        coast_lines_features = self.coast_lines_input_layer.getFeatures()
-        with edit(self.coast_lines_work_layer):
-            for coast_line in coast_lines_features:
-                self.coast_lines_work_layer.addFeature(coast_line)
-
-    def add_lines_table(self):
-        """ Add the input lines to the table of the Municipal Map of Catalonia """
-        line_id_list = self.get_lines_id_list('table')
-
-        lines_features = self.lines_input_table.getFeatures()
-        with edit(self.lines_work_table):
-            for line in lines_features:
-                if not line['IdLinia'] in line_id_list:
-                    self.lines_work_table.addFeature(line)
-
-    def add_points_table(self):
-        """ Add the input points to the table of the Municipal Map of Catalonia """
-        points_features = self.points_input_layer.getFeatures()
-        with edit(self.points_work_table):
-            for point in points_features:
-                fet = QgsFeature()
-                fet.setAttributes([point['IdUFita'], point['IdFita'], point['NumTermes'], point['Monument'],
-                                   point['ValidDe'], point['ValidA'], point['DataAlta'], point['DataBaixa'],
-                                   point['IdLinia'], point['IdFitaR'], point['IdSector']])
-                self.points_work_table.addFeature(fet)
-
-    def add_coast_lines_table(self):
-        """ Add the input coast lines to the table of the Municipal Map of Catalonia """
-        coast_lines_features = self.coast_lines_input_table.getFeatures()
-        with edit(self.coast_lines_work_table):
-            for coast_line in coast_lines_features:
-                self.coast_lines_work_table.addFeature(coast_line)
-
-    def add_bt5_full_table(self):
-        """ Add the input BT5M table of the Municipal Map of Catalonia """
-        fulls_features = self.bt5_full_input_table.getFeatures()
-        with edit(self.bt5_full_work_table):
-            for full in fulls_features:
-                self.bt5_full_work_table.addFeature(full)
-
-    def get_points_id_list(self):
-        """ Get a list with all the points ID of the point working laye """
-        fita_id_list = []
-        for feat in self.points_work_layer.getFeatures():
-            fita_id_list.append(feat['IdFita'])
-
-        return fita_id_list
-
-    def get_lines_id_list(self, entity):
+        Append a batch of features to a working layer or table with a single call to its data provider. The
+        attributes are remapped by the field name, so the input fields don't need to be in the same order as the
+        working ones, and the geometry is passed through as it is.
+
+        :param work_layer: Working layer or table where the features are added
+        :type work_layer: QgsVectorLayer
+
+        :param fields: Fields of the input features
+        :type fields: QgsFields
+
+        :param features: Input features to add
+        :type features: iterable
+
+        :param id_set: Set of the IDs of the features that already exist in the working layer, updated with the IDs
+                       of the added features. If not given, all the features are added.
+        :type id_set: set
+
+        :param get_feature_id: Function that returns the ID of a feature, to check it against the ID set
+        :type get_feature_id: function
+
+        :return: Number of added features
+        :rtype: int
+        """
+        work_fields = work_layer.fields()
+        # Index of every working field in the input fields, or -1 if the input doesn't have it
+        fields_map = [fields.lookupField(work_field.name()) for work_field in work_fields]
+        is_spatial = work_layer.isSpatial()
+
+        new_features = []
+        # IDs of the new features, added to the ID set only once they are written
+        new_ids = set()
+        for feature in features:
+            if id_set is not None:
+                feature_id = get_feature_id(feature)
+                if feature_id in id_set or feature_id in new_ids:
+                    continue
+                new_ids.add(feature_id)
+            attributes = feature.attributes()
+            new_feature = QgsFeature(work_fields)
+            new_feature.setAttributes([attributes[index] if index >= 0 else None for index in fields_map])
+            if is_spatial and feature.hasGeometry():
+                new_feature.setGeometry(feature.geometry())
+            new_features.append(new_feature)
+
+        if new_features:
+            ok, added_features = work_layer.dataProvider().addFeatures(new_features)
+            if not ok:
+                error = work_layer.dataProvider().lastError()
+                QgsMessageLog.logMessage(f"No s'han pogut afegir les entitats a la capa {work_layer.name()} -- "
+                                         f"{error}", level=Qgis.Critical)
+                raise IOError(f"No s'han pogut afegir les entitats a la capa {work_layer.name()} -- {error}")
+        if id_set is not None:
+            id_set.update(new_ids)
+
+        return len(new_features)
+
+    def set_id_sets(self):
         """
-        Get a list with all the lines ID of the line working layer
+        Set the sets of the IDs of the features that already exist in the work layers. They are built only once and
+        then updated every time that a feature is added, so checking if a feature is duplicated doesn't need to
+        read the work layers again.
+        """
+        self.points_id_set = self.get_points_id_set()
+        self.lines_layer_id_set = self.get_lines_id_set('layer')
+        self.lines_table_id_set = self.get_lines_id_set('table')
+        self.points_table_id_set = {(feat['IdFita'], feat['IdLinia']) for feat in self.points_work_table.getFeatures()}
 
-        :param entity: Type of the entity to get the line ID list
+    def get_points_id_set(self):
+        """
+        Get a set with all the points ID of the point working layer
+
+        :return: Set of the points ID
+        :rtype: set
+        """
+        return {feat['IdFita'] for feat in self.points_work_layer.getFeatures()}
+
+    def get_lines_id_set(self, entity):
+        """
+        Get a set with all the lines ID of the line working layer
+
+        :param entity: Type of the entity to get the line ID set
         :type entity: str
 
-        :return line_id_list: List of the lines ID
-        :rtype line_id_list: tuple
+        :return: Set of the lines ID
+        :rtype: set
         """
-        line_id_list = []
         layer = None
 
         if entity == 'layer':
@@ -219,16 +322,16 @@ class AgregadorMMC:
         elif entity == 'table':
             layer = self.lines_work_table
 
-        for feat in layer.getFeatures():
-            line_id_list.append(feat['IdLinia'])
-
-        return line_id_list
+        return {feat['IdLinia'] for feat in layer.getFeatures()}
 
     # #######################
     # Export data
     def export_municipal_map_data(self):
         """ Export the new Municipal Map of Catalonia to the output directory """
         self.create_output_directory()
+        if self.master:
+            self.master.export_release(self.output_directory, self.current_date)
+            return
         # Set output layer or table names
         output_points_layer = f'mapa-municipal-v1r0-catalunya-fita-{self.current_date}.shp'
         output_lines_layer = f'mapa-municipal-v1r0-catalunya-liniaterme-{self.current_date}.shp'
@@ -290,12 +393,89 @@ class AgregadorMMC:
         registry.removeAllMapLayers()
 
 
-def import_agregador_data(directory_path):
+def read_input_directory(directory_path):
+    """
+    Read the input layers of a municipal map directory into plain records, so that the directories can be read
+    concurrently and added later. It's run in a worker thread, so the layers are opened and closed in it and only
+    the records leave it
+
+    :param directory_path: Directory where the input layers are located
+    :type directory_path: str
+
+    :return: input_records: Dictionary with the entity name as key and a tuple with its fields' name and type and its
+                            records as value. If the directory doesn't have an entity, it has no fields and no records.
+    :rtype: dict
+    """
+    input_records = {entity: ((), []) for entity, pattern, extension in INPUT_ENTITIES}
+    files = [f for f in os.listdir(directory_path) if os.path.isfile(os.path.join(directory_path, f))]
+    for file in files:
+        for entity, pattern, extension in INPUT_ENTITIES:
+            if pattern in file and file.endswith(extension):
+                input_records[entity] = read_input_records(os.path.join(directory_path, file))
+                break
+
+    return input_records
+
+
+def read_input_records(path):
+    """
+    Read the features of an input layer into plain records, with the attributes and the geometry as WKB
+
+    :param path: Path to the input layer
+    :type path: str
+
+    :return: Tuple with the name and type of the layer's fields and a list with the attributes and the WKB geometry,
+             or None, of every feature
+    :rtype: tuple
+    """
+    layer = QgsVectorLayer(path)
+    fields = tuple((field.name(), field.type()) for field in layer.fields())
+    records = [(feature.attributes(), bytes(feature.geometry().asWkb()) if feature.hasGeometry() else None)
+               for feature in layer.getFeatures()]
+    del layer
+
+    return fields, records
+
+
+def get_input_data(input_records):
+    """
+    Build the fields and the features of every input entity from its records. It's run in the main thread
+
+    :param input_records: Dictionary with the entity name as key and a tuple with its fields' name and type and its
+                          records as value
+    :type input_records: dict
+
+    :return: input_data: Dictionary with the entity name as key and a tuple with its fields and features as value
+    :rtype: dict
+    """
+    input_data = {}
+    for entity, (fields_records, records) in input_records.items():
+        fields = QgsFields()
+        for field_name, field_type in fields_records:
+            fields.append(QgsField(field_name, field_type))
+        features = []
+        for attributes, wkb in records:
+            feature = QgsFeature(fields)
+            feature.setAttributes(attributes)
+            if wkb is not None:
+                geometry = QgsGeometry()
+                geometry.fromWkb(wkb)
+                feature.setGeometry(geometry)
+            features.append(feature)
+        input_data[entity] = (fields, features)
+
+    return input_data
+
+
+def import_agregador_data(directory_path, master=False):
     """
     Import the necessary data from the input directory to the working directory
 
     :param directory_path: Directory where the input layers are located
     :type directory_path: str
+
+    :param master: Indicates whether to import the data into the master GeoPackage instead of the temporal work layers
+    :type master: bool
     """
     crs = QgsCoordinateReferenceSystem("EPSG:25831")
     input_points_layer, input_lines_layer, input_polygons_layer, input_coast_lines_layer = (None,) * 4
@@ -320,6 +500,17 @@ def import_agregador_data(directory_path):
             elif file_.endswith('ltermmc.dbf'):
                 input_line_table = os.path.join(directory_path, file_)
 
+    if master:
+        MasterMMC().import_layers({'points': input_points_layer,
+                                   'lines': input_lines_layer,
+                                   'polygons': input_polygons_layer,
+                                   'coast_lines': input_coast_lines_layer,
+                                   'points_table': QgsVectorLayer(input_point_table),
+                                   'lines_table': QgsVectorLayer(input_line_table),
+                                   'coast_lines_table': QgsVectorLayer(input_coast_line_table),
+                                   'bt5_full_table': QgsVectorLayer(input_full_bt5_table)})
+        return
+
     # Copy dbf
     shutil.copyfile(input_full_bt5_table, os.path.join(AGREGADOR_WORK_DIR, 'bt5m_temp.dbf'))
     shutil.copyfile(input_point_table, os.path.join(AGREGADOR_WORK_DIR, 'fitesmmc_temp.dbf'))
@@ -336,13 +527,25 @@ def import_agregador_data(directory_path):
                                             'utf-8', crs, 'ESRI Shapefile')
 
 
-def check_agregador_input_data():
+def check_agregador_input_data(master=False):
     """
     Check that exists all the necessary data in the workspace
 
+    :param master: Indicates whether to check the master GeoPackage instead of the temporal work layers
+    :type master: bool
+
     :return: Indicates if exists all the necessary data
     :rtype: bool
     """
+    if master:
+        if not MasterMMC().exists():
+            box = QMessageBox()
+            box.setIcon(QMessageBox.Critical)
+            box.setText("No existeix el GeoPackage mestre.\nSi us plau, importa les dades de l'últim MMC.")
+            box.exec_()
+            return False
+        return True
+
     file_list = os.listdir(AGREGADOR_WORK_DIR)
     if not ('bt5m_temp.dbf' in file_list and 'fites_temp.shp' in file_list and 'fitesmmc_temp.dbf' in file_list \
             and 'linies_costa_temp.shp' in file_list and 'linies_temp.shp' in file_list \
@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ UDTPlugin
+
+In this file is where the BatchDocDelim class is defined. The main function
+of this class is to run the Decimetritzador and the ManagePoligonal processes
+over all the DocDelim directories found in a root directory, concurrently in
+worker processes, and to write a consolidated summary of the results. The
+BatchDocDelimTask class runs it as a QGIS background task.
+***************************************************************************/
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import multiprocessing
+from multiprocessing import spawn
+import os
+import sys
+import time
+import traceback
+
+from qgis.core import QgsApplication, QgsTask, QgsMessageLog, Qgis
+
+from .decimetritzador import Decimetritzador
+from .manage_poligonal import ManagePoligonal
+
+# Number of DocDelim directories processed at the same time
+BATCH_WORKERS = max(1, min(4, (os.cpu_count() or 1) - 1))
+# Files that every process needs, relative to the DocDelim directory
+REQUIRED_FILES = {'decimetritzador': (os.path.join('Cartografia', 'Punt.shp'),
+                                      os.path.join('Cartografia', 'Lin_TramPpta.shp')),
+                  'poligonal': (os.path.join('Cartografia', 'Pto_Polig.shp'),
+                                os.path.join('Taules', 'POLIGONA.dbf'))}
+
+# QGIS application of the worker process
+_WORKER_APP = None
+
+
+class BatchDocDelim:
+    """ Batch processing of many DocDelim directories class """
+
+    def __init__(self, root_directory, processes=('decimetritzador', 'poligonal'), workers=BATCH_WORKERS, task=None):
+        """
+        Constructor
+
+        :param root_directory: Path to the directory where the DocDelim directories are searched
+        :type root_directory: str
+
+        :param processes: Processes to run over every DocDelim directory. Could be 'decimetritzador' and 'poligonal'
+        :type processes: tuple
+
+        :param workers: Number of worker processes
+        :type workers: int
+
+        :param task: QGIS task that runs the batch, which gets the progress and can cancel it
+        :type task: QgsTask
+        """
+        self.root_directory = root_directory
+        self.processes = tuple(processes)
+        self.workers = workers
+        self.task = task
+        self.current_date = datetime.now().strftime("%Y%m%d_%H%M")
+        self.report_path = os.path.join(root_directory, f'Resum_DocDelim_{self.current_date}.txt')
+        # List of dictionaries with the result of every DocDelim directory
+        self.results = []
+        self.elapsed_time = 0.0
+
+    def run(self):
+        """
+        Main entry point. Find and validate the DocDelim directories, process the valid ones in worker processes
+        and write the summary
+
+        :return: results: List of dictionaries with the path, the status, the error and the elapsed time of every
+                          DocDelim directory
+        :rtype: list
+        """
+        QgsMessageLog.logMessage('Procés iniciat: processament de DocDelim en lot', level=Qgis.Info)
+        start_time = time.perf_counter()
+        valid_doc_delims = []
+        for doc_delim in self.find_doc_delims():
+            errors = check_doc_delim(doc_delim, self.processes)
+            if errors:
+                self.results.append(get_result(doc_delim, False, '; '.join(errors), 0.0))
+            else:
+                valid_doc_delims.append(doc_delim)
+
+        if valid_doc_delims:
+            self.process_doc_delims(valid_doc_delims)
+        self.results.sort(key=lambda result: result['doc_delim'])
+        self.elapsed_time = time.perf_counter() - start_time
+
+        self.write_summary()
+        QgsMessageLog.logMessage('Procés finalitzat: processament de DocDelim en lot', level=Qgis.Info)
+
+        return self.results
+
+    def find_doc_delims(self):
+        """
+        Find the DocDelim directories, which are the ones that have a Cartografia and a Taules directory
+
+        :return: doc_delims: Sorted list with the path of the DocDelim directories
+        :rtype: list
+        """
+        doc_delims = []
+        for directory, subdirectories, files in os.walk(self.root_directory):
+            if 'Cartografia' in subdirectories and 'Taules' in subdirectories:
+                doc_delims.append(directory)
+                # A DocDelim directory doesn't have other DocDelim directories inside
+                subdirectories.clear()
+
+        return sorted(doc_delims)
+
+    def process_doc_delims(self, doc_delims):
+        """
+        Process the DocDelim directories concurrently in worker processes
+
+        :param doc_delims: List with the path of the DocDelim directories to process
+        :type doc_delims: list
+        """
+        context = multiprocessing.get_context('spawn')
+        # Inside QGIS the executable is the QGIS application, not the Python interpreter. Setting the executable of
+        # the context still changes it for the whole QGIS session, so the previous one is restored at the end
+        previous_executable = spawn.get_executable()
+        context.set_executable(get_python_executable())
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=init_worker,
+                                     initargs=(QgsApplication.prefixPath(),)) as executor:
+                futures = {executor.submit(process_doc_delim, doc_delim, self.processes): doc_delim
+                           for doc_delim in doc_delims}
+                processed_count = 0
+                for future in as_completed(futures):
+                    if future.cancelled():
+                        self.results.append(get_result(futures[future], False, 'Processament cancel·lat', 0.0))
+                        continue
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # The worker process has died, so there is no result from it
+                        result = get_result(futures[future], False,
+                                            f'El procés ha finalitzat inesperadament -- {e}', 0.0)
+                    self.results.append(result)
+                    if not result['ok']:
+                        QgsMessageLog.logMessage(f"Error processant {result['doc_delim']}", level=Qgis.Warning)
+                    processed_count += 1
+                    if self.task is not None:
+                        self.task.setProgress(100 * processed_count / len(doc_delims))
+                        if self.task.isCanceled():
+                            # The DocDelim directories being processed are finished, and the rest are not started
+                            for pending_future in futures:
+                                pending_future.cancel()
+        finally:
+            context.set_executable(previous_executable)
+
+    def write_summary(self):
+        """ Write the consolidated summary of the processed DocDelim directories """
+        successes = [result for result in self.results if result['ok']]
+        failures = [result for result in self.results if not result['ok']]
+        with open(self.report_path, 'w') as f:
+            f.write('#########################\n')
+            f.write('Resum del processament de DocDelim en lot\n')
+            f.write(f'Directori - {self.root_directory}\n')
+            f.write(f'Processos - {", ".join(self.processes)}\n')
+            f.write(f'Data - {self.current_date}\n')
+            f.write('#########################\n\n')
+            f.write(f'DocDelim processats correctament: {len(successes)}\n')
+            for result in successes:
+                f.write(f"{result['doc_delim']} -- {result['elapsed_time']:.1f} s\n")
+            f.write(f'\nDocDelim amb errors: {len(failures)}\n')
+            for result in failures:
+                f.write(f"{result['doc_delim']} -- {result['elapsed_time']:.1f} s\n")
+                error = result['error'].strip().replace('\n', '\n    ')
+                f.write(f"    {error}\n")
+            f.write(f'\nTemps total: {self.elapsed_time:.1f} s\n')
+            f.write('#########################')
+
+        QgsMessageLog.logMessage(f'DocDelim processats correctament: {len(successes)}, amb errors: {len(failures)}',
+                                 level=Qgis.Info)
+
+
+class BatchDocDelimTask(QgsTask):
+    """ QGIS background task that runs the batch processing of many DocDelim directories """
+
+    def __init__(self, root_directory, processes=('decimetritzador', 'poligonal')):
+        """
+        Constructor
+
+        :param root_directory: Path to the directory where the DocDelim directories are searched
+        :type root_directory: str
+
+        :param processes: Processes to run over every DocDelim directory. Could be 'decimetritzador' and 'poligonal'
+        :type processes: tuple
+        """
+        super().__init__('Processament de DocDelim en lot', QgsTask.CanCancel)
+        self.batch_doc_delim = BatchDocDelim(root_directory, processes, task=self)
+        # Error that has stopped the batch, if any
+        self.error = ''
+
+    def run(self):
+        """
+        Run the batch in the background thread of the task
+
+        :return: Indicates if the batch has been run
+        :rtype: bool
+        """
+        try:
+            self.batch_doc_delim.run()
+        except Exception:
+            self.error = traceback.format_exc()
+            return False
+
+        return True
+
+    def finished(self, result):
+        """
+        Log the result of the batch, in the main thread, when the task ends
+
+        :param result: Indicates if the batch has been run
+        :type result: bool
+        """
+        if not result:
+            QgsMessageLog.logMessage(f'Error en el processament de DocDelim en lot -- {self.error}',
+                                     level=Qgis.Critical)
+
+
+def get_python_executable():
+    """
+    Get the Python interpreter that runs the worker processes. Inside QGIS the executable is usually the QGIS
+    application, so the interpreter is searched in the QGIS installation
+
+    :return: Path to the Python interpreter
+    :rtype: str
+    """
+    if os.path.basename(sys.executable).lower().startswith('python'):
+        return sys.executable
+    if sys.platform == 'win32':
+        candidates = (os.path.join(sys.exec_prefix, 'pythonw.exe'), os.path.join(sys.exec_prefix, 'python.exe'))
+    else:
+        version = f'{sys.version_info.major}.{sys.version_info.minor}'
+        candidates = (os.path.join(sys.exec_prefix, 'bin', f'python{version}'),
+                      os.path.join(sys.exec_prefix, 'bin', 'python3'))
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return candidate
+
+    raise RuntimeError(f"No s'ha trobat l'intèrpret de Python per executar els processos a {sys.exec_prefix}")
+
+
+def check_doc_delim(doc_delim, processes):
+    """
+    Check that exist all the necessary input data into a DocDelim directory, without showing any message box
+
+    :param doc_delim: Path to the DocDelim directory
+    :type doc_delim: str
+
+    :param processes: Processes to run over the DocDelim directory
+    :type processes: tuple
+
+    :return: errors: List with the missing input data
+    :rtype: list
+    """
+    errors = []
+    for process in processes:
+        for required_file in REQUIRED_FILES[process]:
+            if not os.path.exists(os.path.join(doc_delim, required_file)):
+                errors.append(f'Falta el fitxer {required_file}')
+
+    return errors
+
+
+def init_worker(prefix_path):
+    """
+    Initialize QGIS in a worker process
+
+    :param prefix_path: Prefix path of the QGIS installation
+    :type prefix_path: str
+    """
+    global _WORKER_APP
+    # The processes create message boxes, so the worker needs a GUI application, although nothing is shown
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    QgsApplication.setPrefixPath(prefix_path, True)
+    _WORKER_APP = QgsApplication([], True)
+    _WORKER_APP.initQgis()
+
+
+def process_doc_delim(doc_delim, processes):
+    """
+    Run the given processes over a DocDelim directory. It's run in a worker process
+
+    :param doc_delim: Path to the DocDelim directory
+    :type doc_delim: str
+
+    :param processes: Processes to run over the DocDelim directory
+    :type processes: tuple
+
+    :return: Dictionary with the path, the status, the error and the elapsed time of the DocDelim directory
+    :rtype: dict
+    """
+    start_time = time.perf_counter()
+    try:
+        if 'decimetritzador' in processes:
+            Decimetritzador(doc_delim).decimetritzar()
+        if 'poligonal' in processes:
+            ManagePoligonal(doc_delim).update_poligonal_table()
+    except Exception:
+        return get_result(doc_delim, False, traceback.format_exc(), time.perf_counter() - start_time)
+
+    return get_result(doc_delim, True, '', time.perf_counter() - start_time)
+
+
+def get_result(doc_delim, ok, error, elapsed_time):
+    """
+    Get the result of a DocDelim directory
+
+    :param doc_delim: Path to the DocDelim directory
+    :type doc_delim: str
+
+    :param ok: Indicates if the DocDelim directory has been processed correctly
+    :type ok: bool
+
+    :param error: Error message, empty if there is not any error
+    :type error: str
+
+    :param elapsed_time: Processing time, in seconds
+    :type elapsed_time: float
+
+    :return: Dictionary with the result of the DocDelim directory
+    :rtype: dict
+    """
+    return {'doc_delim': doc_delim, 'ok': ok, 'error': error, 'elapsed_time': elapsed_time}
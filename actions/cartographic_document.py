@@ -9,12 +9,12 @@ generates or not that layout as a pdf document.
 ***************************************************************************/
 """
 
-import numpy as np
 import re
 import os
 from PIL import Image
 
 from ..config import *
+from .dictionaries import load_dictionary
 
 from qgis.core import (QgsVectorLayer,
                        QgsCoordinateReferenceSystem,
@@ -78,7 +78,7 @@ class CartographicDocument:
         self.log_environment_variables()
         # Common
         self.project = QgsProject.instance()
-        self.arr_lines_data = np.genfromtxt(LAYOUT_LINE_DATA, dtype=None, encoding='utf-8-sig', delimiter=';', names=True)
+        self.dic_lines = load_dictionary(LAYOUT_LINE_DATA, 'utf-8-sig')
         self.layout_manager = self.project.layoutManager()
         # Input dependant
         self.proposta_2_exists = self.check_proposta_2_exists()
@@ -225,7 +225,7 @@ class CartographicDocument:
         :return: muni_2_name: Name of the second municipality
         :rtype: str
         """
-        muni_data = self.arr_lines_data[np.where(self.arr_lines_data['IDLINIA'] == int(self.line_id))][0]
+        muni_data = self.dic_lines.get('IDLINIA', self.line_id)
         muni_1_name = muni_data[1]
         muni_2_name = muni_data[2]
 
@@ -243,7 +243,7 @@ class CartographicDocument:
         :return: muni_2_nomens: Way to name the second municipality
         :stype: str
         """
-        muni_data = self.arr_lines_data[np.where(self.arr_lines_data['IDLINIA'] == int(self.line_id))][0]
+        muni_data = self.dic_lines.get('IDLINIA', self.line_id)
         muni_1_nomens = muni_data[3]
         muni_2_nomens = muni_data[4]
 
@@ -261,7 +261,7 @@ class CartographicDocument:
         :return: muni_2_normalized_name: Normalized name of the second municipality
         rtype: str
         """
-        muni_data = self.arr_lines_data[np.where(self.arr_lines_data['IDLINIA'] == int(self.line_id))][0]
+        muni_data = self.dic_lines.get('IDLINIA', self.line_id)
         muni_1_name = muni_data[1]
         muni_2_name = muni_data[2]
         # Normalize the names
@@ -9,7 +9,9 @@ Map, which occurs when all of its boundary lines become official.
 ***************************************************************************/
 """
 
+from collections import Counter
 from datetime import datetime
+import json
 import os
 
 from qgis.core import (QgsVectorLayer,
@@ -24,29 +26,52 @@ from qgis.core import (QgsVectorLayer,
                        Qgis)
 
 from ..config import *
-from .adt_postgis_connection import PgADTConnection
+from .adt_postgis_connection import PgADTConnection, get_in_clause, quote_value
+
+# Name of the file with the readiness state and the watermarks of the last check
+CHECK_MM_SNAPSHOT_NAME = 'check_mm_snapshot.json'
+# Keys that the snapshot must have to run an incremental check
+CHECK_MM_SNAPSHOT_KEYS = ('mtt_watermark', 'mm_watermark', 'mtt_lines', 'mm_municipalities', 'ready')
+# Date used in the database for the documents that don't have a date yet
+NULL_DATE = '9999-12-31'
 
 
 class CheckMM:
     """ Municipal Map checker class """
 
-    def __init__(self):
-        """ Constructor """
+    def __init__(self, full=False):
+        """
+        Constructor
+
+        :param full: Indicates whether to check all the municipalities, ignoring the snapshot of the last check
+        :type full: bool
+        """
         # Initialize instance attributes
         # Common
         self.current_date = datetime.now().strftime("%Y%m%d")
+        self.full = full
         self.municipality_dict = {}
         # ADT PostGIS connection
         self.pg_adt = PgADTConnection(HOST, DBNAME, USER, PWD, SCHEMA)
         self.pg_adt.connect()
         # Log
         self.report_path = os.path.join(CHECK_MM_LOCAL_DIR, f'Nous_MM_{self.current_date}.txt')
-        # Entities
-        self.area_muni_cat_table = self.pg_adt.get_table('area_muni_cat')
-        self.line_table = self.pg_adt.get_table('linia')
-        self.dic_municipality_table = self.pg_adt.get_table('dic_municipality')
-        self.mapa_muni_table = self.pg_adt.get_table('mapa_muni_icc')
-        self.mtt_table = self.pg_adt.get_table('memoria_treb_top')
+        self.snapshot_path = os.path.join(CHECK_MM_LOCAL_DIR, CHECK_MM_SNAPSHOT_NAME)
+        # Data loaded from the database with a single query per table
+        # Dictionary with the line ID as key and a tuple with the ID of the two municipalities it separates as value
+        self.lines_municipalities = {}
+        # Dictionary with the municipality ID as key and the list of its lines' ID as value
+        self.municipalities_lines = {}
+        self.mm_municipalities = set()
+        self.mtt_lines = set()
+        self.municipalities_name = {}
+        # Newest MTT and MM dates already checked
+        self.mtt_watermark = None
+        self.mm_watermark = None
+        # Municipalities ready to make its MM in the last check, or None if there is no snapshot
+        self.previous_municipality_dict = None
+        # INE ID of the municipalities checked again in an incremental check
+        self.affected_municipalities = set()
 
     def get_new_mm(self):
         """
@@ -54,22 +79,221 @@ class CheckMM:
         be done. Then writes that list in a text file.
         """
         QgsMessageLog.logMessage('Comprovant llistat de nous Mapes municipals...', level=Qgis.Info)
-        for municipality in self.area_muni_cat_table.getFeatures():
-            municipality_ine = municipality['codi_muni']
-            # Check if the municipality has a considered MM
-            municipality_mm_exists = self.check_municipality_mm(municipality_ine)
-            if not municipality_mm_exists:
-                municipality_id = municipality['id_area']
-                # Get municipality boundary lines list
-                municipality_line_list = self.get_municipality_lines(municipality_id)
-                municipality_mm_ready = self.check_lines_mtt(municipality_line_list)
-                if municipality_mm_ready:
-                    municipality_name = self.get_municipality_name(municipality_ine)
-                    self.municipality_dict[municipality_ine] = municipality_name
+        snapshot = None if self.full else self.read_snapshot()
+        if snapshot:
+            self.check_affected_municipalities(snapshot)
+        else:
+            self.check_all_municipalities()
 
         self.write_mm_report()
+        self.write_snapshot()
         QgsMessageLog.logMessage('Nous Mapes municipals comprovats', level=Qgis.Info)
 
+    def check_all_municipalities(self):
+        """ Check all the municipalities """
+        self.load_watermarks()
+        self.load_lines()
+        self.load_data()
+        self.load_municipalities_name()
+        for municipality in self.pg_adt.get_features('area_muni_cat', columns=('codi_muni', 'id_area')):
+            self.check_municipality(str(municipality['codi_muni']), municipality['id_area'])
+
+    def check_affected_municipalities(self, snapshot):
+        """
+        Check only the municipalities affected by the changes since the last check, and keep the readiness of the
+        rest of municipalities from the snapshot. Only the records dated since the last check and the vigent flags
+        of the records of the last check are fetched, so the MTT or MM that become vigent with an older date are
+        only found by a check of all the municipalities
+
+        :param snapshot: Readiness state, watermarks and vigent records of the last check
+        :type snapshot: dict
+        """
+        self.previous_municipality_dict = snapshot['ready']
+        # The records dated the same day as the watermark are fetched again, as they could have been added after
+        # the last check
+        new_mtt_features = self.get_new_features('memoria_treb_top', 'data_doc', snapshot['mtt_watermark'],
+                                                 ('id_linia', 'vig_mtt'))
+        new_mm_features = self.get_new_features('mapa_muni_icc', 'data_con_cdt', snapshot['mm_watermark'],
+                                                ('codi_muni',))
+        self.mtt_watermark = get_newest_date(new_mtt_features, 'data_doc', snapshot['mtt_watermark'])
+        self.mm_watermark = get_newest_date(new_mm_features, 'data_con_cdt', snapshot['mm_watermark'])
+
+        # Lines and municipalities of the last check that don't have a considered MTT or MM anymore
+        lost_lines = {int(line_id) for line_id in self.get_lost_keys('memoria_treb_top', 'id_linia', 'vig_mtt',
+                                                                      snapshot['mtt_lines'], '= 0')}
+        lost_municipalities = self.get_lost_keys('mapa_muni_icc', 'codi_muni', 'vig_mm',
+                                                 snapshot['mm_municipalities'], '!= 1')
+        new_municipalities = {str(mapa_muni['codi_muni']) for mapa_muni in new_mm_features}
+        self.mtt_lines = (set(snapshot['mtt_lines']) - lost_lines) | {int(mtt['id_linia'])
+                                                                      for mtt in new_mtt_features if mtt['vig_mtt']}
+        self.mm_municipalities = ((set(snapshot['mm_municipalities']) - lost_municipalities - new_municipalities) |
+                                  self.get_mm_municipalities(new_municipalities))
+        changed_lines = lost_lines | {int(mtt['id_linia']) for mtt in new_mtt_features}
+        changed_municipalities = lost_municipalities | new_municipalities
+
+        affected_areas = set()
+        for line in self.pg_adt.get_features('linia', get_in_clause('id_linia', sorted(changed_lines)),
+                                             ('id_area_1', 'id_area_2')):
+            affected_areas.update(int(line[field]) for field in ('id_area_1', 'id_area_2') if line[field])
+        # Dictionary with the ID of the affected municipalities as key and its INE ID as value
+        municipalities_ine = {int(municipality['id_area']): str(municipality['codi_muni'])
+                              for municipality in self.pg_adt.get_features(
+                                  'area_muni_cat',
+                                  f"{get_in_clause('id_area', sorted(affected_areas))} or "
+                                  f"{get_in_clause('codi_muni', sorted(changed_municipalities))}",
+                                  ('codi_muni', 'id_area'))}
+        self.affected_municipalities = set(municipalities_ine.values())
+
+        self.municipality_dict = {municipality_ine: municipality_name
+                                  for municipality_ine, municipality_name in self.previous_municipality_dict.items()
+                                  if municipality_ine not in self.affected_municipalities}
+        if not self.affected_municipalities:
+            return
+
+        self.load_lines(set(municipalities_ine))
+        self.load_municipalities_name(self.affected_municipalities)
+        for municipality_id, municipality_ine in municipalities_ine.items():
+            self.check_municipality(municipality_ine, municipality_id)
+
+    def check_municipality(self, municipality_ine, municipality_id):
+        """
+        Check if the municipality is ready to make its MM, and add it to the ready municipalities if it is
+
+        :param municipality_ine: INE ID of the municipality
+        :type municipality_ine: str
+
+        :param municipality_id: ID of the municipality
+        :type municipality_id: int
+        """
+        # Check if the municipality has a considered MM
+        municipality_mm_exists = self.check_municipality_mm(municipality_ine)
+        if not municipality_mm_exists:
+            # Get municipality boundary lines list
+            municipality_line_list = self.get_municipality_lines(municipality_id)
+            municipality_mm_ready = self.check_lines_mtt(municipality_line_list)
+            if municipality_mm_ready:
+                municipality_name = self.get_municipality_name(municipality_ine)
+                self.municipality_dict[municipality_ine] = municipality_name
+
+    def load_lines(self, municipalities_id=None):
+        """
+        Load from the database the pair of municipalities that every boundary line separates, with a single query
+
+        :param municipalities_id: ID of the municipalities whose lines are loaded. If not given, all the lines are
+                                  loaded
+        :type municipalities_id: set
+        """
+        where = ''
+        if municipalities_id is not None:
+            where = f"{get_in_clause('id_area_1', sorted(municipalities_id))} or " \
+                    f"{get_in_clause('id_area_2', sorted(municipalities_id))}"
+        for line in self.pg_adt.get_features('linia', where, ('id_linia', 'id_area_1', 'id_area_2')):
+            line_id = int(line['id_linia'])
+            municipalities_id = tuple(int(line[field]) for field in ('id_area_1', 'id_area_2') if line[field])
+            self.lines_municipalities[line_id] = municipalities_id
+            for municipality_id in municipalities_id:
+                self.municipalities_lines.setdefault(municipality_id, []).append(line_id)
+
+    def load_data(self):
+        """
+        Load from the database the municipalities that have a considered MM and the lines that have a considered
+        MTT, with a single query each one
+        """
+        self.mm_municipalities = self.get_mm_municipalities()
+        self.mtt_lines = {int(mtt['id_linia'])
+                          for mtt in self.pg_adt.get_features('memoria_treb_top', '"vig_mtt" is True',
+                                                              ('id_linia',))}
+
+    def get_mm_municipalities(self, municipalities_ine=None):
+        """
+        Get the municipalities that have a considered MM, which are the ones with exactly one vigent MM
+
+        :param municipalities_ine: INE ID of the municipalities to check. If not given, all of them are checked
+        :type municipalities_ine: set
+
+        :return: INE ID of the municipalities that have a considered MM
+        :rtype: set
+        """
+        where = get_in_clause('codi_muni', sorted(municipalities_ine)) if municipalities_ine is not None else ''
+        mm_count = Counter(str(mapa_muni['codi_muni'])
+                           for mapa_muni in self.pg_adt.get_features('mapa_muni_icc',
+                                                                     join_where('"vig_mm" is True', where),
+                                                                     ('codi_muni',)))
+
+        return {municipality_ine for municipality_ine, count in mm_count.items() if count == 1}
+
+    def get_lost_keys(self, table_name, key_field, vigent_field, keys, condition):
+        """
+        Get the keys of the last check whose number of vigent records meets the given condition. The count is
+        done by the database, so only the keys that have changed are returned
+
+        :param table_name: Name of the table
+        :type table_name: str
+
+        :param key_field: Name of the key field
+        :type key_field: str
+
+        :param vigent_field: Name of the vigent flag field
+        :type vigent_field: str
+
+        :param keys: Keys of the last check
+        :type keys: list
+
+        :param condition: SQL condition that the number of vigent records must meet, like '= 0'
+        :type condition: str
+
+        :return: Keys that meet the condition
+        :rtype: set
+        """
+        if not keys:
+            return set()
+        query = get_lost_keys_query(f'{self.pg_adt.schema}.{table_name}', key_field, vigent_field, keys, condition)
+        layer = self.pg_adt.get_query_layer(query, key_field, None)
+
+        return {str(feature[key_field]) for feature in layer.getFeatures()}
+
+    def load_municipalities_name(self, municipalities_ine=None):
+        """
+        Load from the database the name of the municipalities, with a single query
+
+        :param municipalities_ine: INE ID of the municipalities to load. If not given, all of them are loaded
+        :type municipalities_ine: set
+        """
+        where = get_in_clause('codi_muni', sorted(municipalities_ine)) if municipalities_ine is not None else ''
+        self.municipalities_name = {str(municipality['codi_muni']): municipality['nom_muni']
+                                    for municipality in self.pg_adt.get_features('dic_municipality', where,
+                                                                                 ('codi_muni', 'nom_muni'))}
+
+    def load_watermarks(self):
+        """ Load from the database the newest MTT and MM dates, with a max() query each one """
+        self.mtt_watermark = self.pg_adt.get_max_value('memoria_treb_top', 'data_doc',
+                                                       get_watermark_clause('data_doc', None))
+        self.mm_watermark = self.pg_adt.get_max_value('mapa_muni_icc', 'data_con_cdt',
+                                                      get_watermark_clause('data_con_cdt', None))
+
+    def get_new_features(self, table_name, date_field, watermark, columns=()):
+        """
+        Get the features of a table with a date equal to or newer than the given watermark
+
+        :param table_name: Name of the table
+        :type table_name: str
+
+        :param date_field: Name of the date field
+        :type date_field: str
+
+        :param watermark: Newest date already checked, with the format YYYY-MM-DD. If None, all the features with
+                          a date are returned
+        :type watermark: str
+
+        :param columns: Name of the columns to fetch, besides the date field
+        :type columns: tuple
+
+        :return: List with the new features
+        :rtype: list
+        """
+        return self.pg_adt.get_features(table_name, get_watermark_clause(date_field, watermark),
+                                        (*columns, date_field))
+
     def check_municipality_mm(self, municipality_ine):
         """ Check if the municipality already exists in the database
 
@@ -79,13 +303,7 @@ class CheckMM:
         :return: Indicates if the municipality is in the database or not
         :rtype: bool
         """
-        self.mapa_muni_table.selectByExpression(f'"codi_muni"=\'{municipality_ine}\' and "vig_mm" is True', QgsVectorLayer.SetSelection)
-        count = self.mapa_muni_table.selectedFeatureCount()
-        self.mapa_muni_table.removeSelection()
-        if count == 1:
-            return True
-        else:
-            return False
+        return municipality_ine in self.mm_municipalities
 
     def get_municipality_lines(self, municipality_id):
         """
@@ -97,14 +315,8 @@ class CheckMM:
         :return: municipality_line_list: List with the ID of the boundary lines that make the municipality
         :rtype: tuple
         """
-        self.line_table.selectByExpression(f'"id_area_1"={municipality_id} or "id_area_2"={municipality_id}',
-                                                QgsVectorLayer.SetSelection)
-        municipality_line_list = []
-        for line in self.line_table.getSelectedFeatures():
-            line_id = line['id_linia']
-            municipality_line_list.append(int(line_id))
+        municipality_line_list = list(self.municipalities_lines.get(int(municipality_id), ()))
 
-        self.line_table.removeSelection()
         return municipality_line_list
 
     def check_lines_mtt(self, municipality_lines_list):
@@ -117,15 +329,7 @@ class CheckMM:
         :return: municipality_mm: Indicates if the map can be done for that municipality
         :rtype: bool
         """
-        municipality_mm = True
-        for line_id in municipality_lines_list:
-            self.mtt_table.selectByExpression(f'"id_linia"={line_id} and "vig_mtt" is True', QgsVectorLayer.SetSelection)
-            count = self.mtt_table.selectedFeatureCount()
-            self.mtt_table.removeSelection()
-            if count == 0:
-                municipality_mm = False
-
-        return municipality_mm
+        return set(municipality_lines_list) <= self.mtt_lines
 
     def get_municipality_name(self, municipality_ine):
         """
@@ -137,13 +341,7 @@ class CheckMM:
         :return: municipality name: Name of the municipality
         :rtype: str
         """
-        self.dic_municipality_table.selectByExpression(f'"codi_muni"=\'{municipality_ine}\'',
-                                                    QgsVectorLayer.SetSelection)
-        municipality_name = ''
-        for municipality in self.dic_municipality_table.getSelectedFeatures():
-            municipality_name = municipality['nom_muni']
-
-        return municipality_name
+        return self.municipalities_name.get(municipality_ine, '')
 
     def write_mm_report(self):
         """  """
@@ -160,3 +358,144 @@ class CheckMM:
 
             f.write(f'\nHi ha un total de {str(mm_count)} MM nous per generar\n')
             f.write('#########################')
+
+            if self.previous_municipality_dict is not None:
+                self.write_changes(f)
+
+    def write_changes(self, f):
+        """
+        Write the changes in the list of ready municipalities since the last check
+
+        :param f: Report file
+        :type f: file
+        """
+        new_ready = sorted(set(self.municipality_dict) - set(self.previous_municipality_dict))
+        not_ready = sorted(set(self.previous_municipality_dict) - set(self.municipality_dict))
+        f.write('\n\n#########################\n')
+        f.write("Canvis des de l'última comprovació\n")
+        f.write(f'Municipis comprovats de nou: {len(self.affected_municipalities)}\n')
+        f.write('#########################\n\n')
+        f.write('Municipis nous preparats per generar el seu Mapa Municipal:\n')
+        for muni_ine in new_ready:
+            f.write(f'{muni_ine} -- {self.municipality_dict[muni_ine]}\n')
+        f.write('\nMunicipis que ja no estan preparats per generar el seu Mapa Municipal:\n')
+        for muni_ine in not_ready:
+            f.write(f'{muni_ine} -- {self.previous_municipality_dict[muni_ine]}\n')
+        f.write('#########################')
+
+    def read_snapshot(self):
+        """
+        Read the readiness state, the watermarks and the vigent records of the last check
+
+        :return: Readiness state, watermarks and vigent records of the last check, or None if there is no valid
+                 snapshot
+        :rtype: dict
+        """
+        if not os.path.exists(self.snapshot_path):
+            return None
+        try:
+            with open(self.snapshot_path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            snapshot = None
+        # The snapshots written by older versions don't have the vigent records, so they can't be used
+        if not isinstance(snapshot, dict) or not all(key in snapshot for key in CHECK_MM_SNAPSHOT_KEYS):
+            QgsMessageLog.logMessage("No s'ha pogut llegir l'estat de l'última comprovació. Es comproven tots els "
+                                     "municipis", level=Qgis.Warning)
+            return None
+
+        return snapshot
+
+    def write_snapshot(self):
+        """ Write the readiness state, the watermarks and the vigent records of this check """
+        snapshot = {'date': self.current_date,
+                    'mtt_watermark': self.mtt_watermark,
+                    'mm_watermark': self.mm_watermark,
+                    'mtt_lines': sorted(self.mtt_lines),
+                    'mm_municipalities': sorted(self.mm_municipalities),
+                    'ready': self.municipality_dict}
+        temp_snapshot_path = f'{self.snapshot_path}.tmp'
+        with open(temp_snapshot_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=2)
+        os.replace(temp_snapshot_path, self.snapshot_path)
+
+
+def get_watermark_clause(date_field, watermark):
+    """
+    Get the SQL WHERE clause that filters the records with a date equal to or newer than the given watermark. The
+    records dated the same day as the watermark are included, so that the ones added after the last check that day
+    are not missed
+
+    :param date_field: Name of the date field
+    :type date_field: str
+
+    :param watermark: Newest date already checked, with the format YYYY-MM-DD. If None, all the records with a
+                      date are included
+    :type watermark: str
+
+    :return: SQL WHERE clause
+    :rtype: str
+    """
+    return join_where(f'"{date_field}" != {quote_value(NULL_DATE)}',
+                      f'"{date_field}" >= {quote_value(watermark)}' if watermark else '')
+
+
+def get_lost_keys_query(table_name, key_field, vigent_field, keys, condition):
+    """
+    Get the SQL query that returns the given keys whose number of vigent records meets the condition
+
+    :param table_name: Name of the table, qualified with the schema
+    :type table_name: str
+
+    :param key_field: Name of the key field
+    :type key_field: str
+
+    :param vigent_field: Name of the vigent flag field
+    :type vigent_field: str
+
+    :param keys: Keys to check
+    :type keys: list
+
+    :param condition: SQL condition that the number of vigent records must meet, like '= 0'
+    :type condition: str
+
+    :return: SQL SELECT query
+    :rtype: str
+    """
+    keys_array = ', '.join(quote_value(key) for key in keys)
+    return f'SELECT k.key AS "{key_field}" FROM unnest(ARRAY[{keys_array}]::text[]) AS k(key) ' \
+           f'WHERE (SELECT count(*) FROM {table_name} t WHERE t."{key_field}"::text = k.key ' \
+           f'AND t."{vigent_field}" IS TRUE) {condition}'
+
+
+def get_newest_date(features, date_field, watermark=None):
+    """
+    Get the newest date of a list of features
+
+    :param features: List of features
+    :type features: list
+
+    :param date_field: Name of the date field
+    :type date_field: str
+
+    :param watermark: Newest date already known, with the format YYYY-MM-DD
+    :type watermark: str
+
+    :return: Newest date, with the format YYYY-MM-DD
+    :rtype: str
+    """
+    dates = [feature[date_field].toString('yyyy-MM-dd') for feature in features if feature[date_field]]
+    if watermark:
+        dates.append(watermark)
+
+    return max(dates) if dates else None
+
+
+def join_where(*clauses):
+    """
+    Join SQL WHERE clauses with AND, ignoring the empty ones
+
+    :return: SQL WHERE clause
+    :rtype: str
+    """
+    return ' and '.join(f'({clause})' for clause in clauses if clause)
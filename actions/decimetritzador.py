@@ -10,10 +10,10 @@ decimals in order to round them to 1.
 """
 
 import os
+import numpy as np
 
 from ..utils import *
 
-from qgis.core.additions.edit import edit
 from qgis.core import (QgsVectorLayer,
                        QgsDataSourceUri,
                        QgsProviderRegistry,
@@ -24,6 +24,17 @@ from qgis.core import (QgsVectorLayer,
                        Qgis)
 from PyQt5.QtWidgets import QMessageBox
 
+# Maximum difference between a coordinate and its rounded value to consider it already rounded
+DECIMAL_TOLERANCE = 0.0001
+# Maximum distance between two vertices to consider them coincident and snap them to the same decimetre vertex
+SNAP_TOLERANCE = 0.05
+# Maximum difference between a coordinate and its rounded value
+ROUNDING_BOUND = 0.05
+# Factor to make a single integer key from the X and Y cells of a vertex
+CELL_KEY_FACTOR = 2 ** 32
+# Name of the Decimetritzador's report, written in the DocDelim directory
+REPORT_NAME = 'Decimetritzacio.txt'
+
 
 class Decimetritzador:
 
@@ -32,6 +43,11 @@ class Decimetritzador:
         # Layers and paths
         self.doc_delim = doc_delim_directory
         self.point_layer, self.line_layer = None, None
+        self.report_path = os.path.join(self.doc_delim, REPORT_NAME)
+        # Hash grid of the decimetre vertices where the points and the trams' endpoints are snapped
+        self.snap_grid = None
+        # Dictionary with the layer name as key and the displacement statistics of its vertices as value
+        self.displacement_stats = {}
         # Message box
         self.box_error = QMessageBox()
         self.box_error.setIcon(QMessageBox.Critical)
@@ -39,8 +55,10 @@ class Decimetritzador:
     def decimetritzar(self):
         """ Main entry point of the Decimetritzador's class where  """
         self.set_layers()
+        self.snap_grid = SnapGrid()
         self.decimetritzar_points()
         self.decimetritzar_lines()
+        self.write_report()
 
     def set_layers(self):
         """ Set the input layers as PyQGIS Vector layers """
@@ -55,104 +73,80 @@ class Decimetritzador:
     def decimetritzar_points(self):
         """ Edit the points' geometry in order to round the coordinates decimals """
         QgsMessageLog.logMessage('Decimetritzant capa de punts...', level=Qgis.Info)
-        with edit(self.point_layer):
-            for point in self.point_layer.getFeatures():
-                geom = point.geometry()
-                coord_x = geom.get().x()
-                coord_y = geom.get().y()
-                z = geom.get().z()
-                # Round coordinates
-                x, y = round_coordinates(coord_x, coord_y)
-                if z != 0.0:
-                    z = round(z, 1)
-                # Create new geometry
-                rounded_point = QgsPoint(x, y, z)
-                rounded_geom = QgsGeometry(rounded_point)
-                # Set new geometry
-                self.point_layer.changeGeometry(point.id(), rounded_geom)
+        fids, coordinates = [], []
+        for point in self.point_layer.getFeatures():
+            vertex = point.geometry().constGet()
+            fids.append(point.id())
+            coordinates.append((vertex.x(), vertex.y(), vertex.z()))
+        if not fids:
+            return
+        coordinates = np.array(coordinates, dtype=float)
+        rounded_coordinates = np.round(coordinates, 1)
+        # The points are the anchors of the snap grid, so they are only rounded, and the trams' endpoints snap to them
+        rounded_coordinates[:, :2] = self.snap_grid.snap(coordinates[:, :2], anchors=True)
+        # Only the points with any coordinate not rounded yet are changed, with the same tolerance as the trams'
+        # endpoints. The Z coordinate is NaN in 2D points, and the NaN comparison is always False
+        changed = np.any(np.abs(rounded_coordinates - coordinates) > DECIMAL_TOLERANCE, axis=1)
+        # The displacement is only computed for the points whose X or Y coordinates change
+        changed_xy = np.any(np.abs(rounded_coordinates[:, :2] - coordinates[:, :2]) > DECIMAL_TOLERANCE, axis=1)
+        self.displacement_stats['Punt'] = get_displacement_stats(coordinates[:, :2], rounded_coordinates[:, :2],
+                                                                 changed_xy)
+
+        geometry_map = {fids[i]: QgsGeometry(QgsPoint(*rounded_coordinates[i])) for i in np.flatnonzero(changed)}
+        self.point_layer.dataProvider().changeGeometryValues(geometry_map)
+        self.point_layer.reload()
         QgsMessageLog.logMessage('Capa de punts decimetritzada', level=Qgis.Info)
 
     def decimetritzar_lines(self):
         """ Edit the lines' geometry in order to round the endpoint's coordinates decimals """
         QgsMessageLog.logMessage('Decimetritzant capa de trams de línia...', level=Qgis.Info)
-        with edit(self.line_layer):
-            for line in self.line_layer.getFeatures():
-                tram = line.geometry().asMultiPolyline()
-                verts = tram[0]
-                # Comprovar si el primer i últim vertex del tram ja estan decimetritzats i per tant no s'han
-                # de decimetritzar
-                first_vert_decim, last_vert_decim = self.check_tram_decimals(verts)
-                if first_vert_decim and last_vert_decim:
-                    continue
-                first_vertex = verts[0]
-                last_vertex = verts[-1]
-                if len(verts) > 2:
-                    if first_vert_decim and not last_vert_decim:
-                        tram_vertex = verts[:-1]
-                    elif not first_vert_decim and last_vert_decim:
-                        tram_vertex = verts[1:]
-                    else:
-                        tram_vertex = verts[1:-1]
-                # Round first and last vertex
-                # First
-                if not first_vert_decim:
-                    first_coord_x = first_vertex.x()
-                    first_coord_y = first_vertex.y()
-                    first_x, first_y = round_coordinates(first_coord_x, first_coord_y)
-                    rounded_first_vert = QgsPointXY(first_x, first_y)
-                # Last
-                if not last_vert_decim:
-                    last_coord_x = last_vertex.x()
-                    last_coord_y = last_vertex.y()
-                    last_x, last_y = round_coordinates(last_coord_x, last_coord_y)
-                    rounded_last_vert = QgsPointXY(last_x, last_y)
-                # Create new geometry
-                if len(verts) > 2:
-                    if not first_vert_decim:
-                        tram_vertex.insert(0, rounded_first_vert)
-                    if not last_vert_decim:
-                        tram_vertex.insert(len(tram_vertex), rounded_last_vert)
-                    rounded_geom = QgsGeometry.fromMultiPolylineXY([tram_vertex])
-                else:
-                    pairs_vertex = [rounded_first_vert, rounded_last_vert]
-                    rounded_geom = QgsGeometry.fromMultiPolylineXY([pairs_vertex])
-
-                # Set new geometry
-                self.line_layer.changeGeometry(line.id(), rounded_geom)
-        QgsMessageLog.logMessage('Capa de trams de línia decimetritzada', level=Qgis.Info)
+        fids, trams = [], []
+        for line in self.line_layer.getFeatures():
+            fids.append(line.id())
+            trams.append(line.geometry().asMultiPolyline()[0])
+        if not fids:
+            return
+        # Array with the first and last vertex of every tram, with shape (trams, 2 endpoints, 2 coordinates)
+        endpoints = np.array([((verts[0].x(), verts[0].y()), (verts[-1].x(), verts[-1].y())) for verts in trams],
+                             dtype=float)
+        # Snap the endpoints to the decimetre vertex of the coincident points and endpoints
+        rounded_endpoints = self.snap_grid.snap(endpoints.reshape(-1, 2),
+                                                tram_endpoints=True).reshape(endpoints.shape)
+        # An endpoint must be rounded when any of its coordinates is not rounded yet
+        not_rounded = np.any(np.abs(endpoints - rounded_endpoints) > DECIMAL_TOLERANCE, axis=2)
+        self.displacement_stats[self.line_layer.name()] = get_displacement_stats(endpoints.reshape(-1, 2),
+                                                                                 rounded_endpoints.reshape(-1, 2),
+                                                                                 not_rounded.reshape(-1))
 
-    @staticmethod
-    def check_tram_decimals(verts):
-        """
-        Check if a line's endpoints have them coordinates decimals already rounded or not
+        geometry_map = {}
+        for i in np.flatnonzero(np.any(not_rounded, axis=1)):
+            verts = list(trams[i])
+            # Round first and last vertex
+            if not_rounded[i, 0]:
+                verts[0] = QgsPointXY(*rounded_endpoints[i, 0])
+            if not_rounded[i, 1]:
+                verts[-1] = QgsPointXY(*rounded_endpoints[i, 1])
+            geometry_map[fids[i]] = QgsGeometry.fromMultiPolylineXY([verts])
 
-        :param verts: List with the first and last vertex of the line
-        :type verts: tuple
+        self.line_layer.dataProvider().changeGeometryValues(geometry_map)
+        self.line_layer.reload()
+        QgsMessageLog.logMessage('Capa de trams de línia decimetritzada', level=Qgis.Info)
 
-        :return: Indicates if the point's coordinates decimals are rounded or not
-        :rtype: bool
-        """
-        first_vertex = verts[0]
-        last_vertex = verts[-1]
-        # Check first
-        first_coord_x = first_vertex.x()
-        first_coord_y = first_vertex.y()
-        first_dif_x = abs(first_coord_x - round(first_coord_x, 1))
-        first_dif_y = abs(first_coord_y - round(first_coord_y, 1))
-        # Check last
-        last_coord_x = last_vertex.x()
-        last_coord_y = last_vertex.y()
-        last_dif_x = abs(last_coord_x - round(last_coord_x, 1))
-        last_dif_y = abs(last_coord_y - round(last_coord_y, 1))
-        # Check
-        if (first_dif_x > 0.0001 or first_dif_y > 0.0001) and (last_dif_x > 0.0001 or last_dif_y > 0.0001):
-            return False, False
-        elif (first_dif_x > 0.0001 or first_dif_y > 0.0001) and (last_dif_x < 0.01 or last_dif_y < 0.01):
-            return False, True
-        elif (first_dif_x < 0.01 or first_dif_y < 0.01) and (last_dif_x > 0.0001 or last_dif_y > 0.0001):
-            return True, False
-        else:
-            return True, True
+    def write_report(self):
+        """ Write the displacement statistics of the points and the trams' endpoints in the report """
+        with open(self.report_path, 'w') as f:
+            f.write('#########################\n')
+            f.write('Decimetrització del DocDelim\n')
+            f.write(f'{self.doc_delim}\n')
+            f.write('#########################\n\n')
+            for layer_name, (count, max_displacement, mean_displacement) in self.displacement_stats.items():
+                f.write(f'Capa {layer_name}:\n')
+                f.write(f'    Vèrtexs desplaçats: {count}\n')
+                f.write(f'    Desplaçament màxim: {max_displacement:.4f} m\n')
+                f.write(f'    Desplaçament mitjà: {mean_displacement:.4f} m\n')
+                QgsMessageLog.logMessage(f'Capa {layer_name} - Vèrtexs desplaçats: {count}, desplaçament màxim: '
+                                         f'{max_displacement:.4f} m, desplaçament mitjà: {mean_displacement:.4f} m',
+                                         level=Qgis.Info)
 
     def check_input_data(self):
         """
@@ -176,3 +170,170 @@ class Decimetritzador:
             self.box_error.exec_()
             return False
 
+
+class SnapGrid:
+    """
+    Grid of decimetre vertices. Every vertex is snapped to the decimetre vertex of its group of coincident vertices,
+    which are the vertices linked by a chain of vertices closer than the tolerance, so all the coincident vertices end
+    in the same decimetre vertex. The group takes the decimetre vertex of its first anchor, or of its first vertex
+    added to the grid if it doesn't have any anchor. A vertex is never moved farther than the tolerance plus the
+    rounding bound, so a long chain of vertices is not collapsed in a single vertex
+    """
+
+    def __init__(self, tolerance=SNAP_TOLERANCE):
+        """
+        Constructor
+
+        :param tolerance: Maximum distance between two vertices to consider them coincident
+        :type tolerance: float
+        """
+        self.tolerance = tolerance
+        # Original coordinates of the vertices added to the grid, with shape (vertices, 2)
+        self.vertices = np.empty((0, 2), dtype=float)
+        # Decimetre vertex, in decimetres, where every vertex of the grid is snapped
+        self.targets = np.empty((0, 2), dtype=np.int64)
+        # Indicates which vertices of the grid are anchors
+        self.anchors = np.empty(0, dtype=bool)
+
+    def snap(self, coordinates, anchors=False, tram_endpoints=False):
+        """
+        Snap the given vertices to the decimetre vertices of the grid, adding them to the grid. The snaps that move a
+        vertex too far are rejected and logged, and the vertex is only rounded
+
+        :param coordinates: Array with the X and Y coordinates of the vertices, with shape (vertices, 2)
+        :type coordinates: numpy.ndarray
+
+        :param anchors: Indicates whether the vertices are anchors, which are only rounded and never snapped to
+                        other vertices
+        :type anchors: bool
+
+        :param tram_endpoints: Indicates whether the vertices are the first and last vertex of every tram, one after
+                               the other, which must not be snapped to the same decimetre vertex
+        :type tram_endpoints: bool
+
+        :return: snapped_coordinates: Array with the snapped coordinates of the vertices
+        :rtype: numpy.ndarray
+        """
+        coordinates = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+        grid_size = len(self.vertices)
+        vertices = np.concatenate((self.vertices, coordinates))
+        is_anchor = np.concatenate((self.anchors, np.full(len(coordinates), anchors)))
+        rounded_cells = np.round(coordinates * 10).astype(np.int64)
+        targets = np.concatenate((self.targets, rounded_cells))
+
+        if not anchors:
+            # The anchors go first, and then the vertices in the order they have been added to the grid
+            priority = np.arange(len(vertices)) + np.where(is_anchor, 0, len(vertices))
+            roots = get_group_roots(priority, *get_coincident_pairs(vertices, self.tolerance))
+            snapped_cells = targets[roots[grid_size:]]
+            rejected = np.hypot(*(snapped_cells / 10 - coordinates).T) > self.tolerance + ROUNDING_BOUND
+            if tram_endpoints:
+                # The endpoints of a tram are only rounded if the snap would collapse the tram in a single vertex
+                collapsed = (np.all(snapped_cells[0::2] == snapped_cells[1::2], axis=1) &
+                             np.any(rounded_cells[0::2] != rounded_cells[1::2], axis=1))
+                rejected[0::2] |= collapsed
+                rejected[1::2] |= collapsed
+            rejected &= np.any(snapped_cells != rounded_cells, axis=1)
+            for x, y in coordinates[rejected]:
+                QgsMessageLog.logMessage(f"El vèrtex {x:.3f}, {y:.3f} no s'ajusta al vèrtex coincident perquè "
+                                         f"es desplaçaria massa o el tram quedaria sense longitud",
+                                         level=Qgis.Warning)
+            targets[grid_size:] = np.where(rejected[:, None], rounded_cells, snapped_cells)
+
+        self.vertices = vertices
+        self.targets = targets
+        self.anchors = is_anchor
+
+        return targets[grid_size:] / 10
+
+
+def get_coincident_pairs(vertices, tolerance):
+    """
+    Get the pairs of vertices closer than the tolerance. The vertices are hashed in cells as big as the tolerance,
+    so only the vertices of the 9 neighbor cells of every vertex are compared, all of them at once
+
+    :param vertices: Array with the X and Y coordinates of the vertices, with shape (vertices, 2)
+    :type vertices: numpy.ndarray
+
+    :param tolerance: Maximum distance between two vertices to consider them coincident
+    :type tolerance: float
+
+    :return: Arrays with the index of the first and the second vertex of every pair
+    :rtype: tuple
+    """
+    cells = np.floor(vertices / tolerance).astype(np.int64)
+    keys = cells[:, 0] * CELL_KEY_FACTOR + cells[:, 1]
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    first, second = [], []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            # The neighbor keys are searched in order, which is much faster than searching them unsorted
+            neighbor_keys = sorted_keys + dx * CELL_KEY_FACTOR + dy
+            start = np.searchsorted(sorted_keys, neighbor_keys, side='left')
+            counts = np.searchsorted(sorted_keys, neighbor_keys, side='right') - start
+            # Every vertex is paired with all the vertices of the neighbor cell
+            positions = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            first.append(np.repeat(order, counts))
+            second.append(order[np.repeat(start, counts) + positions])
+    first, second = np.concatenate(first), np.concatenate(second)
+    coincident = (first < second) & (np.hypot(*(vertices[first] - vertices[second]).T) <= tolerance)
+
+    return first[coincident], second[coincident]
+
+
+def get_group_roots(priority, first, second):
+    """
+    Get the root of the group of coincident vertices of every vertex, which is the vertex of the group with the
+    lowest priority
+
+    :param priority: Array with the unique priority of every vertex
+    :type priority: numpy.ndarray
+
+    :param first: Array with the index of the first vertex of every coincident pair
+    :type first: numpy.ndarray
+
+    :param second: Array with the index of the second vertex of every coincident pair
+    :type second: numpy.ndarray
+
+    :return: Array with the index of the root vertex of every vertex
+    :rtype: numpy.ndarray
+    """
+    order = np.argsort(priority)
+    # Rank of the root of every vertex, propagated through the pairs until no rank changes
+    labels = np.empty(len(priority), dtype=np.int64)
+    labels[order] = np.arange(len(priority))
+    while True:
+        new_labels = labels.copy()
+        pair_labels = np.minimum(labels[first], labels[second])
+        np.minimum.at(new_labels, first, pair_labels)
+        np.minimum.at(new_labels, second, pair_labels)
+        new_labels = new_labels[order[new_labels]]
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+
+    return order[labels]
+
+
+def get_displacement_stats(coordinates, snapped_coordinates, changed):
+    """
+    Get the statistics of the displacement of the changed vertices
+
+    :param coordinates: Array with the original X and Y coordinates of the vertices
+    :type coordinates: numpy.ndarray
+
+    :param snapped_coordinates: Array with the snapped X and Y coordinates of the vertices
+    :type snapped_coordinates: numpy.ndarray
+
+    :param changed: Boolean array that indicates which vertices are changed
+    :type changed: numpy.ndarray
+
+    :return: Number of displaced vertices, maximum displacement and mean displacement
+    :rtype: tuple
+    """
+    displacement = np.hypot(*(snapped_coordinates - coordinates)[changed].T)
+    if not displacement.size:
+        return 0, 0.0, 0.0
+
+    return int(displacement.size), float(displacement.max()), float(displacement.mean())
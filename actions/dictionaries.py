@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ UDTPlugin
+
+In this file is where the shared loader of the dictionary CSV files is
+defined. Every dictionary is parsed only once per session and every lookup
+is answered through an in-memory index instead of scanning the whole array.
+The parsed CSV files are also compiled as binary snapshots, which are loaded
+instead of the CSV while they are up to date.
+***************************************************************************/
+"""
+
+import os
+import numpy as np
+
+from ..config import *
+
+
+# Process-wide cache of the loaded dictionaries, keyed by (path, encoding)
+_DICTIONARIES = {}
+
+
+def load_dictionary(path, encoding=None):
+    """
+    Return the dictionary of the given CSV file, parsing it only if it hasn't been loaded yet during the
+    session or if the file has been modified since it was loaded
+
+    :param path: Path to the dictionary CSV file
+    :type path: str
+
+    :param encoding: Encoding of the CSV file
+    :type encoding: str
+
+    :return: dictionary: Loaded and indexed dictionary
+    :rtype: Dictionary
+    """
+    key = (path, encoding)
+    mtime = os.path.getmtime(path)
+    dictionary = _DICTIONARIES.get(key)
+    if dictionary is None or dictionary.mtime != mtime:
+        dictionary = Dictionary(path, encoding, mtime)
+        _DICTIONARIES[key] = dictionary
+
+    return dictionary
+
+
+def compile_dictionary(path, encoding=None):
+    """
+    Parse a dictionary CSV file and save it as a binary snapshot next to it. The snapshot keeps the typed
+    columns and the fixed width string fields of the parsed array, so it can be memory-mapped when loaded.
+
+    :param path: Path to the dictionary CSV file
+    :type path: str
+
+    :param encoding: Encoding of the CSV file
+    :type encoding: str
+
+    :return: data: Parsed dictionary
+    :rtype: numpy.ndarray
+    """
+    data = np.genfromtxt(path, dtype=None, encoding=encoding, delimiter=';', names=True)
+    snapshot_path = get_snapshot_path(path)
+    temp_snapshot_path = f'{snapshot_path}.tmp'
+    try:
+        with open(temp_snapshot_path, 'wb') as f:
+            np.save(f, data, allow_pickle=False)
+        os.replace(temp_snapshot_path, snapshot_path)
+    except (OSError, ValueError):
+        # The snapshot is only an optimization, so the dictionary must still work if it cannot be written,
+        # for example when the directory is read only or the old snapshot is still mapped
+        if os.path.exists(temp_snapshot_path):
+            os.remove(temp_snapshot_path)
+
+    return data
+
+
+def compile_dictionaries():
+    """ Compile the binary snapshots of all the dictionaries used by the plugin """
+    for path, encoding in ((DIC_LINES, None), (DIC_NOM_MUNICIPIS, None), (LAYOUT_LINE_DATA, 'utf-8-sig'),
+                           (LAYOUT_MUNI_DATA, 'utf-8-sig')):
+        compile_dictionary(path, encoding)
+
+
+def read_dictionary(path, encoding=None):
+    """
+    Read a dictionary from its binary snapshot if it's newer than the CSV file, or parse the CSV file and compile
+    the snapshot otherwise
+
+    :param path: Path to the dictionary CSV file
+    :type path: str
+
+    :param encoding: Encoding of the CSV file
+    :type encoding: str
+
+    :return: data: Dictionary data
+    :rtype: numpy.ndarray
+    """
+    snapshot_path = get_snapshot_path(path)
+    if os.path.exists(snapshot_path) and os.path.getmtime(snapshot_path) >= os.path.getmtime(path):
+        try:
+            return np.load(snapshot_path, mmap_mode='r', allow_pickle=False)
+        except (OSError, ValueError):
+            pass
+
+    return compile_dictionary(path, encoding)
+
+
+def get_snapshot_path(path):
+    """
+    Get the path of the binary snapshot of a dictionary CSV file
+
+    :param path: Path to the dictionary CSV file
+    :type path: str
+
+    :return: Path to the binary snapshot
+    :rtype: str
+    """
+    return f'{os.path.splitext(path)[0]}.npy'
+
+
+def clear_dictionaries():
+    """ Remove all the loaded dictionaries from the cache """
+    _DICTIONARIES.clear()
+
+
+def normalize_key(value):
+    """
+    Normalize a key value in order to compare values coming from the CSV files, the layers or the user's input,
+    which can be integers, quoted strings or zero-padded numeric strings, as the line IDs made by line_id_2_txt
+
+    :param value: Value to normalize
+    :type value: str or int
+
+    :return: Normalized value
+    :rtype: str
+    """
+    key = str(value).strip('"\'')
+    if key.isdigit():
+        # Remove the leading zeros, so '0045' and 45 have the same key
+        return str(int(key))
+
+    return key
+
+
+class Dictionary:
+    """ Dictionary CSV file with keyed access by any of its fields """
+
+    def __init__(self, path, encoding=None, mtime=None):
+        """
+        Constructor
+
+        :param path: Path to the dictionary CSV file
+        :type path: str
+
+        :param encoding: Encoding of the CSV file
+        :type encoding: str
+
+        :param mtime: Modification time of the CSV file when it was read
+        :type mtime: float
+        """
+        self.path = path
+        self.encoding = encoding
+        self.mtime = mtime if mtime is not None else os.path.getmtime(path)
+        self.data = read_dictionary(path, encoding)
+        self.indexes = {}
+
+    def get_index(self, field):
+        """
+        Get the index of the given field, building it the first time it's requested
+
+        :param field: Name of the field to index
+        :type field: str
+
+        :return: index: Dictionary with the normalized field value as key and the list of rows as value
+        :rtype: dict
+        """
+        index = self.indexes.get(field)
+        if index is None:
+            index = {}
+            for row in self.data:
+                index.setdefault(normalize_key(row[field]), []).append(row)
+            self.indexes[field] = index
+
+        return index
+
+    def get(self, field, value):
+        """
+        Get the first row whose field is equal to the given value
+
+        :param field: Name of the field
+        :type field: str
+
+        :param value: Value to look for
+        :type value: str or int
+
+        :return: First matching row, or None if there is not any
+        :rtype: numpy.void
+        """
+        rows = self.get_index(field).get(normalize_key(value))
+        if rows:
+            return rows[0]
+
+    def get_all(self, field, value):
+        """
+        Get all the rows whose field is equal to the given value
+
+        :param field: Name of the field
+        :type field: str
+
+        :param value: Value to look for
+        :type value: str or int
+
+        :return: List with the matching rows
+        :rtype: list
+        """
+        return list(self.get_index(field).get(normalize_key(value), ()))
@@ -10,9 +10,13 @@ map and all of its features from the latest layer of the Municipal Map of Catalo
 """
 
 import os
-import numpy as np
 
 from qgis.core import (QgsVectorLayer,
+                       QgsFeatureRequest,
+                       QgsSpatialIndex,
+                       QgsGeometry,
+                       QgsPointXY,
+                       QgsRectangle,
                        QgsMessageLog,
                        Qgis)
 from qgis.core.additions.edit import edit
@@ -20,7 +24,50 @@ from PyQt5.QtWidgets import QMessageBox
 
 from ..config import *
 from ..utils import *
-from .adt_postgis_connection import PgADTConnection
+from .adt_postgis_connection import PgADTConnection, get_in_clause, quote_value
+from .dictionaries import load_dictionary
+from .line_graph import get_line_graph
+
+# Maximum distance, in meters, between a fita and the boundary lines that it belongs to
+FITA_LINE_TOLERANCE = 0.1
+
+
+class RemovalPlan:
+    """ Features that the Eliminador MMC has to remove or edit, computed before editing any layer """
+
+    def __init__(self, delete_lines, edit_lines, points):
+        """
+        Constructor
+
+        :param delete_lines: List with the line ID of the lines to remove
+        :type delete_lines: list
+
+        :param edit_lines: Dictionary with the line ID of the lines to edit as key and a list with the Valid De,
+                           Data Alta and INE ID of the neighbor municipality as value
+        :type edit_lines: dict
+
+        :param points: List with the ID of the points to remove
+        :type points: list
+        """
+        self.delete_lines = delete_lines
+        self.edit_lines = edit_lines
+        self.points = points
+
+    def describe(self):
+        """
+        Describe the plan, in order to inspect it as a dry run before editing any layer
+
+        :return: Text that describes the plan
+        :rtype: str
+        """
+        lines = [f"Línies a esborrar: {', '.join(self.delete_lines) if self.delete_lines else '-'}"]
+        lines.append('Línies a editar:' if self.edit_lines else 'Línies a editar: -')
+        for line_id, (neighbor_valid_de, neighbor_data_alta, neighbor_ine) in self.edit_lines.items():
+            lines.append(f'    {line_id} -> ValidDe {neighbor_valid_de}, DataAlta {neighbor_data_alta} '
+                         f'(municipi veí {neighbor_ine})')
+        lines.append(f'Fites a esborrar: {len(self.points)}')
+
+        return '\n'.join(lines)
 
 
 class EliminadorMMC:
@@ -28,7 +75,8 @@ class EliminadorMMC:
 
     def __init__(self,
                  municipality_id,
-                 coast=False):
+                 coast=False,
+                 pg_adt=None):
         """
         Constructor
 
@@ -37,24 +85,40 @@ class EliminadorMMC:
 
         :param coast: Indicates if the municipality has coast or not
         :type coast: bool
+
+        :param pg_adt: Connection to the ADT PostGIS database. If not given, a new connection is made
+        :type pg_adt: PgADTConnection
         """
         # Common
-        self.arr_nom_municipalities = np.genfromtxt(DIC_NOM_MUNICIPIS, dtype=None, encoding=None, delimiter=';', names=True)
-        self.arr_lines_data = np.genfromtxt(DIC_LINES, dtype=None, encoding=None, delimiter=';', names=True)
+        self.dic_nom_municipalities = load_dictionary(DIC_NOM_MUNICIPIS)
+        self.dic_lines = load_dictionary(DIC_LINES)
         # ADT PostGIS connection
-        self.pg_adt = PgADTConnection(HOST, DBNAME, USER, PWD, SCHEMA)
-        self.pg_adt.connect()
+        if pg_adt is None:
+            pg_adt = PgADTConnection(HOST, DBNAME, USER, PWD, SCHEMA)
+            pg_adt.connect()
+        self.pg_adt = pg_adt
+        self.line_graph = get_line_graph(self.pg_adt)
         # ###
         # Input dependant that don't need data from the layers
         self.municipality_id = int(municipality_id)
         self.coast = coast
         self.log_environment_variables()
         self.municipality_codi_ine = self.get_municipality_codi_ine(self.municipality_id)
+        # INE IDs of all the municipalities removed in the same run, which are considered as they didn't have MM
+        self.removed_codi_ine = {self.municipality_codi_ine}
         self.municipality_lines = self.get_municipality_lines()   # Get a list with all the lines ID
         if self.coast:
             self.municipality_coast_line = self.get_municipality_coast_line()
         # Input layers
         self.input_points_layer, self.input_lines_layer, self.input_polygons_layer, self.input_coast_lines_layer, self.input_full_bt5_table, self.input_points_table, self.input_line_table, self.input_coast_line_table = (None,) * 8
+        # Removal plan and the data computed to get it, cached in order to compute them only once per run
+        self.removal_plan = None
+        # Dictionary with the CodiMuni of every input polygon as key and its Data Alta, Valid De and feature ID
+        # as value
+        self.polygons_index = {}
+        # Spatial index of the input lines and dictionary with the feature ID of every line as key and its
+        # geometry and line ID as value
+        self.lines_spatial_index, self.lines_index = None, {}
 
     def log_environment_variables(self):
         """ Log as a MessageLog the environment variables of the DCD """
@@ -72,9 +136,9 @@ class EliminadorMMC:
         :return: codi_ine: INE ID of the municipality
         :rtype: str
         """
-        muni_data = self.arr_nom_municipalities[np.where(self.arr_nom_municipalities['id_area'] == f'"{municipality_id}"')]
-        if muni_data:
-            codi_ine = muni_data['codi_ine_muni'][0].strip('"')
+        muni_data = self.dic_nom_municipalities.get('id_area', municipality_id)
+        if muni_data is not None:
+            codi_ine = muni_data['codi_ine_muni'].strip('"')
 
             QgsMessageLog.logMessage(f'Codi INE: {codi_ine}', level=Qgis.Info)
             return codi_ine
@@ -86,12 +150,7 @@ class EliminadorMMC:
         :return lines_muni_list: List with all the boundary lines that make the municipality
         :rtype: tuple
         """
-        lines_muni_1 = self.arr_lines_data[np.where(self.arr_lines_data['CODIMUNI1'] == self.municipality_id)]
-        lines_muni_2 = self.arr_lines_data[np.where(self.arr_lines_data['CODIMUNI2'] == self.municipality_id)]
-        lines_muni_1_list = lines_muni_1['IDLINIA'].tolist()
-        lines_muni_2_list = lines_muni_2['IDLINIA'].tolist()
-
-        lines_muni_list = lines_muni_1_list + lines_muni_2_list
+        lines_muni_list = list(self.line_graph.municipality_lines(self.municipality_id))
 
         QgsMessageLog.logMessage(f"Línies del municipi: {''.join(str(lines_muni_list))}", level=Qgis.Info)
         return lines_muni_list
@@ -109,20 +168,17 @@ class EliminadorMMC:
         :return Indicates if the MM exists into the given layer or not
         :rtype: bool
         """
-        mapa_muni_table, expression = None, None
-        if layer == 'postgis':
-            mapa_muni_table = self.pg_adt.get_table('mapa_muni_icc')
-            expression = f'"codi_muni"=\'{municipality_codi_ine}\' and "vig_mm" is True'
-        elif layer == 'input':
-            mapa_muni_table = self.input_polygons_layer
-            expression = f'"CodiMuni"=\'{municipality_codi_ine}\''
-
-        mapa_muni_table.selectByExpression(expression, QgsVectorLayer.SetSelection)
-        count = mapa_muni_table.selectedFeatureCount()
-        if count == 0:
-            return False
-        else:
-            return True
+        if layer == 'input':
+            # The municipalities to remove are considered as they didn't have MM anymore, as the plan to remove them
+            # is computed before removing their polygons
+            if municipality_codi_ine in self.removed_codi_ine:
+                return False
+            return municipality_codi_ine in self.polygons_index
+
+        mapa_muni_features = self.pg_adt.get_features('mapa_muni_icc',
+                                                      f'"codi_muni"={quote_value(municipality_codi_ine)} and '
+                                                      f'"vig_mm" is True', ('codi_muni',))
+        return len(mapa_muni_features) > 0
 
     def get_municipality_coast_line(self):
         """
@@ -133,8 +189,8 @@ class EliminadorMMC:
         """
         coast_line_id = ''
         for line_id in self.municipality_lines:
-            line_data = self.arr_lines_data[np.where(self.arr_lines_data['IDLINIA'] == line_id)]
-            if line_data['LIMCOSTA'] == 'S':
+            line_data = self.dic_lines.get('IDLINIA', line_id)
+            if line_data is not None and line_data['LIMCOSTA'] == 'S':
                 coast_line_id = line_id
 
         return coast_line_id
@@ -147,6 +203,9 @@ class EliminadorMMC:
         QgsMessageLog.logMessage('Procés iniciat: eliminació de mapes del Mapa Municipal de Catalunya', level=Qgis.Info)
 
         self.set_layers()
+        # Compute what has to be removed before editing any layer
+        removal_plan = self.get_removal_plan()
+        QgsMessageLog.logMessage(f'Pla d\'eliminació:\n{removal_plan.describe()}', level=Qgis.Info)
         QgsMessageLog.logMessage('Esborrant geometries...', level=Qgis.Info)
         self.remove_polygons()
         self.remove_lines_layer()
@@ -163,6 +222,31 @@ class EliminadorMMC:
 
         QgsMessageLog.logMessage('Procés finalitzat: eliminació de mapes del Mapa Municipal de Catalunya', level=Qgis.Info)
 
+    def plan_municipality_removal(self):
+        """
+        Dry run of the removal. Get the plan of the features to remove and edit, without editing any layer.
+
+        :return: Removal plan
+        :rtype: RemovalPlan
+        """
+        self.set_layers()
+        return self.get_removal_plan()
+
+    def get_removal_plan(self):
+        """
+        Get the plan of the features to remove and edit. It's computed only the first time, and then shared by
+        all the removing steps.
+
+        :return: Removal plan
+        :rtype: RemovalPlan
+        """
+        if self.removal_plan is None:
+            delete_lines_list, edit_lines_dict = self.get_lines_to_manage()
+            point_id_remove_list = self.get_points_to_remove(delete_lines_list)
+            self.removal_plan = RemovalPlan(delete_lines_list, edit_lines_dict, point_id_remove_list)
+
+        return self.removal_plan
+
     def set_layers(self):
         """ Set the paths of the working vector layers """
         directory_list = os.listdir(ELIMINADOR_WORK_DIR)
@@ -187,6 +271,47 @@ class EliminadorMMC:
             elif '-fitataula-' in shapefile and shapefile.endswith('.dbf'):
                 self.input_points_table = QgsVectorLayer(os.path.join(directory_path, shapefile))
 
+        self.polygons_index = self.get_polygons_index()
+        self.lines_spatial_index, self.lines_index = self.get_lines_spatial_index()
+
+    def get_lines_spatial_index(self):
+        """
+        Index the input lines spatially, reading the lines layer only once
+
+        :return: lines_spatial_index: Spatial index of the input lines
+        :rtype: QgsSpatialIndex
+
+        :return: lines_index: Dictionary with the feature ID as key and a tuple with the geometry and the line ID
+                              of the line as value
+        :rtype: dict
+        """
+        lines_spatial_index = QgsSpatialIndex()
+        lines_index = {}
+        request = QgsFeatureRequest().setSubsetOfAttributes(['IdLinia'], self.input_lines_layer.fields())
+        for line in self.input_lines_layer.getFeatures(request):
+            if not line.hasGeometry():
+                continue
+            lines_spatial_index.addFeature(line)
+            lines_index[line.id()] = (line.geometry(), line['IdLinia'])
+
+        return lines_spatial_index, lines_index
+
+    def get_polygons_index(self):
+        """
+        Index the input polygons by their CodiMuni, reading the polygons layer only once
+
+        :return: polygons_index: Dictionary with the CodiMuni as key and a tuple with the Data Alta, Valid De and
+                                 feature ID of the polygon as value
+        :rtype: dict
+        """
+        polygons_index = {}
+        request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(['CodiMuni', 'DataAlta', 'ValidDe'], self.input_polygons_layer.fields())
+        for polygon in self.input_polygons_layer.getFeatures(request):
+            polygons_index[polygon['CodiMuni']] = (polygon['DataAlta'], polygon['ValidDe'], polygon.id())
+
+        return polygons_index
+
     def remove_polygons(self):
         """ Remove the municipality's polygons from the database """
         self.input_polygons_layer.selectByExpression(f'"CodiMuni"=\'{self.municipality_codi_ine}\'',
@@ -213,76 +338,77 @@ class EliminadorMMC:
                 self.input_full_bt5_table.deleteFeature(line.id())
 
     def remove_points_layer(self):
-        """
-        Remove the municipality's points from the database's layer
-        Atenció: en alguns casos no esborra correctament les fites 3 termes.
-        """
-        point_id_remove_list = self.get_points_to_remove()
-        with edit(self.input_points_layer):
-            for point_id in point_id_remove_list:
-                self.input_points_layer.selectByExpression(f'"IdFita"=\'{point_id}\'', QgsVectorLayer.SetSelection)
-                for feature in self.input_points_layer.getSelectedFeatures():
-                    self.input_points_layer.deleteFeature(feature.id())
-
-        box = QMessageBox()
-        box.setIcon(QMessageBox.Warning)
-        box.setText("Enrecorda't de revisar que s'han esborrat\ncorrectament totes les fites 3 termes.")
-        box.exec_()
+        """ Remove the municipality's points from the database's layer """
+        point_id_remove_list = self.get_removal_plan().points
+        delete_ids = get_feature_ids(self.input_points_layer, get_in_clause('IdFita', point_id_remove_list))
+        delete_features(self.input_points_layer, delete_ids)
 
-    def get_points_to_remove(self):
+    def get_points_to_remove(self, delete_lines_list):
         """
         Get the points that the class has to remove, in order to avoid removing points that have to exists
         due they also pertain to another municipality that have MM.
 
+        :param delete_lines_list: List with the line ID of the lines to remove
+        :type delete_lines_list: list
+
         :return point_id_remove_list: List with the ID of all the points to remove from the points layer
         :rtype: tuple
         """
-        fita_mem_layer = self.pg_adt.get_layer('v_fita_mem', 'id_fita')
         point_id_remove_list = []
-        delete_lines_list, edit_lines_dict = self.get_lines_to_manage()
+        fites_mem = self.pg_adt.get_fites_mem('id_linia', delete_lines_list)
 
         for line_id in delete_lines_list:
-            fita_mem_layer.selectByExpression(f'"id_linia"=\'{line_id}\'', QgsVectorLayer.SetSelection)
-            for feature in fita_mem_layer.getSelectedFeatures():
+            for feature in fites_mem[int(line_id)]:
                 # Check that the point has correctly filled the coordinates fields
                 if feature['point_x'] and feature['point_y']:
                     point_id_fita = coordinates_to_id_fita(feature['point_x'], feature['point_y'])
                     if feature['num_termes'] == 'F2T':
                         point_id_remove_list.append(point_id_fita)
                     elif feature['num_termes'] != 'F2T' and feature['num_termes']:
-                        '''
-                        No es pot fer una selecció espacial fita - linia de terme, de manera que no es 
-                        pot comprovar de manera 100% fiable si una fita 3 termes té una línia veïna amb MM o no.
-                        El que es fa és el següent:
-                            1. Per cada línia veïna, saber si cap dels municipis de la línia de terme té MM al MMC.
-                            2. Si en té, no s'elimina la fita 3 termes.
-                        '''
-                        neighbor_lines = self.get_neighbor_lines(line_id)
-                        neighbor_mm = False
-                        for neighbor_line in neighbor_lines:
-                            # Get neighbors municipalities
-                            neighbor_municipality_1_codi_ine, neighbor_municipality_2_codi_ine = self.get_neighbors_ine(
-                                neighbor_line)
-                            # Check if any of neighbors has MM
-                            neighbor_municipality_1_mm = self.check_mm_exists(neighbor_municipality_1_codi_ine, 'input')
-                            neighbor_municipality_2_mm = self.check_mm_exists(neighbor_municipality_2_codi_ine, 'input')
-                            if (neighbor_municipality_1_mm or neighbor_municipality_2_mm) and not neighbor_mm:
-                                neighbor_mm = True
-
-                        # If there is not any neighbor municipality with MM, remove the point
-                        if not neighbor_mm:
+                        # A fita 3 termes is kept if any of the boundary lines that it touches belongs to a
+                        # municipality that still has MM
+                        if not self.check_fita_lines_mm(feature['point_x'], feature['point_y']):
                             point_id_remove_list.append(point_id_fita)
 
         return point_id_remove_list
 
+    def check_fita_lines_mm(self, point_x, point_y):
+        """
+        Check if any of the boundary lines that touch a fita belongs to a municipality that still has MM
+
+        :param point_x: X coordinate of the fita
+        :type point_x: float
+
+        :param point_y: Y coordinate of the fita
+        :type point_y: float
+
+        :return: Indicates if any of the fita's lines belongs to a municipality with MM
+        :rtype: bool
+        """
+        point_geom = QgsGeometry.fromPointXY(QgsPointXY(point_x, point_y))
+        search_rectangle = QgsRectangle(point_x - FITA_LINE_TOLERANCE, point_y - FITA_LINE_TOLERANCE,
+                                        point_x + FITA_LINE_TOLERANCE, point_y + FITA_LINE_TOLERANCE)
+        for line_fid in self.lines_spatial_index.intersects(search_rectangle):
+            line_geom, line_id = self.lines_index[line_fid]
+            if line_geom.distance(point_geom) > FITA_LINE_TOLERANCE:
+                continue
+            line_municipalities = self.line_graph.line_municipalities(line_id)
+            if line_municipalities is None:
+                continue
+            for municipality_id in line_municipalities:
+                if municipality_id is None:
+                    continue
+                municipality_codi_ine = self.get_municipality_codi_ine(municipality_id)
+                if self.check_mm_exists(municipality_codi_ine, 'input'):
+                    return True
+
+        return False
+
     def remove_points_table(self):
         """ Remove the municipality's points from the database's table """
-        for line_id in self.municipality_lines:
-            with edit(self.input_points_table):
-                line_id_txt = line_id_2_txt(line_id)
-                self.input_points_table.selectByExpression(f'"IdLinia"=\'{line_id_txt}\'', QgsVectorLayer.SetSelection)
-                for feature in self.input_points_table.getSelectedFeatures():
-                    self.input_points_table.deleteFeature(feature.id())
+        lines_id_txt = [line_id_2_txt(line_id) for line_id in self.municipality_lines]
+        delete_ids = get_feature_ids(self.input_points_table, get_in_clause('IdLinia', lines_id_txt))
+        delete_features(self.input_points_table, delete_ids)
 
     def get_neighbor_lines(self, line_id):
         """
@@ -294,38 +420,13 @@ class EliminadorMMC:
         :return neighbor_lines: List with the line ID of the neighbor lines
         :rtype: tuple
         """
-        neighbor_lines = []
-        linia_veina_table = self.pg_adt.get_table('linia_veina')
-        linia_veina_table.selectByExpression(f'"id_linia"=\'{line_id}\'', QgsVectorLayer.SetSelection)
-        for line in linia_veina_table.getSelectedFeatures():
-            neighbor_lines.append(int(line['id_linia_veina']))
+        neighbor_lines = list(self.line_graph.neighbor_lines(line_id))
 
         return neighbor_lines
 
     def remove_lines_layer(self):
         """ Remove the municipality's boundary lines from the database's layer """
-        # Remove boundary lines
-        delete_lines_list, edit_lines_dict = self.get_lines_to_manage()
-        if delete_lines_list:
-            with edit(self.input_lines_layer):
-                for line_id in delete_lines_list:
-                    self.input_lines_layer.selectByExpression(f'"IdLinia"=\'{line_id}\'', QgsVectorLayer.SetSelection)
-                    for line in self.input_lines_layer.getSelectedFeatures():
-                        self.input_lines_layer.deleteFeature(line.id())
-
-        # Edit boundary lines
-        if edit_lines_dict:
-            with edit(self.input_lines_layer):
-                for line_id, dates in edit_lines_dict.items():
-                    neighbor_valid_de, neighbor_data_alta, neighbor_ine = dates
-                    self.input_lines_layer.selectByExpression(f'"IdLinia"=\'{line_id}\'', QgsVectorLayer.SetSelection)
-                    for line in self.input_lines_layer.getSelectedFeatures():
-                        if line['ValidDe'] < neighbor_valid_de:
-                            line['ValidDe'] = neighbor_valid_de
-                            self.input_lines_layer.updateFeature(line)
-                        if line['DataAlta'] < neighbor_data_alta:
-                            line['DataAlta'] = neighbor_data_alta
-                            self.input_lines_layer.updateFeature(line)
+        remove_plan_lines(self.input_lines_layer, self.get_removal_plan())
 
     def get_lines_to_manage(self):
         """
@@ -365,12 +466,12 @@ class EliminadorMMC:
         :return neighbor_municipality_id: ID of the neighbor municipality
         :rtype: str
         """
-        line_data = self.arr_lines_data[np.where(self.arr_lines_data['IDLINIA'] == line_id)]
+        municipality_1_id, municipality_2_id = self.line_graph.line_municipalities(line_id)
         neighbor_municipality_id = ''
-        if line_data['CODIMUNI1'] == self.municipality_id:
-            neighbor_municipality_id = line_data['CODIMUNI2'][0]
-        elif line_data['CODIMUNI2'] == self.municipality_id:
-            neighbor_municipality_id = line_data['CODIMUNI1'][0]
+        if municipality_1_id == self.municipality_id:
+            neighbor_municipality_id = municipality_2_id
+        elif municipality_2_id == self.municipality_id:
+            neighbor_municipality_id = municipality_1_id
 
         return neighbor_municipality_id
 
@@ -387,8 +488,7 @@ class EliminadorMMC:
         :return neighbor_municipality_2_id: ID of the second neighbor municipality
         :rtype: neighbor_municipality_2_id: str
         """
-        line_data = self.arr_lines_data[np.where(self.arr_lines_data['IDLINIA'] == line_id)]
-        neighbor_municipality_1_id, neighbor_municipality_2_id = line_data['CODIMUNI1'][0], line_data['CODIMUNI2'][0]
+        neighbor_municipality_1_id, neighbor_municipality_2_id = self.line_graph.line_municipalities(line_id)
 
         return neighbor_municipality_1_id, neighbor_municipality_2_id
 
@@ -439,24 +539,16 @@ class EliminadorMMC:
         :return valid_de: Valid De of the neighbor municipality
         :rtype: valid_de: str
         """
-        self.input_polygons_layer.selectByExpression(f'"CodiMuni"=\'{neighbor_ine}\'',
-                                                     QgsVectorLayer.SetSelection)
-        data_alta, valid_de = None, None
-        for polygon in self.input_polygons_layer.getSelectedFeatures():
-            data_alta = polygon['DataAlta']
-            valid_de = polygon['ValidDe']
+        data_alta, valid_de, polygon_id = self.polygons_index.get(neighbor_ine, (None, None, None))
 
         return data_alta, valid_de
 
     def remove_lines_table(self):
         """ Remove the municipality's boundary lines from the database's table """
-        with edit(self.input_line_table):
-            for line in self.municipality_lines:
-                line_txt = line_id_2_txt(line)
-                self.input_line_table.selectByExpression(f'"IdLinia"={line_txt} and "CodiMuni" = \'{self.municipality_codi_ine}\'',
-                                                         QgsVectorLayer.SetSelection)
-                for feature in self.input_line_table.getSelectedFeatures():
-                    self.input_line_table.deleteFeature(feature.id())
+        lines_id_txt = [line_id_2_txt(line_id) for line_id in self.municipality_lines]
+        expression = f'{get_in_clause("IdLinia", lines_id_txt)} and "CodiMuni" = {quote_value(self.municipality_codi_ine)}'
+        delete_ids = get_feature_ids(self.input_line_table, expression)
+        delete_features(self.input_line_table, delete_ids)
 
     def remove_coast_lines_table(self):
         """ Remove the municipality's boundary coast line from the database's table """
@@ -466,6 +558,234 @@ class EliminadorMMC:
                 self.input_coast_line_table.deleteFeature(feature.id())
 
 
+class EliminadorMMCBatch:
+    """ MMC Deletion class for several municipalities at once """
+
+    # Attributes of the EliminadorMMC with the input layers, shared by all the municipalities of the batch
+    layers_attributes = ('input_points_layer', 'input_lines_layer', 'input_polygons_layer', 'input_coast_lines_layer',
+                         'input_full_bt5_table', 'input_points_table', 'input_line_table', 'input_coast_line_table',
+                         'polygons_index', 'lines_spatial_index', 'lines_index')
+
+    def __init__(self, municipality_ids):
+        """
+        Constructor
+
+        :param municipality_ids: List with the ID of the municipalities to remove
+        :type municipality_ids: list
+        """
+        # All the municipalities of the batch share the same connection, and so the layers opened through it
+        self.pg_adt = PgADTConnection(HOST, DBNAME, USER, PWD, SCHEMA)
+        self.pg_adt.connect()
+        self.eliminadors = [EliminadorMMC(municipality_id, str(municipality_id) in municipis_costa, self.pg_adt)
+                            for municipality_id in municipality_ids]
+        # The lines shared by two municipalities of the batch are removed, as none of them will have MM
+        self.removed_codi_ine = {eliminador.municipality_codi_ine for eliminador in self.eliminadors}
+        for eliminador in self.eliminadors:
+            eliminador.removed_codi_ine = self.removed_codi_ine
+        self.removal_plan = None
+
+    def remove_municipalities_data(self):
+        """
+        Main entry point. This function removes all the data of the municipalities that the user wants to remove
+        from the database, editing every layer only once.
+        """
+        QgsMessageLog.logMessage('Procés iniciat: eliminació de mapes del Mapa Municipal de Catalunya', level=Qgis.Info)
+
+        self.set_layers()
+        removal_plan = self.get_removal_plan()
+        QgsMessageLog.logMessage(f'Pla d\'eliminació:\n{removal_plan.describe()}', level=Qgis.Info)
+        QgsMessageLog.logMessage('Esborrant geometries...', level=Qgis.Info)
+        self.remove_polygons()
+        self.remove_lines_layer()
+        self.remove_lines_table()
+        self.remove_points_layer()
+        self.remove_points_table()
+        QgsMessageLog.logMessage('Geometries esborrades', level=Qgis.Info)
+        if self.get_coast_lines():
+            QgsMessageLog.logMessage('Esborrant línies de costa...', level=Qgis.Info)
+            self.remove_coast_lines()
+            QgsMessageLog.logMessage('Línies de costa esborrades', level=Qgis.Info)
+
+        QgsMessageLog.logMessage('Procés finalitzat: eliminació de mapes del Mapa Municipal de Catalunya', level=Qgis.Info)
+
+    def set_layers(self):
+        """ Set the working vector layers, reading them only once for all the municipalities """
+        first_eliminador = self.eliminadors[0]
+        first_eliminador.set_layers()
+        for eliminador in self.eliminadors[1:]:
+            for attribute in self.layers_attributes:
+                setattr(eliminador, attribute, getattr(first_eliminador, attribute))
+
+    def plan_municipalities_removal(self):
+        """
+        Dry run of the removal. Get the combined plan of the features to remove and edit, without editing any
+        layer.
+
+        :return: Removal plan
+        :rtype: RemovalPlan
+        """
+        self.set_layers()
+        return self.get_removal_plan()
+
+    def get_removal_plan(self):
+        """
+        Get the combined plan of the features to remove and edit of all the municipalities. It's computed only
+        the first time.
+
+        :return: Removal plan
+        :rtype: RemovalPlan
+        """
+        if self.removal_plan is None:
+            delete_lines, edit_lines, points = [], {}, []
+            for eliminador in self.eliminadors:
+                municipality_plan = eliminador.get_removal_plan()
+                delete_lines.extend(line_id for line_id in municipality_plan.delete_lines if line_id not in delete_lines)
+                edit_lines.update(municipality_plan.edit_lines)
+                points.extend(point_id for point_id in municipality_plan.points if point_id not in points)
+            self.removal_plan = RemovalPlan(delete_lines, edit_lines, points)
+
+        return self.removal_plan
+
+    def get_coast_lines(self):
+        """
+        Get the coast lines of the municipalities
+
+        :return: Set with the line ID of the coast lines
+        :rtype: set
+        """
+        return {int(eliminador.municipality_coast_line) for eliminador in self.eliminadors
+                if eliminador.coast and eliminador.municipality_coast_line}
+
+    def remove_polygons(self):
+        """ Remove the municipalities' polygons from the database """
+        polygons_index = self.eliminadors[0].polygons_index
+        polygon_ids = [polygons_index[codi_ine][2] for codi_ine in self.removed_codi_ine if codi_ine in polygons_index]
+        delete_features(self.eliminadors[0].input_polygons_layer, polygon_ids)
+
+    def remove_lines_layer(self):
+        """ Remove and edit the municipalities' boundary lines from the database's layer """
+        remove_plan_lines(self.eliminadors[0].input_lines_layer, self.get_removal_plan())
+
+    def remove_lines_table(self):
+        """ Remove the municipalities' boundary lines from the database's table """
+        line_table = self.eliminadors[0].input_line_table
+        line_keys = {(line_id, eliminador.municipality_codi_ine) for eliminador in self.eliminadors
+                     for line_id in eliminador.municipality_lines}
+        delete_ids = [feature.id() for feature in line_table.getFeatures()
+                      if (get_line_key(feature['IdLinia']), feature['CodiMuni']) in line_keys]
+        delete_features(line_table, delete_ids)
+
+    def remove_points_layer(self):
+        """ Remove the municipalities' points from the database's layer """
+        points_layer = self.eliminadors[0].input_points_layer
+        point_ids = set(self.get_removal_plan().points)
+        delete_ids = [feature.id() for feature in points_layer.getFeatures() if feature['IdFita'] in point_ids]
+        delete_features(points_layer, delete_ids)
+
+    def remove_points_table(self):
+        """ Remove the municipalities' points from the database's table """
+        points_table = self.eliminadors[0].input_points_table
+        lines = {line_id for eliminador in self.eliminadors for line_id in eliminador.municipality_lines}
+        delete_ids = [feature.id() for feature in points_table.getFeatures()
+                      if get_line_key(feature['IdLinia']) in lines]
+        delete_features(points_table, delete_ids)
+
+    def remove_coast_lines(self):
+        """ Remove the municipalities' coast lines from the database's layer and tables """
+        coast_lines = self.get_coast_lines()
+        first_eliminador = self.eliminadors[0]
+        for layer in (first_eliminador.input_coast_lines_layer, first_eliminador.input_coast_line_table,
+                      first_eliminador.input_full_bt5_table):
+            delete_ids = [feature.id() for feature in layer.getFeatures()
+                          if get_line_key(feature['IdLinia']) in coast_lines]
+            delete_features(layer, delete_ids)
+
+
+def get_feature_ids(layer, expression):
+    """
+    Get the ID of the features of a layer that match an expression, reading the layer only once and without
+    the geometry
+
+    :param layer: Layer to get the features from
+    :type layer: QgsVectorLayer
+
+    :param expression: Filter expression
+    :type expression: str
+
+    :return: List with the ID of the matching features
+    :rtype: list
+    """
+    request = QgsFeatureRequest().setFilterExpression(expression).setFlags(QgsFeatureRequest.NoGeometry)
+    return [feature.id() for feature in layer.getFeatures(request)]
+
+
+def delete_features(layer, feature_ids):
+    """
+    Delete the given features from a layer with a single edit session
+
+    :param layer: Layer to delete the features from
+    :type layer: QgsVectorLayer
+
+    :param feature_ids: List with the ID of the features to delete
+    :type feature_ids: list
+    """
+    if feature_ids:
+        with edit(layer):
+            layer.deleteFeatures(list(feature_ids))
+
+
+def remove_plan_lines(lines_layer, removal_plan):
+    """
+    Remove and edit the boundary lines of a removal plan, reading the layer only once and editing it with a single
+    edit session
+
+    :param lines_layer: Layer of the boundary lines
+    :type lines_layer: QgsVectorLayer
+
+    :param removal_plan: Removal plan with the lines to remove and edit
+    :type removal_plan: RemovalPlan
+    """
+    delete_lines = {get_line_key(line_id) for line_id in removal_plan.delete_lines}
+    edit_lines = {get_line_key(line_id): dates for line_id, dates in removal_plan.edit_lines.items()}
+    valid_de_index = lines_layer.fields().lookupField('ValidDe')
+    data_alta_index = lines_layer.fields().lookupField('DataAlta')
+
+    delete_ids, edit_values = [], {}
+    for line in lines_layer.getFeatures():
+        line_key = get_line_key(line['IdLinia'])
+        if line_key in delete_lines:
+            delete_ids.append(line.id())
+        elif line_key in edit_lines:
+            neighbor_valid_de, neighbor_data_alta, neighbor_ine = edit_lines[line_key]
+            if line['ValidDe'] < neighbor_valid_de:
+                edit_values.setdefault(line.id(), {})[valid_de_index] = neighbor_valid_de
+            if line['DataAlta'] < neighbor_data_alta:
+                edit_values.setdefault(line.id(), {})[data_alta_index] = neighbor_data_alta
+
+    if delete_ids or edit_values:
+        with edit(lines_layer):
+            lines_layer.deleteFeatures(delete_ids)
+            for line_id, values in edit_values.items():
+                for field_index, value in values.items():
+                    lines_layer.changeAttributeValue(line_id, field_index, value)
+
+
+def get_line_key(line_id):
+    """
+    Get a line ID as an integer, in order to compare line IDs stored as numbers or as text with the nnnn format
+
+    :param line_id: ID of the line
+    :type line_id: str or int
+
+    :return: ID of the line as an integer, or None if it's not a valid line ID
+    :rtype: int
+    """
+    try:
+        return int(line_id)
+    except (TypeError, ValueError):
+        return None
+
+
 def check_eliminador_input_data():
     """ Check if the module has all the necessary input data into the input directory
 
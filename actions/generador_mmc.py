@@ -9,9 +9,10 @@ and generates the metadata of a municipal map.
 ***************************************************************************/
 """
 
-import numpy as np
+from collections import namedtuple
 import os
 import shutil
+from types import MappingProxyType
 import xml.etree.ElementTree as ET
 
 from qgis.core import (QgsVectorLayer,
@@ -24,26 +25,42 @@ from qgis.core import (QgsVectorLayer,
                        QgsCoordinateTransform,
                        QgsFeature,
                        QgsGeometry,
-                       QgsProject)
+                       QgsProject,
+                       Qgis)
 from qgis.core.additions.edit import edit
 from PyQt5.QtWidgets import QMessageBox
 
 
 from ..config import *
 from ..utils import *
-from .adt_postgis_connection import PgADTConnection
+from .adt_postgis_connection import PgADTConnection, get_in_clause, quote_value
+from .dictionaries import load_dictionary
+from .line_graph import get_line_graph
 
 
 # TODO comment correctly
 
 
+class MunicipalityContext(namedtuple('MunicipalityContext', ('municipality_id', 'coast', 'pg_adt', 'municipality_name',
+                                                             'municipality_normalized_name', 'municipality_nomens',
+                                                             'municipality_codi_ine', 'municipality_valid_de',
+                                                             'municipality_lines', 'municipality_coast_line',
+                                                             'dict_valid_de', 'municipalities_names_lines'))):
+    """
+    Immutable data of a municipality, computed once and shared by all the Generador MMC classes that work with
+    the same municipality in order to avoid repeating the same queries and layer readings
+    """
+    __slots__ = ()
+
+
 class GeneradorMMC(object):
     """ MMC Generation class """
 
     def __init__(self,
                  municipality_id,
                  data_alta=None,
-                 coast=False):
+                 coast=False,
+                 context=None):
         """
         Constructor
 
@@ -55,52 +72,95 @@ class GeneradorMMC(object):
 
         :param coast: Indicates if the municipality has coast or not
         :type coast: bool
+
+        :param context: Data of the municipality already computed by another Generador MMC instance
+        :type context: MunicipalityContext
         """
         # Initialize instance attributes
         # Common
-        self.arr_nom_municipalities = np.genfromtxt(DIC_NOM_MUNICIPIS, dtype=None, encoding=None, delimiter=';', names=True)
-        self.arr_lines_data = np.genfromtxt(DIC_LINES, dtype=None, encoding=None, delimiter=';', names=True)
+        self.dic_nom_municipalities = load_dictionary(DIC_NOM_MUNICIPIS)
+        self.dic_lines = load_dictionary(DIC_LINES)
         self.crs = QgsCoordinateReferenceSystem("EPSG:25831")
         self.crs_geo = QgsCoordinateReferenceSystem("EPSG:4258")
         self.entities_list = ('fita', 'liniacosta', 'liniacostaula', 'liniaterme', 'liniatermetaula', 'poligon',
                               'tallfullbt5m')
+        self.data_alta = data_alta
+        # ###
+        # Input dependant data, only computed if it's not given by the caller
+        if context is None:
+            context = self.get_municipality_context(municipality_id, coast)
+        self.context = context
+        # ADT PostGIS connection
+        self.pg_adt = context.pg_adt
+        self.municipality_id = context.municipality_id
+        self.coast = context.coast
+        self.municipality_name = context.municipality_name
+        self.municipality_normalized_name = context.municipality_normalized_name
+        self.municipality_nomens = context.municipality_nomens
+        self.municipality_codi_ine = context.municipality_codi_ine
+        self.municipality_valid_de = context.municipality_valid_de
+        self.metadata_table_name = f'{self.municipality_id}_Taula_espec_C4'
+        self.metadata_table_path = os.path.join(GENERADOR_TAULES_ESPEC, f'{self.metadata_table_name}.dbf')
+        self.municipality_metadata_table = self.get_municipality_metadata_table()   # Can be None
+        # Paths
+        self.municipality_input_dir = os.path.join(GENERADOR_INPUT_DIR, self.municipality_normalized_name)
+        self.shapefiles_input_dir = os.path.join(self.municipality_input_dir, SHAPEFILES_PATH)
+        self.output_directory_name = f'mapa-municipal-{self.municipality_normalized_name}-{self.municipality_valid_de}'
+        self.output_directory_path = os.path.join(GENERADOR_OUTPUT_DIR, self.output_directory_name)
+        self.output_subdirectory_path = os.path.join(self.output_directory_path, self.output_directory_name)
+        self.report_path = os.path.join(self.output_directory_path, f'{self.municipality_id}_Report.txt')
+        # Data that comes from the line layer
+        self.municipality_lines = context.municipality_lines
+        self.municipality_coast_line = context.municipality_coast_line
+        self.dict_valid_de = context.dict_valid_de
+        self.municipalities_names_lines = context.municipalities_names_lines
+
+    def get_municipality_context(self, municipality_id, coast=False):
+        """
+        Compute all the input dependant data of the municipality, connecting to the database and reading the
+        input line layer only once
+
+        :param municipality_id: ID of the municipality
+        :type municipality_id: str
+
+        :param coast: Indicates if the municipality has coast or not
+        :type coast: bool
+
+        :return: context: Immutable data of the municipality
+        :rtype: MunicipalityContext
+        """
         # ADT PostGIS connection
         self.pg_adt = PgADTConnection(HOST, DBNAME, USER, PWD, SCHEMA)
         self.pg_adt.connect()
-        # ###
         # Input dependant that don't need data from the layers
         self.municipality_id = int(municipality_id)
-        self.data_alta = data_alta
         self.coast = coast
         self.municipality_name = self.get_municipality_name()
         self.municipality_normalized_name = self.get_municipality_normalized_name()
         self.municipality_nomens = self.get_municipality_nomens()
         self.municipality_codi_ine = self.get_municipality_codi_ine()
         self.municipality_valid_de = self.get_municipality_valid_de()
-        self.metadata_table_name = f'{self.municipality_id}_Taula_espec_C4'
-        self.metadata_table_path = os.path.join(GENERADOR_TAULES_ESPEC, f'{self.metadata_table_name}.dbf')
-        self.municipality_metadata_table = self.get_municipality_metadata_table()   # Can be None
-        # ###
         # Input dependant that need data from the line layer
-        # Paths
-        self.municipality_input_dir = os.path.join(GENERADOR_INPUT_DIR, self.municipality_normalized_name)
-        self.shapefiles_input_dir = os.path.join(self.municipality_input_dir, SHAPEFILES_PATH)
-        self.output_directory_name = f'mapa-municipal-{self.municipality_normalized_name}-{self.municipality_valid_de}'
-        self.output_directory_path = os.path.join(GENERADOR_OUTPUT_DIR, self.output_directory_name)
-        self.output_subdirectory_path = os.path.join(self.output_directory_path, self.output_directory_name)
-        self.report_path = os.path.join(self.output_directory_path, f'{str(municipality_id)}_Report.txt')
-        # Input line layer as Vector Layer for getting some data related to the lines ID
-        self.input_line_layer = QgsVectorLayer(os.path.join(self.shapefiles_input_dir, 'MM_Linies.shp'))
+        shapefiles_input_dir = os.path.join(GENERADOR_INPUT_DIR, self.municipality_normalized_name, SHAPEFILES_PATH)
+        input_line_layer = QgsVectorLayer(os.path.join(shapefiles_input_dir, 'MM_Linies.shp'))
+        # Read the lines ID only once from the input line layer
+        input_lines_id = [line['id_linia'] for line in input_line_layer.getFeatures()]
         # Get a list with all the lines ID
-        self.municipality_lines = self.get_municipality_lines(self.input_line_layer)
+        self.municipality_lines = self.get_municipality_lines(input_lines_id)
         if not self.coast:
-            self.municipality_coast_line = 'Aquest MM no te linia de costa.'
+            municipality_coast_line = 'Aquest MM no te linia de costa.'
         else:
-            self.municipality_coast_line = self.get_municipality_coast_line(self.input_line_layer)
+            municipality_coast_line = self.get_municipality_coast_line(input_lines_id)
         # Get a dictionary with all the ValidDe dates per line
-        self.dict_valid_de = self.get_lines_valid_de(self.input_line_layer)
+        dict_valid_de = self.get_lines_valid_de(input_lines_id)
         # Get a dictionary with the municipalities names per line
-        self.municipalities_names_lines = self.get_municipalities_names_line()
+        municipalities_names_lines = self.get_municipalities_names_line()
+
+        return MunicipalityContext(self.municipality_id, self.coast, self.pg_adt, self.municipality_name,
+                                   self.municipality_normalized_name, self.municipality_nomens,
+                                   self.municipality_codi_ine, self.municipality_valid_de,
+                                   tuple(self.municipality_lines), municipality_coast_line,
+                                   MappingProxyType(dict_valid_de), MappingProxyType(municipalities_names_lines))
 
     # #######################
     # Setters & Getters
@@ -111,8 +171,8 @@ class GeneradorMMC(object):
         :return: muni_name: Name of the municipality
         :rtype: str
         """
-        muni_data = self.arr_nom_municipalities[np.where(self.arr_nom_municipalities['id_area'] == f'"{self.municipality_id}"')]
-        muni_name = muni_data['nom_muni'][0]
+        muni_data = self.dic_nom_municipalities.get('id_area', self.municipality_id)
+        muni_name = muni_data['nom_muni']
 
         return muni_name
 
@@ -123,8 +183,8 @@ class GeneradorMMC(object):
         :return: muni_norm_name: Normalized name of the municipality
         :rtype: str
         """
-        muni_data = self.arr_nom_municipalities[np.where(self.arr_nom_municipalities['id_area'] == f'"{self.municipality_id}"')]
-        muni_norm_name = muni_data['nom_muni_norm'][0]
+        muni_data = self.dic_nom_municipalities.get('id_area', self.municipality_id)
+        muni_norm_name = muni_data['nom_muni_norm']
 
         return muni_norm_name
 
@@ -135,69 +195,68 @@ class GeneradorMMC(object):
         :return: muni_nomens: Way to say the municipality name
         :rtype: str
         """
-        muni_data = self.arr_nom_municipalities[np.where(self.arr_nom_municipalities['id_area'] == f'"{self.municipality_id}"')]
-        muni_nomens = muni_data['nomens'][0]
+        muni_data = self.dic_nom_municipalities.get('id_area', self.municipality_id)
+        muni_nomens = muni_data['nomens']
 
         return muni_nomens
 
-    def get_municipality_lines(self, lines_layer):
+    def get_municipality_lines(self, lines_id):
         """
         Get all the municipal boundary lines that make the input municipality
 
-        :param lines_layer: Layer of the municipality's boundary lines
-        :type lines_layer: QgsVectorLayer
+        :param lines_id: ID of all the lines of the municipality's boundary lines layer
+        :type lines_id: list
 
         :return: line_list: List with the ID of the lines
         :rtype: tuple
         """
         line_list = []
-        for line in lines_layer.getFeatures():
-            line_id = line['id_linia']
-            line_data = self.arr_lines_data[np.where(self.arr_lines_data['IDLINIA'] == line_id)]
-            if line_data['LIMCOSTA'] == 'N':
+        for line_id in lines_id:
+            line_data = self.dic_lines.get('IDLINIA', line_id)
+            if line_data is not None and line_data['LIMCOSTA'] == 'N':
                 line_list.append(line_id)
 
         return line_list
 
-    def get_municipality_coast_line(self, lines_layer):
+    def get_municipality_coast_line(self, lines_id):
         """
         Get the municipality coast line, if exists
 
-        :param lines_layer: Layer of the municipality's boundary lines
-        :type lines_layer: QgsVectorLayer
+        :param lines_id: ID of all the lines of the municipality's boundary lines layer
+        :type lines_id: list
 
         :return coast_line_id: ID of the coast line
         :rtype: str
         """
         coast_line_id = ''
-        for line in lines_layer.getFeatures():
-            line_id = line['id_linia']
-            line_data = self.arr_lines_data[np.where(self.arr_lines_data['IDLINIA'] == line_id)]
-            if line_data['LIMCOSTA'] == 'S':
+        for line_id in lines_id:
+            line_data = self.dic_lines.get('IDLINIA', line_id)
+            if line_data is not None and line_data['LIMCOSTA'] == 'S':
                 coast_line_id = line_id
 
         return coast_line_id
 
-    def get_lines_valid_de(self, lines_layer):
+    def get_lines_valid_de(self, lines_id):
         """
         Get the ValidDe date from every line that conform the municipality's boundary. Each date is equal to the
         CDT date from the memories_treb_top table
 
-        :param lines_layer: Layer of the municipality's boundary lines
-        :type lines_layer: QgsVectorLayer
+        :param lines_id: ID of all the lines of the municipality's boundary lines layer
+        :type lines_id: list
 
         :return: dict_valid_de: Dictionary with the ValidDe date of every line
         :rtype: dict
         """
         dict_valid_de = {}
-        mtt_table = self.pg_adt.get_table('memoria_treb_top')
-        for line in lines_layer.getFeatures():
-            line_id = line['id_linia']
-            mtt_table.selectByExpression(f'"id_linia"=\'{line_id}\' and "vig_mtt" is True', QgsVectorLayer.SetSelection)
-            for feature in mtt_table.getSelectedFeatures():
-                line_cdt = feature['data_cdt']
-                line_cdt_str = line_cdt.toString('yyyyMMdd')
-                dict_valid_de[line_id] = line_cdt_str
+        # Get the vigent MTT of all the lines at once instead of line by line
+        mtt_features = self.pg_adt.get_features('memoria_treb_top',
+                                                f'{get_in_clause("id_linia", lines_id)} and "vig_mtt" is True',
+                                                ('id_linia', 'data_cdt'))
+        for feature in mtt_features:
+            line_id = int(feature['id_linia'])
+            line_cdt = feature['data_cdt']
+            line_cdt_str = line_cdt.toString('yyyyMMdd')
+            dict_valid_de[line_id] = line_cdt_str
 
         return dict_valid_de
 
@@ -208,11 +267,11 @@ class GeneradorMMC(object):
         :return: municipality_cdt_str: Date of the Valid De from the CDT date
         :rtype: str
         """
-        mapa_muni_table = self.pg_adt.get_table('mapa_muni_icc')
-        mapa_muni_table.selectByExpression(f'"codi_muni"=\'{self.municipality_codi_ine}\' and "vig_mm" is True',
-                                           QgsVectorLayer.SetSelection)
+        mapa_muni_features = self.pg_adt.get_features('mapa_muni_icc',
+                                                      f'"codi_muni"={quote_value(self.municipality_codi_ine)} and "vig_mm" is True',
+                                                      ('data_con_cdt',))
         municipality_cdt_str = ''
-        for feature in mapa_muni_table.getSelectedFeatures():
+        for feature in mapa_muni_features:
             municipality_cdt = feature['data_con_cdt']
             municipality_cdt_str = municipality_cdt.toString('yyyyMMdd')
 
@@ -225,8 +284,8 @@ class GeneradorMMC(object):
         :return codi_ine: INE ID of the municipality
         :rtype: str
         """
-        muni_data = self.arr_nom_municipalities[np.where(self.arr_nom_municipalities['id_area'] == f'"{self.municipality_id}"')]
-        codi_ine = muni_data['codi_ine_muni'][0].strip('"\'')
+        muni_data = self.dic_nom_municipalities.get('id_area', self.municipality_id)
+        codi_ine = muni_data['codi_ine_muni'].strip('"\'')
 
         return codi_ine
 
@@ -251,9 +310,9 @@ class GeneradorMMC(object):
         """
         municipalities_names_line = {}
         for line_id in self.municipality_lines:
-            line_data = self.arr_lines_data[np.where(self.arr_lines_data['IDLINIA'] == int(line_id))]
-            name_muni_1 = line_data['NOMMUNI1'][0]
-            name_muni_2 = line_data['NOMMUNI2'][0]
+            line_data = self.dic_lines.get('IDLINIA', line_id)
+            name_muni_1 = line_data['NOMMUNI1']
+            name_muni_2 = line_data['NOMMUNI2']
             municipalities_names_line[line_id] = (name_muni_1, name_muni_2)
 
         return municipalities_names_line
@@ -275,7 +334,8 @@ class GeneradorMMCLayers(GeneradorMMC):
     def __init__(self,
                  municipality_id,
                  data_alta,
-                 coast=False):
+                 coast=False,
+                 context=None):
         """
         Constructor
 
@@ -287,8 +347,11 @@ class GeneradorMMCLayers(GeneradorMMC):
 
         :param coast: Indicates if the municipality has coast or not
         :type coast: bool
+
+        :param context: Data of the municipality already computed by another Generador MMC instance
+        :type context: MunicipalityContext
         """
-        GeneradorMMC.__init__(self, municipality_id, data_alta, coast)
+        GeneradorMMC.__init__(self, municipality_id, data_alta, coast, context)
         # Work layers paths
         self.work_point_layer = None
         self.work_line_layer = None
@@ -319,19 +382,20 @@ class GeneradorMMCLayers(GeneradorMMC):
         # LAYERS GENERATION PROCESS
         # Lines
         generador_mmc_lines = GeneradorMMCLines(self.municipality_id, self.data_alta, self.work_line_layer,
-                                                self.dict_valid_de, self.coast)
+                                                self.dict_valid_de, self.coast, self.context)
         generador_mmc_lines.generate_lines_layer()   # Layer
         self.work_lines_table = generador_mmc_lines.generate_lines_table()   # Table
         # Fites
         generador_mmc_fites = GeneradorMMCFites(self.municipality_id, self.data_alta, self.work_point_layer,
-                                                self.dict_valid_de)
+                                                self.dict_valid_de, self.context)
         generador_mmc_fites.generate_fites_layer()
         # Polygon
-        self.generador_mmc_polygon = GeneradorMMCPolygon(self.municipality_id, self.data_alta, self.work_polygon_layer)
+        self.generador_mmc_polygon = GeneradorMMCPolygon(self.municipality_id, self.data_alta, self.work_polygon_layer,
+                                                         self.context)
         self.generador_mmc_polygon.generate_polygon_layer()
         # Costa
         generador_mmc_costa = GeneradorMMCCosta(self.municipality_id, self.data_alta, self.work_line_layer,
-                                                self.dict_valid_de, self.coast)
+                                                self.dict_valid_de, self.coast, self.context)
         self.work_coast_line_layer = generador_mmc_costa.generate_coast_line_layer()
         self.work_coast_line_table = generador_mmc_costa.generate_coast_line_table()
         self.work_coast_line_full = generador_mmc_costa.generate_coast_full_bt5m_table()
@@ -409,7 +473,7 @@ class GeneradorMMCLayers(GeneradorMMC):
             f.write(f"ValidDe(CDT):           {self.municipality_valid_de}\n")
             f.write(f"DataAlta BMMC:          {self.data_alta}\n")
             f.write(f"Codi INE:               {self.municipality_codi_ine}\n")
-            f.write(f"IdLinia (internes):     {str(self.municipality_lines)}\n")
+            f.write(f"IdLinia (internes):     {str(list(self.municipality_lines))}\n")
             f.write(f"IdLinia de la costa:    {self.municipality_coast_line}\n")
             f.write(f"Carpeta shp, dbf i xml: {self.output_directory_name}\n")
             f.write("Shp i dbf generats:\n")
@@ -480,7 +544,8 @@ class GeneradorMMCFites(GeneradorMMCLayers):
                  municipality_id,
                  data_alta,
                  fites_layer,
-                 dict_valid_de):
+                 dict_valid_de,
+                 context=None):
         """
         Constructor
 
@@ -495,8 +560,11 @@ class GeneradorMMCFites(GeneradorMMCLayers):
 
         :return: dict_valid_de: Dictionary with the ValidDe date of every line
         :rtype: dict
+
+        :param context: Data of the municipality already computed by another Generador MMC instance
+        :type context: MunicipalityContext
         """
-        GeneradorMMC.__init__(self, municipality_id, data_alta)
+        GeneradorMMC.__init__(self, municipality_id, data_alta, context=context)
         self.work_point_layer = fites_layer
         self.dict_valid_de = dict_valid_de
 
@@ -536,36 +604,27 @@ class GeneradorMMCFites(GeneradorMMCLayers):
 
     def fill_fields(self):
         """ Fill the layer's fields """
-        point_id_u_fita, point_id_fita, point_r_fita, point_sector, point_num_termes, point_monumentat = ('',) * 6
-        fita_mem_layer = self.pg_adt.get_layer('v_fita_mem', 'id_fita')
-
-        with edit(self.work_point_layer):
-            for point in self.work_point_layer.getFeatures():
-                point_id = point['id_punt']
-                fita_mem_layer.selectByExpression(f'"id_punt"=\'{point_id}\'', QgsVectorLayer.SetSelection)
-                for feature in fita_mem_layer.getSelectedFeatures():
-                    point_id_u_fita = feature['id_u_fita']
-                    point_id_fita = coordinates_to_id_fita(feature['point_x'], feature['point_y'])
-                    point_r_fita = point_num_to_text(feature['num_fita'])
-                    point_sector = feature['num_sector']
-                    point_num_termes = feature['num_termes']
-                    point_monumentat = feature['trobada']
-
-                point['IdUFita'] = point_id_u_fita[:-2]
-                point['IdFita'] = point_id_fita
-                point['IdFitaR'] = point_r_fita
-                point['IdSector'] = point_sector
-                point['NumTermes'] = point_num_termes
-                line_id_txt = line_id_2_txt(point['id_linia'])
-                point['IdLinia'] = line_id_txt
-                point['DataAlta'] = self.data_alta
-                point['ValidDe'] = self.dict_valid_de[point['id_linia']]
-                if point_monumentat:
-                    point['Monument'] = 'S'
-                else:
-                    point['Monument'] = 'N'
-
-                self.work_point_layer.updateFeature(point)
+        points = list(self.work_point_layer.getFeatures())
+        fites_mem = self.pg_adt.get_fites_mem('id_punt', {point['id_punt'] for point in points})
+        fields = self.work_point_layer.fields()
+        # Fita attributes of a point that doesn't exist in the database
+        empty_fita_attributes = dict.fromkeys(('IdUFita', 'IdFita', 'IdFitaR', 'IdSector', 'NumTermes'), '')
+        empty_fita_attributes['Monument'] = 'N'
+
+        attributes_map = {}
+        for point in points:
+            point_fites_mem = fites_mem.get(str(point['id_punt']))
+            if point_fites_mem:
+                point_attributes = get_fita_attributes(point_fites_mem[-1])
+            else:
+                point_attributes = dict(empty_fita_attributes)
+            point_attributes['IdLinia'] = line_id_2_txt(point['id_linia'])
+            point_attributes['DataAlta'] = self.data_alta
+            point_attributes['ValidDe'] = self.dict_valid_de[point['id_linia']]
+            attributes_map[point.id()] = {fields.lookupField(field_name): value
+                                          for field_name, value in point_attributes.items()}
+
+        self.work_point_layer.dataProvider().changeAttributeValues(attributes_map)
 
 
 class GeneradorMMCLines(GeneradorMMCLayers):
@@ -575,7 +634,8 @@ class GeneradorMMCLines(GeneradorMMCLayers):
                  data_alta,
                  lines_layer,
                  dict_valid_de,
-                 coast):
+                 coast,
+                 context=None):
         """
         Constructor
 
@@ -593,8 +653,11 @@ class GeneradorMMCLines(GeneradorMMCLayers):
 
         :param coast: Indicates if the municipality has coast or not
         :type coast: bool
+
+        :param context: Data of the municipality already computed by another Generador MMC instance
+        :type context: MunicipalityContext
         """
-        GeneradorMMC.__init__(self, municipality_id, data_alta, coast)
+        GeneradorMMC.__init__(self, municipality_id, data_alta, coast, context)
         self.work_line_layer = lines_layer
         self.temp_line_table = QgsVectorLayer('LineString', 'Line_table', 'memory')
         self.dict_valid_de = dict_valid_de
@@ -654,9 +717,9 @@ class GeneradorMMCLines(GeneradorMMCLayers):
             for line in self.work_line_layer.getFeatures():
                 line_id = line['id_linia']
                 line_id_txt = line_id_2_txt(line_id)
-                line_data = self.arr_lines_data[np.where(self.arr_lines_data['IDLINIA'] == line_id)]
+                line_data = self.dic_lines.get('IDLINIA', line_id)
                 # Get the Tipus UA type
-                tipus_ua = line_data['TIPUSUA'][0]
+                tipus_ua = line_data['TIPUSUA']
                 if tipus_ua == 'M':
                     line['TipusUA'] = 'Municipi'
                 elif tipus_ua == 'C':
@@ -668,7 +731,7 @@ class GeneradorMMCLines(GeneradorMMCLayers):
                 elif tipus_ua == 'I':
                     line['TipusUA'] = 'Inframunicipal'
                 # Get the Limit Vegue type
-                limit_vegue = line_data['LIMVEGUE'][0]
+                limit_vegue = line_data['LIMVEGUE']
                 if limit_vegue == 'verdadero':
                     line['LimitVegue'] = 'S'
                 else:
@@ -681,9 +744,9 @@ class GeneradorMMCLines(GeneradorMMCLayers):
                     line['TipusLinia'] = 'Exterior'
                 # Non dependant fields
                 line['IdLinia'] = line_id_txt
-                line['NomTerme1'] = str(line_data['NOMMUNI1'][0])
-                line['NomTerme2'] = str(line_data['NOMMUNI2'][0])
-                line['LimitProvi'] = str(line_data['LIMPROV'][0])
+                line['NomTerme1'] = str(line_data['NOMMUNI1'])
+                line['NomTerme2'] = str(line_data['NOMMUNI2'])
+                line['LimitProvi'] = str(line_data['LIMPROV'])
                 line['ValidDe'] = self.dict_valid_de[line['id_linia']]
                 line['DataAlta'] = self.data_alta
 
@@ -720,7 +783,8 @@ class GeneradorMMCPolygon(GeneradorMMCLayers):
     def __init__(self,
                  municipality_id,
                  data_alta,
-                 polygon_layer):
+                 polygon_layer,
+                 context=None):
         """
         Constructor
 
@@ -732,8 +796,11 @@ class GeneradorMMCPolygon(GeneradorMMCLayers):
 
         :param polygon_layer: Polygon layer of the municipality
         :type polygon_layer: QgsVectorLayer
+
+        :param context: Data of the municipality already computed by another Generador MMC instance
+        :type context: MunicipalityContext
         """
-        GeneradorMMC.__init__(self, municipality_id, data_alta)
+        GeneradorMMC.__init__(self, municipality_id, data_alta, context=context)
         self.work_polygon_layer = polygon_layer
 
     def generate_polygon_layer(self):
@@ -811,7 +878,8 @@ class GeneradorMMCCosta(GeneradorMMCLayers):
                  data_alta,
                  lines_layer,
                  dict_valid_de,
-                 coast):
+                 coast,
+                 context=None):
         """
         Constructor
 
@@ -829,8 +897,11 @@ class GeneradorMMCCosta(GeneradorMMCLayers):
 
         :param coast: Indicates if the municipality has coast or not
         :type coast: bool
+
+        :param context: Data of the municipality already computed by another Generador MMC instance
+        :type context: MunicipalityContext
         """
-        GeneradorMMC.__init__(self, municipality_id, data_alta, coast)
+        GeneradorMMC.__init__(self, municipality_id, data_alta, coast, context)
         self.coast_line_id = None
         self.work_lines_layer = lines_layer
         # Es important indicar el crs al crear la capa, si no la geometria no es veu correctament
@@ -915,8 +986,8 @@ class GeneradorMMCCosta(GeneradorMMCLayers):
         coast_line_geom = None
         for line in self.work_lines_layer.getFeatures():
             line_id = line['IdLinia']
-            line_data = self.arr_lines_data[np.where(self.arr_lines_data['IDLINIA'] == int(line_id))]
-            if line_data['LIMCOSTA'] == 'S':
+            line_data = self.dic_lines.get('IDLINIA', line_id)
+            if line_data is not None and line_data['LIMCOSTA'] == 'S':
                 self.coast_line_id = line_id
                 coast_line_geom = line.geometry()
                 with edit(self.work_lines_layer):
@@ -997,24 +1068,24 @@ class GeneradorMMCChecker(GeneradorMMC):
 
     def get_municipality_normalized_name(self):
         """ Get the municipality's normalized name, without accent marks or special characters """
-        muni_data = self.arr_nom_municipalities[np.where(self.arr_nom_municipalities['id_area'] == f'"{self.municipality_id}"')]
-        muni_norm_name = muni_data['nom_muni_norm'][0]
+        muni_data = self.dic_nom_municipalities.get('id_area', self.municipality_id)
+        muni_norm_name = muni_data['nom_muni_norm']
 
         return muni_norm_name
 
     def get_municipality_codi_ine(self):
         """ Get the municipality INE ID """
-        muni_data = self.arr_nom_municipalities[np.where(self.arr_nom_municipalities['id_area'] == f'"{self.municipality_id}"')]
-        codi_ine = muni_data['codi_ine_muni'][0].strip('"\'')
+        muni_data = self.dic_nom_municipalities.get('id_area', self.municipality_id)
+        codi_ine = muni_data['codi_ine_muni'].strip('"\'')
 
         return codi_ine
 
     def check_mm_exists(self):
         """ Check if the input municipality exists as a Municipal Map into the database """
-        mapa_muni_table = self.pg_adt.get_table('mapa_muni_icc')
-        mapa_muni_table.selectByExpression(f'"codi_muni"=\'{self.municipality_codi_ine}\' and "vig_mm" is True',
-                                           QgsVectorLayer.SetSelection)
-        count = mapa_muni_table.selectedFeatureCount()
+        mapa_muni_features = self.pg_adt.get_features('mapa_muni_icc',
+                                                      f'"codi_muni"={quote_value(self.municipality_codi_ine)} and "vig_mm" is True',
+                                                      ('codi_muni',))
+        count = len(mapa_muni_features)
         if count == 0:
             return False
         else:
@@ -1028,9 +1099,29 @@ class GeneradorMMCChecker(GeneradorMMC):
         municipality_input_data_ok = self.check_municipality_input_data()
         if not municipality_input_data_ok:
             return False
+        self.check_municipality_lines()
 
         return True
 
+    def check_municipality_lines(self):
+        """
+        Check that the municipality's boundary lines layer has all the lines around the municipality, logging the
+        missing ones
+        """
+        input_lines = {int(line_id) for line_id in self.municipality_lines}
+        line_graph = get_line_graph(self.pg_adt)
+        missing_lines = []
+        for line_id in line_graph.municipality_lines(self.municipality_id):
+            # The coast lines are not in the municipality's lines list, since the checker is not a coast MM
+            line_data = self.dic_lines.get('IDLINIA', line_id)
+            if line_data is not None and line_data['LIMCOSTA'] == 'S':
+                continue
+            if line_id not in input_lines:
+                missing_lines.append(line_id)
+        if missing_lines:
+            QgsMessageLog.logMessage(f"Línies del municipi que no són a la capa MM_Linies: "
+                                     f"{', '.join(str(line_id) for line_id in missing_lines)}", level=Qgis.Warning)
+
     def check_municipality_input_dir(self):
         """ Check that exists the municipality's folder into the inputs directory """
         if not os.path.exists(self.municipality_input_dir):
@@ -1075,8 +1166,8 @@ class GeneradorMMCChecker(GeneradorMMC):
 
 class GeneradorMMCMetadataTable(GeneradorMMC):
 
-    def __init__(self, municipality_id, data_alta):
-        GeneradorMMC.__init__(self, municipality_id, data_alta)
+    def __init__(self, municipality_id, data_alta, context=None):
+        GeneradorMMC.__init__(self, municipality_id, data_alta, context=context)
         if self.municipality_metadata_table:
             os.remove(self.metadata_table_path)
         self.municipality_metadata_table = QgsVectorLayer('LineString', 'Metadata_table', 'memory')
@@ -1130,17 +1221,18 @@ class GeneradorMMCMetadataTable(GeneradorMMC):
 
     def fill_fields(self):
         """ Fill the new metadata fields with the necessary data """
+        self.prefetch_line_documents()
         with edit(self.municipality_metadata_table):
             for line_id in self.municipality_lines:
                 nom_muni1 = self.municipalities_names_lines[line_id][0]
                 nom_muni2 = self.municipalities_names_lines[line_id][1]
                 # Data from the line data dict related to the line itself
                 line_data = self.get_line_data(line_id)
-                tipus_ua = line_data['TIPUSUA'][0]
-                lim_prov = line_data['LIMPROV'][0]
-                tipus_reg = line_data['TIPUSREG'][0]
-                codi_muni1 = str(line_data['CODIMUNI1'][0])
-                codi_muni2 = str(line_data['CODIMUNI2'][0])
+                tipus_ua = line_data['TIPUSUA']
+                lim_prov = line_data['LIMPROV']
+                tipus_reg = line_data['TIPUSREG']
+                codi_muni1 = str(line_data['CODIMUNI1'])
+                codi_muni2 = str(line_data['CODIMUNI2'])
                 # Data from the Doc Acta
                 acta_h_date, acta_h_id = self.get_acta_h_data(line_id)
                 # Data from the Replantejament
@@ -1161,215 +1253,175 @@ class GeneradorMMCMetadataTable(GeneradorMMC):
                                        self.municipality_valid_de])
                 self.municipality_metadata_table.dataProvider().addFeatures([feature])
 
+    def prefetch_line_documents(self):
+        """
+        Get the documents of all the municipality's lines with one query per table, grouped by line, so that the
+        metadata of every line can be read from memory
+        """
+        lines = self.municipality_lines
+        self.acta_h_features = self.get_lines_acta_h_features()
+        self.rep_features = self.pg_adt.get_grouped_features('replantejament', 'id_linia', lines, '"fi_rep" is True',
+                                                             ('data_doc', 'obs_rep', 'abast_rep', 'org_rep', 'fi_rep'))
+        self.dogc_features = self.pg_adt.get_grouped_features('pa_pub_dogc', 'id_linia', lines,
+                                                              '"vig_pub_dogc" is True',
+                                                              ('data_doc', 'data_pub_dogc', 'tit_pub_dogc',
+                                                               'tip_pub_dogc', 'obs_pub_dogc', 'esm_pub_dogc',
+                                                               'vig_pub_dogc'))
+        self.rec_features = self.pg_adt.get_grouped_features('reconeixement', 'id_linia', lines,
+                                                             '"vig_act_rec" is True',
+                                                             ('data_act_rec', 'act_aterm', 'vig_act_rec'))
+        self.mtt_features = self.pg_adt.get_grouped_features('memoria_treb_top', 'id_linia', lines, '"vig_mtt" is True',
+                                                             ('data_doc', 'abast_mtt', 'vig_mtt'))
+
+    def get_lines_acta_h_features(self):
+        """
+        Get the historic actes of all the municipality's lines. The doc_acta table doesn't have the line ID, so the
+        actes are filtered and grouped by the line ID inside their own ID, with the format REC_nnnn_
+
+        :return: acta_h_features: Dictionary with the line ID as key and the list of its actes as value
+        :rtype: dict
+        """
+        lines_txt = {line_id_2_txt(line_id): line_id for line_id in self.municipality_lines}
+        acta_h_features = {line_id: [] for line_id in self.municipality_lines}
+        if not lines_txt:
+            return acta_h_features
+
+        where = ' or '.join(f'"id_doc_acta" LIKE \'%REC_{line_id_txt}_%\'' for line_id_txt in lines_txt)
+        for feature in self.pg_adt.get_features('doc_acta', where, ('id_doc_acta', 'data', 'id_acta_vell')):
+            doc_acta_id = feature['id_doc_acta']
+            for line_id_txt, line_id in lines_txt.items():
+                if f'REC_{line_id_txt}_' in doc_acta_id:
+                    acta_h_features[line_id].append(feature)
+
+        return acta_h_features
+
+    @staticmethod
+    def get_newest_feature(features, date_field):
+        """
+        Get the feature with the newest date
+
+        :param features: List of features
+        :type features: list
+
+        :param date_field: Name of the date field
+        :type date_field: str
+
+        :return: Feature with the newest date, or None if the list is empty
+        :rtype: QgsFeature
+        """
+        if features:
+            return max(features, key=lambda feature: feature[date_field].toString('yyyyMMdd'))
+
     def get_line_data(self, line_id):
         """ Get the data from a single municipal line """
-        line_data = self.arr_lines_data[np.where(self.arr_lines_data['IDLINIA'] == line_id)]
+        line_data = self.dic_lines.get('IDLINIA', line_id)
 
         return line_data
 
     def get_acta_h_data(self, line_id):
         """ Get the line's historic acta data """
         acta_h_date, acta_h_id = ('',) * 2
-        doc_acta_table = self.pg_adt.get_table('doc_acta')
-        line_id_txt = line_id_2_txt(line_id)
-        doc_acta_table.selectByExpression(f'"id_doc_acta" LIKE \'%REC_{line_id_txt}_%\'',
-                                          QgsVectorLayer.SetSelection)
-        if doc_acta_table.selectedFeatureCount() == 1:
-            for feature in doc_acta_table.getSelectedFeatures():
-                acta_h_date = feature['data'].toString('yyyyMMdd')
-                acta_h_id = feature['id_acta_vell']
         # If there are more than 1 acta, select by the newest date
-        elif doc_acta_table.selectedFeatureCount() > 1:
-            date_list = []
-            for feature in doc_acta_table.getSelectedFeatures():
-                date_list.append(feature['data'].toString('yyyyMMdd'))
-            newest = max(date_list)
-            for feature in doc_acta_table.getSelectedFeatures():
-                if feature['data'] == newest:
-                    acta_h_date = feature['data'].toString('yyyyMMdd')
-                    acta_h_id = feature['id_acta_vell']
-                    break
+        feature = self.get_newest_feature(self.acta_h_features.get(line_id), 'data')
+        if feature is not None:
+            acta_h_date = feature['data'].toString('yyyyMMdd')
+            acta_h_id = feature['id_acta_vell']
 
         return acta_h_date, acta_h_id
 
     def get_rep_data(self, line_id):
         """ Get the line's replantejament data """
         rep_date, rep_tip, rep_abast, rep_org, rep_fi = ('',) * 5
-        rep_table = self.pg_adt.get_table('replantejament')
-        rep_table.selectByExpression(f'"id_linia"=\'{line_id}\' and "fi_rep" is True',
-                                     QgsVectorLayer.SetSelection)
-        if rep_table.selectedFeatureCount() == 1:
-            for feature in rep_table.getSelectedFeatures():
-                rep_date = feature['data_doc'].toString('yyyyMMdd')
-                if 'Anàlisi' in feature['OBS_REP']:
-                    rep_tip = 'ANÀLISI TÈCNICA'
-                elif 'Informe' in feature['OBS_REP']:
-                    rep_tip = 'INFORME'
-                else:
-                    rep_tip = 'REPLANTEJAMENT'
-                rep_abast = feature['abast_rep']
-                rep_org = feature['org_rep']
-                if feature['fi_rep'] is True:
-                    rep_fi = '1'
-                else:
-                    rep_fi = '0'
-        elif rep_table.selectedFeatureCount() > 1:
-            date_list = []
-            for feature in rep_table.getSelectedFeatures():
-                date_list.append(feature['data_doc'].toString('yyyyMMdd'))
-            newest = max(date_list)
-            for feature in rep_table.getSelectedFeatures():
-                if feature['data_doc'] == newest:
-                    rep_date = newest
-                    if 'Anàlisi' in feature['OBS_REP']:
-                        rep_tip = 'ANÀLISI TÈCNICA'
-                    elif 'Informe' in feature['OBS_REP']:
-                        rep_tip = 'INFORME'
-                    else:
-                        rep_tip = 'REPLANTEJAMENT'
-                    rep_abast = feature['abast_rep']
-                    rep_org = feature['org_rep']
-                    if feature['fi_rep'] is True:
-                        rep_fi = '1'
-                    else:
-                        rep_fi = '0'
-                    break
+        feature = self.get_newest_feature(self.rep_features.get(line_id), 'data_doc')
+        if feature is not None:
+            rep_date = feature['data_doc'].toString('yyyyMMdd')
+            if 'Anàlisi' in feature['obs_rep']:
+                rep_tip = 'ANÀLISI TÈCNICA'
+            elif 'Informe' in feature['obs_rep']:
+                rep_tip = 'INFORME'
+            else:
+                rep_tip = 'REPLANTEJAMENT'
+            rep_abast = feature['abast_rep']
+            rep_org = feature['org_rep']
+            if feature['fi_rep'] is True:
+                rep_fi = '1'
+            else:
+                rep_fi = '0'
 
         return rep_date, rep_tip, rep_abast, rep_org, rep_fi
 
     def get_dogc_data(self, line_id):
         """ Get the line's DOGC data """
         dogc_date, dogc_pub_date, dogc_tit, dogc_tipus, dogc_esm, dogc_vig = ('',) * 6
-        dogc_table = self.pg_adt.get_table('pa_pub_dogc')
-        dogc_table.selectByExpression(f'"id_linia"=\'{line_id}\' and "vig_pub_dogc" is True',
-                                      QgsVectorLayer.SetSelection)
-        if dogc_table.selectedFeatureCount() == 1:
-            for feature in dogc_table.getSelectedFeatures():
-                dogc_date = feature['data_doc'].toString('yyyyMMdd')
-                dogc_pub_date = feature['data_pub_dogc'].toString('yyyyMMdd')
-                dogc_tit = feature['tit_pub_dogc']
-                dogc_tipus = DICT_TIPUS_PUB[feature['tip_pub_dogc']]
-                if feature['esm_pub_dogc'] is True:
-                    dogc_esm = '1'
-                else:
-                    dogc_esm = '0'
-                if feature['vig_pub_dogc'] is True:
-                    dogc_vig = '1'
-                else:
-                    dogc_vig = '0'
-        elif dogc_table.selectedFeatureCount() > 1:
+        dogc_features = self.dogc_features.get(line_id, [])
+        if len(dogc_features) > 1:
             box = QMessageBox()
             box.setIcon(QMessageBox.Warning)
             box.setText(f"La linia {line_id} té més d'un DOGC vigent. Si us plau, "
                         f"revisa la data a la taula de metadades.")
             box.exec_()
-            # Si hi ha més d'un DOGC vigent, fer una llista amb les dates d'aquelles publicacions que no siguin
-            # correccions d'errades o alteracions i agafar la data del DOGC més nou
-            date_list = []
-            for feature in dogc_table.getSelectedFeatures():
-                if feature['tip_pub_dogc'] != 2 and 'alteració' not in feature['obs_pub_dogc']:
-                    date_list.append(feature['data_pub_dogc'].toString('yyyyMMdd'))
-            newest = max(date_list)
-            for feature in dogc_table.getSelectedFeatures():
-                if feature['data_pub_dogc'] == newest:
-                    dogc_date = feature['data_doc'].toString('yyyyMMdd')
-                    dogc_pub_date = newest
-                    dogc_tit = feature['tit_pub_dogc']
-                    dogc_tipus = DICT_TIPUS_PUB[feature['tip_pub_dogc']]
-                    if feature['esm_pub_dogc'] is True:
-                        dogc_esm = '1'
-                    else:
-                        dogc_esm = '0'
-                    if feature['vig_pub_dogc'] is True:
-                        dogc_vig = '1'
-                    else:
-                        dogc_vig = '0'
-                    break
+            # Si hi ha més d'un DOGC vigent, agafar la data del DOGC més nou d'entre aquelles publicacions que no
+            # siguin correccions d'errades o alteracions
+            dogc_features = [feature for feature in dogc_features if feature['tip_pub_dogc'] != 2 and
+                             'alteració' not in str(feature['obs_pub_dogc'])]
+        feature = self.get_newest_feature(dogc_features, 'data_pub_dogc')
+        if feature is not None:
+            dogc_date = feature['data_doc'].toString('yyyyMMdd')
+            dogc_pub_date = feature['data_pub_dogc'].toString('yyyyMMdd')
+            dogc_tit = feature['tit_pub_dogc']
+            dogc_tipus = DICT_TIPUS_PUB[feature['tip_pub_dogc']]
+            if feature['esm_pub_dogc'] is True:
+                dogc_esm = '1'
+            else:
+                dogc_esm = '0'
+            if feature['vig_pub_dogc'] is True:
+                dogc_vig = '1'
+            else:
+                dogc_vig = '0'
 
         return dogc_date, dogc_pub_date, dogc_tit, dogc_tipus, dogc_esm, dogc_vig
 
     def get_rec_data(self, line_id):
         """ Get the line's reconeixement data """
         rec_data, rec_tipus, rec_vig, rec_vig_aterm = ('',) * 4
-        rec_table = self.pg_adt.get_table('reconeixement')
-        rec_table.selectByExpression(f'"id_linia"=\'{line_id}\' and "vig_act_rec" is True',
-                                     QgsVectorLayer.SetSelection)
-        if rec_table.selectedFeatureCount() == 1:
-            for feature in rec_table.getSelectedFeatures():
-                rec_data = feature['data_act_rec'].toString('yyyyMMdd')
-                if feature['act_aterm'] is True:
-                    rec_tipus = 'ATERMENAMENT'
-                elif feature['act_aterm'] is False:
-                    rec_tipus = 'RECONEIXEMENT'
-                else:
-                    rec_tipus = 'DESCONEGUT'
-                if feature['vig_act_rec'] is True:
-                    rec_vig = '1'
-                else:
-                    rec_vig = '0'
-                if feature['act_aterm'] is True:
-                    rec_vig_aterm = '1'
-                else:
-                    rec_vig_aterm = '0'
-        elif rec_table.selectedFeatureCount() > 1:
+        rec_features = self.rec_features.get(line_id, [])
+        if len(rec_features) > 1:
             box = QMessageBox()
             box.setIcon(QMessageBox.Warning)
             box.setText(f"La linia {line_id} té més d'una Acta de reconeixement vigent. Si us plau, "
                         f"revisa la data a la taula de metadades.")
             box.exec_()
-            date_list = []
-            for feature in rec_table.getSelectedFeatures():
-                date_list.append(feature['data_act_rec'].toString('yyyyMMdd'))
-            newest = max(date_list)
-            for feature in rec_table.getSelectedFeatures():
-                if feature['data_act_rec'] == newest:
-                    rec_data = newest
-                    if feature['act_aterm'] is True:
-                        rec_tipus = 'ATERMENAMENT'
-                    elif feature['act_aterm'] is False:
-                        rec_tipus = 'RECONEIXEMENT'
-                    else:
-                        rec_tipus = 'DESCONEGUT'
-                    if feature['vig_act_rec'] is True:
-                        rec_vig = '1'
-                    else:
-                        rec_vig = '0'
-                    if feature['act_aterm'] is True:
-                        rec_vig_aterm = '1'
-                    else:
-                        rec_vig_aterm = '0'
-                    break
+        feature = self.get_newest_feature(rec_features, 'data_act_rec')
+        if feature is not None:
+            rec_data = feature['data_act_rec'].toString('yyyyMMdd')
+            if feature['act_aterm'] is True:
+                rec_tipus = 'ATERMENAMENT'
+            elif feature['act_aterm'] is False:
+                rec_tipus = 'RECONEIXEMENT'
+            else:
+                rec_tipus = 'DESCONEGUT'
+            if feature['vig_act_rec'] is True:
+                rec_vig = '1'
+            else:
+                rec_vig = '0'
+            if feature['act_aterm'] is True:
+                rec_vig_aterm = '1'
+            else:
+                rec_vig_aterm = '0'
 
         return rec_data, rec_tipus, rec_vig, rec_vig_aterm
 
     def get_mtt_data(self, line_id):
         """ Get the line's MTT data """
         mtt_data, mtt_abast, mtt_vig = ('',) * 3
-        mtt_table = self.pg_adt.get_table('memoria_treb_top')
-        mtt_table.selectByExpression(f'"id_linia"=\'{line_id}\' and "vig_mtt" is True',
-                                     QgsVectorLayer.SetSelection)
-        if mtt_table.selectedFeatureCount() == 1:
-            for feature in mtt_table.getSelectedFeatures():
-                mtt_data = feature['data_doc'].toString('yyyyMMdd')
-                mtt_abast = feature['abast_mtt']
-                if feature['vig_mtt'] is True:
-                    mtt_vig = '1'
-                else:
-                    mtt_vig = '0'
-        elif mtt_table.selectedFeatureCount() > 1:
-            date_list = []
-            for feature in mtt_table.getSelectedFeatures():
-                date_list.append(feature['data_doc'].toString('yyyyMMdd'))
-            newest = max(date_list)
-            for feature in mtt_table.getSelectedFeatures():
-                if feature['data'] == newest:
-                    mtt_data = newest
-                    mtt_abast = feature['abast_mtt']
-                    if feature['vig_mtt'] is True:
-                        mtt_vig = '1'
-                    else:
-                        mtt_vig = '0'
-                    break
+        feature = self.get_newest_feature(self.mtt_features.get(line_id), 'data_doc')
+        if feature is not None:
+            mtt_data = feature['data_doc'].toString('yyyyMMdd')
+            mtt_abast = feature['abast_mtt']
+            if feature['vig_mtt'] is True:
+                mtt_vig = '1'
+            else:
+                mtt_vig = '0'
 
         return mtt_data, mtt_abast, mtt_vig
 
@@ -1386,8 +1438,8 @@ class GeneradorMMCMetadataTable(GeneradorMMC):
 
 class GeneradorMMCMetadata(GeneradorMMC):
 
-    def __init__(self, municipality_id, data_alta, coast=False):
-        GeneradorMMC.__init__(self, municipality_id, data_alta, coast)
+    def __init__(self, municipality_id, data_alta, coast=False, context=None):
+        GeneradorMMC.__init__(self, municipality_id, data_alta, coast, context)
         self.work_metadatata_file = os.path.join(GENERADOR_WORK_DIR, 'MM_Metadades.xml')
         self.output_metadata_name = f'mapa-municipal-{self.municipality_normalized_name}-ca-{self.municipality_valid_de}.xml'
         self.output_metadata_path = os.path.join(self.output_subdirectory_path, self.output_metadata_name)
@@ -1486,7 +1538,7 @@ class GeneradorMMCMetadata(GeneradorMMC):
     def get_bounding_box(self):
         """ Get the municipality's bounding box """
         polygon_layer = QgsVectorLayer(os.path.join(GENERADOR_WORK_DIR, 'MM_Poligons.shp'))
-        generador_mmc_polygon = GeneradorMMCPolygon(self.municipality_id, self.data_alta, polygon_layer)
+        generador_mmc_polygon = GeneradorMMCPolygon(self.municipality_id, self.data_alta, polygon_layer, self.context)
         x_min, x_max, y_min, y_max = generador_mmc_polygon.return_bounding_box()
 
         return x_min, x_max, y_min, y_max
@@ -1494,12 +1546,11 @@ class GeneradorMMCMetadata(GeneradorMMC):
     def get_line_rec_list(self):
         """ Get a list with all the reconeixements from the municipality's lines """
         rec_list = []
-        rec_table = self.pg_adt.get_table('reconeixement')
-        for feature in self.municipality_metadata_table.getFeatures():
-            line_id = feature['IdLinia']
-            rec_table.selectByExpression(f'"id_linia"=\'{line_id}\' and "vig_act_rec" is True',
-                                         QgsVectorLayer.SetSelection)
-            for rec in rec_table.getSelectedFeatures():
+        lines_id = [feature['IdLinia'] for feature in self.municipality_metadata_table.getFeatures()]
+        rec_features = self.pg_adt.get_grouped_features('reconeixement', 'id_linia', lines_id, '"vig_act_rec" is True',
+                                                        ('tipus_doc_ref',))
+        for line_id in lines_id:
+            for rec in rec_features[int(line_id)]:
                 if rec['tipus_doc_ref'] == 2:
                     rec_list.append(line_id)
 
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ UDTPlugin
+
+In this file is where the LineGraph class is defined. The graph relates the
+municipal boundary lines with their neighbor lines, from the linia_veina
+table, and with the municipalities that share them, from the lines
+dictionary. It's loaded only once per session and shared by all the modules.
+***************************************************************************/
+"""
+
+from ..config import *
+from .dictionaries import load_dictionary, normalize_key
+
+
+# Line graph loaded during the session
+_LINE_GRAPH = None
+
+
+def get_line_graph(pg_adt):
+    """
+    Return the line graph, loading it only if it hasn't been loaded yet during the session. If the lines
+    dictionary has been modified since the graph was loaded, the municipalities of the lines are loaded again
+
+    :param pg_adt: Connection to the ADT PostGIS database
+    :type pg_adt: PgADTConnection
+
+    :return: Line graph
+    :rtype: LineGraph
+    """
+    global _LINE_GRAPH
+    if _LINE_GRAPH is None:
+        _LINE_GRAPH = LineGraph(pg_adt)
+    elif load_dictionary(DIC_LINES) is not _LINE_GRAPH.lines_dictionary:
+        # The dictionaries loader returns a new dictionary when the CSV file's modification time changes
+        _LINE_GRAPH.load_municipalities()
+
+    return _LINE_GRAPH
+
+
+def clear_line_graph():
+    """ Remove the loaded line graph, so that it's loaded again the next time it's requested """
+    global _LINE_GRAPH
+    _LINE_GRAPH = None
+
+
+class LineGraph:
+    """ Graph of the municipal boundary lines, their neighbor lines and the municipalities that share them """
+
+    def __init__(self, pg_adt):
+        """
+        Constructor
+
+        :param pg_adt: Connection to the ADT PostGIS database
+        :type pg_adt: PgADTConnection
+        """
+        # Dictionary with the line ID as key and a tuple with the ID of its neighbor lines as value
+        self.neighbors = {}
+        # Dictionary with the line ID as key and a tuple with the ID of the two municipalities that share it as value
+        self.municipalities = {}
+        # Dictionary with the municipality ID as key and a tuple with the ID of its lines as value
+        self.municipalities_lines = {}
+        # Lines dictionary the municipalities have been loaded from
+        self.lines_dictionary = None
+        self.load_neighbors(pg_adt)
+        self.load_municipalities()
+
+    def load_neighbors(self, pg_adt):
+        """
+        Load the neighbor lines of every line from the linia_veina table
+
+        :param pg_adt: Connection to the ADT PostGIS database
+        :type pg_adt: PgADTConnection
+        """
+        neighbors = {}
+        for feature in pg_adt.get_features('linia_veina', columns=('id_linia', 'id_linia_veina')):
+            neighbors.setdefault(int(feature['id_linia']), []).append(int(feature['id_linia_veina']))
+
+        self.neighbors = {line_id: tuple(neighbor_lines) for line_id, neighbor_lines in neighbors.items()}
+
+    def load_municipalities(self):
+        """ Load the pair of municipalities that share every line from the lines dictionary """
+        self.lines_dictionary = load_dictionary(DIC_LINES)
+        self.municipalities = {}
+        municipalities_lines = {}
+        for line_data in self.lines_dictionary.data:
+            line_id = int(line_data['IDLINIA'])
+            municipalities_id = tuple(to_municipality_id(line_data[field]) for field in ('CODIMUNI1', 'CODIMUNI2'))
+            self.municipalities[line_id] = municipalities_id
+            for municipality_id in municipalities_id:
+                # The coast lines only have one municipality
+                if municipality_id is not None:
+                    municipalities_lines.setdefault(municipality_id, []).append(line_id)
+
+        self.municipalities_lines = {municipality_id: tuple(lines_id)
+                                     for municipality_id, lines_id in municipalities_lines.items()}
+
+    def neighbor_lines(self, line_id):
+        """
+        Get the neighbor lines of a line
+
+        :param line_id: ID of the line
+        :type line_id: int or str
+
+        :return: Tuple with the ID of the neighbor lines
+        :rtype: tuple
+        """
+        return self.neighbors.get(int(line_id), ())
+
+    def line_municipalities(self, line_id):
+        """
+        Get the municipalities that share a line
+
+        :param line_id: ID of the line
+        :type line_id: int or str
+
+        :return: Tuple with the ID of both municipalities, or None if the line doesn't exist
+        :rtype: tuple
+        """
+        return self.municipalities.get(int(line_id))
+
+    def municipality_lines(self, municipality_id):
+        """
+        Get the lines around a municipality
+
+        :param municipality_id: ID of the municipality
+        :type municipality_id: int or str
+
+        :return: Tuple with the ID of the municipality's lines
+        :rtype: tuple
+        """
+        return self.municipalities_lines.get(int(municipality_id), ())
+
+
+def to_municipality_id(value):
+    """
+    Convert a municipality ID from the lines dictionary to an integer
+
+    :param value: Municipality ID as it's stored in the dictionary
+    :type value: str or int
+
+    :return: Municipality ID, or None if the value is not a valid ID
+    :rtype: int
+    """
+    try:
+        municipality_id = int(normalize_key(value))
+    except ValueError:
+        return None
+    # The empty municipality of the coast lines is read from the dictionary as -1
+    return municipality_id if municipality_id > 0 else None
@@ -10,7 +10,6 @@ and generates the metadata of a municipal line.
 """
 
 import os
-import numpy as np
 
 from PyQt5.QtCore import QVariant
 from qgis.core import (QgsVectorLayer,
@@ -22,6 +21,7 @@ from qgis.core import (QgsVectorLayer,
 
 from ..config import *
 from .adt_postgis_connection import PgADTConnection
+from .dictionaries import load_dictionary
 from ..utils import *
 
 # TODO in progress...
@@ -48,10 +48,8 @@ class LineMMC(object):
 
     def check_line_exists_points_layer(self):
         """  """
-        fita_mem_layer = self.pg_adt.get_layer('v_fita_mem', 'id_fita')
-        fita_mem_layer.selectByExpression(f'"id_linia"=\'{int(self.line_id)}\'', QgsVectorLayer.SetSelection)
-        selected_count = fita_mem_layer.selectedFeatureCount()
-        if selected_count > 0:
+        fites_mem = self.pg_adt.get_fites_mem('id_linia', (int(self.line_id),))
+        if fites_mem[int(self.line_id)]:
             return True
         else:
             return False
@@ -141,26 +139,17 @@ class LineMMCPoints(LineMMC):
 
     def fill_fields(self):
         """  """
-        self.work_points_layer.startEditing()
+        # The work points layer is an export of the v_fita_mem view, so it already has the fields needed
+        fields = self.work_points_layer.fields()
+        attributes_map = {}
         for point in self.work_points_layer.getFeatures():
-            point_id_fita = coordinates_to_id_fita(point['point_x'], point['point_y'])
-            point_r_fita = point_num_to_text(point['num_fita'])
-
-            point['IdUFita'] = point['id_u_fita'][:-2]
-            point['IdFita'] = point_id_fita
-            point['IdFitaR'] = point_r_fita
-            point['IdSector'] = point['num_sector']
-            point['NumTermes'] = point['num_termes']
-            point['IdLinia'] = int(point['id_linia'])
+            point_attributes = get_fita_attributes(point)
+            point_attributes['IdLinia'] = int(point['id_linia'])
             # TODO tiene Valid de o Data alta? Preguntar Cesc
-            if point['trobada'] == 1:
-                point['Monument'] = 'S'
-            else:
-                point['Monument'] = 'N'
-
-            self.work_points_layer.updateFeature(point)
+            attributes_map[point.id()] = {fields.lookupField(field_name): value
+                                          for field_name, value in point_attributes.items()}
 
-        self.work_points_layer.commitChanges()
+        self.work_points_layer.dataProvider().changeAttributeValues(attributes_map)
 
     def delete_fields(self):
         """  """
@@ -174,7 +163,7 @@ class LineMMCLines(LineMMC):
     def __init__(self, line_id, lines_layer):
         LineMMC.__init__(self, line_id)
         self.work_lines_layer = lines_layer
-        self.arr_lines_data = np.genfromtxt(DIC_LINES, dtype=None, encoding=None, delimiter=';', names=True)
+        self.dic_lines = load_dictionary(DIC_LINES)
 
     def generate_lines_layer(self):
         """  """
@@ -204,9 +193,9 @@ class LineMMCLines(LineMMC):
         self.work_lines_layer.startEditing()
         for line in self.work_lines_layer.getFeatures():
             line_id = line['id_linia']
-            line_data = self.arr_lines_data[np.where(self.arr_lines_data['IDLINIA'] == line_id)]
+            line_data = self.dic_lines.get('IDLINIA', line_id)
             # Get the Tipus UA type
-            tipus_ua = line_data['TIPUSUA'][0]
+            tipus_ua = line_data['TIPUSUA']
             if tipus_ua == 'M':
                 line['TipusUA'] = 'Municipi'
             elif tipus_ua == 'C':
@@ -218,7 +207,7 @@ class LineMMCLines(LineMMC):
             elif tipus_ua == 'I':
                 line['TipusUA'] = 'Inframunicipal'
             # Get the Limit Vegue type
-            limit_vegue = line_data['LIMVEGUE'][0]
+            limit_vegue = line_data['LIMVEGUE']
             if limit_vegue == 'verdadero':
                 line['LimitVegue'] = 'S'
             else:
@@ -231,9 +220,9 @@ class LineMMCLines(LineMMC):
                 line['TipusLinia'] = 'Exterior'
             # Non dependant fields
             line['IdLinia'] = line_id
-            line['NomTerme1'] = str(line_data['NOMMUNI1'][0])
-            line['NomTerme2'] = str(line_data['NOMMUNI2'][0])
-            line['LimitProvi'] = str(line_data['LIMPROV'][0])
+            line['NomTerme1'] = str(line_data['NOMMUNI1'])
+            line['NomTerme2'] = str(line_data['NOMMUNI2'])
+            line['LimitProvi'] = str(line_data['LIMPROV'])
 
             self.work_lines_layer.updateFeature(line)
 
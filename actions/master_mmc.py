@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ UDTPlugin
+
+In this file is where the MasterMMC class is defined. The main function
+of this class is to manage the master GeoPackage of the Municipal Map of
+Catalonia, where the municipal maps are added or replaced with keyed upserts
+and from where the dated shapefile release is exported.
+***************************************************************************/
+"""
+
+import os
+import sqlite3
+import struct
+
+from PyQt5.QtCore import QVariant, QDate, QDateTime, Qt
+from qgis.core import (QgsVectorLayer,
+                       QgsVectorFileWriter,
+                       QgsCoordinateReferenceSystem,
+                       QgsRectangle,
+                       QgsProject,
+                       QgsMessageLog,
+                       Qgis)
+
+from ..config import *
+
+# Name of the master GeoPackage in the Agregador's work directory
+MASTER_MMC_NAME = 'mmc_master.gpkg'
+# Entity name, GeoPackage layer name, key fields and name of the exported file of every MMC entity
+MASTER_ENTITIES = (('points', 'fites', ('IdFita',), 'fita'),
+                   ('lines', 'linies', ('IdLinia',), 'liniaterme'),
+                   ('polygons', 'poligons', ('CodiMuni',), 'poligon'),
+                   ('coast_lines', 'linies_costa', ('IdLinia',), 'liniacosta'),
+                   ('points_table', 'fitesmmc', ('IdFita', 'IdLinia'), 'fitataula'),
+                   ('lines_table', 'liniesmmc', ('IdLinia', 'CodiMuni'), 'liniatermetaula'),
+                   ('coast_lines_table', 'linies_costammc', ('IdLinia', 'CodiMuni'), 'liniacostataula'),
+                   ('bt5_full_table', 'bt5m', ('IdFullBT5M', 'IdLinia'), 'tallfullbt5m'))
+# Fields with an attribute index in every layer of the master GeoPackage that has them
+MASTER_INDEX_FIELDS = ('IdFita', 'IdLinia', 'CodiMuni')
+
+
+def get_master_mmc_path():
+    """
+    Get the path of the master GeoPackage
+
+    :return: Path of the master GeoPackage
+    :rtype: str
+    """
+    return os.path.join(AGREGADOR_WORK_DIR, MASTER_MMC_NAME)
+
+
+class MasterMMC:
+    """ Master GeoPackage of the Municipal Map of Catalonia """
+
+    def __init__(self, path=None):
+        """
+        Constructor
+
+        :param path: Path of the master GeoPackage. If not given, the one in the Agregador's work directory is used
+        :type path: str
+        """
+        self.path = path if path else get_master_mmc_path()
+        self.crs = QgsCoordinateReferenceSystem("EPSG:25831")
+
+    def exists(self):
+        """
+        Check if the master GeoPackage exists
+
+        :return: Indicates if the master GeoPackage exists
+        :rtype: bool
+        """
+        return os.path.exists(self.path)
+
+    def import_layers(self, layers):
+        """
+        Create the master GeoPackage from the layers of the last Municipal Map of Catalonia
+
+        :param layers: Dictionary with the entity name as key and its layer or table as value
+        :type layers: dict
+        """
+        if self.exists():
+            os.remove(self.path)
+
+        for entity, layer_name, key_fields, export_name in MASTER_ENTITIES:
+            options = QgsVectorFileWriter.SaveVectorOptions()
+            options.driverName = 'GPKG'
+            options.fileEncoding = 'utf-8'
+            options.layerName = layer_name
+            # The upserts are done directly with SQLite, which cannot update the GeoPackage's R-Tree triggers
+            options.layerOptions = ['SPATIAL_INDEX=NO']
+            if self.exists():
+                options.actionOnExistingFile = QgsVectorFileWriter.CreateOrOverwriteLayer
+            QgsVectorFileWriter.writeAsVectorFormatV2(layers[entity], self.path,
+                                                      QgsProject.instance().transformContext(), options)
+
+        self.create_indexes()
+
+    def create_indexes(self):
+        """ Create the attribute indexes of the master GeoPackage's layers """
+        connection = sqlite3.connect(self.path)
+        try:
+            with connection:
+                for entity, layer_name, key_fields, export_name in MASTER_ENTITIES:
+                    columns = self.get_columns(connection, layer_name)
+                    for field_name in MASTER_INDEX_FIELDS:
+                        if field_name in columns:
+                            connection.execute(f'CREATE INDEX IF NOT EXISTS "idx_{layer_name}_{field_name}" '
+                                               f'ON "{layer_name}" ("{field_name}")')
+        finally:
+            connection.close()
+
+    def upsert(self, input_data):
+        """
+        Add or replace the features of a municipal map in the master GeoPackage. All the features of the municipal
+        map's scope, which are the features of its municipalities and its lines, are deleted and the input features
+        are inserted, all of them in a single transaction, so the master GeoPackage is never left with a municipal
+        map half added, nor with the fites or lines removed or renumbered in the new municipal map.
+
+        :param input_data: Dictionary with the entity name as key and a tuple with its fields and features as value
+        :type input_data: dict
+        """
+        connection = sqlite3.connect(self.path)
+        try:
+            with connection:
+                # The scope must be computed before deleting anything, since it's read from the master GeoPackage
+                scope = self.get_scope(connection, input_data)
+                for entity, layer_name, key_fields, export_name in MASTER_ENTITIES:
+                    # The points table is made from the input points layer
+                    fields, features = input_data['points' if entity == 'points_table' else entity]
+                    self.upsert_layer(connection, layer_name, key_fields, fields, features, scope)
+        finally:
+            connection.close()
+
+        QgsMessageLog.logMessage('Mapa municipal afegit al GeoPackage mestre', level=Qgis.Info)
+
+    def get_scope(self, connection, input_data):
+        """
+        Get the scope of a municipal map, which are its municipalities, its lines and its fites. The lines are the
+        input ones and the ones that the municipalities had in the master GeoPackage, and the fites are the ones that
+        only belong to those lines in the master GeoPackage, so the removed or renumbered lines and fites are also
+        replaced
+
+        :param connection: Connection to the master GeoPackage
+        :type connection: sqlite3.Connection
+
+        :param input_data: Dictionary with the entity name as key and a tuple with its fields and features as value
+        :type input_data: dict
+
+        :return: scope: Dictionary with the field name, CodiMuni, IdLinia or IdFita, as key and the set of its values
+                        as value
+        :rtype: dict
+        """
+        scope = {'CodiMuni': get_field_values(*input_data['polygons'], 'CodiMuni'), 'IdLinia': set(), 'IdFita': set()}
+        for entity in ('lines', 'coast_lines', 'lines_table', 'coast_lines_table'):
+            scope['IdLinia'].update(get_field_values(*input_data[entity], 'IdLinia'))
+        for layer_name in ('liniesmmc', 'linies_costammc'):
+            for codi_muni in scope['CodiMuni']:
+                rows = connection.execute(f'SELECT "IdLinia" FROM "{layer_name}" WHERE "CodiMuni" = ?', (codi_muni,))
+                scope['IdLinia'].update(row[0] for row in rows)
+        # A fita of the scope's lines is only replaced if it doesn't belong to any line out of the scope
+        candidate_fites = set()
+        for id_linia in scope['IdLinia']:
+            rows = connection.execute('SELECT "IdFita" FROM "fitesmmc" WHERE "IdLinia" = ?', (id_linia,))
+            candidate_fites.update(row[0] for row in rows)
+        for id_fita in candidate_fites:
+            rows = connection.execute('SELECT "IdLinia" FROM "fitesmmc" WHERE "IdFita" = ?', (id_fita,))
+            if {row[0] for row in rows} <= scope['IdLinia']:
+                scope['IdFita'].add(id_fita)
+
+        return scope
+
+    def upsert_layer(self, connection, layer_name, key_fields, fields, features, scope=None):
+        """
+        Replace the features of a layer of the master GeoPackage that are in the municipal map's scope or that have
+        the same key as the input ones
+
+        :param connection: Connection to the master GeoPackage
+        :type connection: sqlite3.Connection
+
+        :param layer_name: Name of the layer in the master GeoPackage
+        :type layer_name: str
+
+        :param key_fields: Name of the fields that identify a feature
+        :type key_fields: tuple
+
+        :param fields: Fields of the input features
+        :type fields: QgsFields
+
+        :param features: Input features
+        :type features: list
+
+        :param scope: Dictionary with the field name, CodiMuni, IdLinia or IdFita, as key and the set of its values
+                      as value
+        :type scope: dict
+        """
+        geometry_column, srs_id = self.get_geometry_column(connection, layer_name)
+        columns = [column for column in self.get_columns(connection, layer_name) if column != geometry_column]
+        # Delete the features of the municipal map's scope, by municipality if the layer has it, by line otherwise or
+        # by fita if the layer only has the fita
+        for field_name in ('CodiMuni', 'IdLinia', 'IdFita'):
+            if scope and field_name in columns:
+                connection.executemany(f'DELETE FROM "{layer_name}" WHERE "{field_name}" = ?',
+                                       ((value,) for value in scope[field_name]))
+                break
+
+        # Index of every column in the input fields, or -1 if the input doesn't have it
+        fields_map = [fields.lookupField(column) for column in columns]
+        key_map = [fields.lookupField(field_name) for field_name in key_fields]
+        if not features or -1 in key_map:
+            return
+
+        rows = {}
+        # Extent of the input geometries
+        extent = None
+        for feature in features:
+            attributes = feature.attributes()
+            key = tuple(to_sqlite_value(attributes[index]) for index in key_map)
+            row = [to_sqlite_value(attributes[index]) if index >= 0 else None for index in fields_map]
+            if geometry_column:
+                row.append(to_gpkg_geometry(feature.geometry(), srs_id) if feature.hasGeometry() else None)
+                if feature.hasGeometry():
+                    if extent is None:
+                        extent = QgsRectangle(feature.geometry().boundingBox())
+                    else:
+                        extent.combineExtentWith(feature.geometry().boundingBox())
+            # If a feature is duplicated in the input, only the last one is kept
+            rows[key] = row
+
+        if geometry_column:
+            columns.append(geometry_column)
+        key_clause = ' and '.join(f'"{field_name}" = ?' for field_name in key_fields)
+        columns_str = ', '.join(f'"{column}"' for column in columns)
+        values_str = ', '.join('?' * len(columns))
+        connection.executemany(f'DELETE FROM "{layer_name}" WHERE {key_clause}', rows.keys())
+        connection.executemany(f'INSERT INTO "{layer_name}" ({columns_str}) VALUES ({values_str})', rows.values())
+        if extent is not None:
+            self.update_extent(connection, layer_name, extent)
+
+    @staticmethod
+    def update_extent(connection, layer_name, extent):
+        """
+        Update the extent of a layer in the gpkg_contents table of the master GeoPackage, adding the given extent to
+        the current one
+
+        :param connection: Connection to the master GeoPackage
+        :type connection: sqlite3.Connection
+
+        :param layer_name: Name of the layer in the master GeoPackage
+        :type layer_name: str
+
+        :param extent: Extent of the inserted features
+        :type extent: QgsRectangle
+        """
+        current_extent = connection.execute('SELECT min_x, min_y, max_x, max_y FROM gpkg_contents '
+                                            'WHERE table_name = ?', (layer_name,)).fetchone()
+        if current_extent and None not in current_extent:
+            extent.combineExtentWith(QgsRectangle(*current_extent))
+        connection.execute("UPDATE gpkg_contents SET min_x = ?, min_y = ?, max_x = ?, max_y = ?, "
+                           "last_change = strftime('%Y-%m-%dT%H:%M:%fZ', 'now') WHERE table_name = ?",
+                           (extent.xMinimum(), extent.yMinimum(), extent.xMaximum(), extent.yMaximum(), layer_name))
+
+    def export_release(self, output_directory, date):
+        """
+        Export the master GeoPackage as the dated shapefile release of the Municipal Map of Catalonia
+
+        :param output_directory: Directory where the release is exported
+        :type output_directory: str
+
+        :param date: Date of the release, with the format YYYYMMDD
+        :type date: str
+        """
+        for layer_name, layer in self.get_layers().items():
+            export_name = [entity[3] for entity in MASTER_ENTITIES if entity[1] == layer_name][0]
+            output_name = f'mapa-municipal-v1r0-catalunya-{export_name}-{date}.shp'
+            QgsVectorFileWriter.writeAsVectorFormat(layer, os.path.join(output_directory, output_name),
+                                                    'utf-8', self.crs, 'ESRI Shapefile')
+
+    def get_layers(self):
+        """
+        Get the layers of the master GeoPackage
+
+        :return: layers: Dictionary with the layer name as key and the layer as value
+        :rtype: dict
+        """
+        layers = {}
+        for entity, layer_name, key_fields, export_name in MASTER_ENTITIES:
+            layers[layer_name] = QgsVectorLayer(f'{self.path}|layername={layer_name}', layer_name, 'ogr')
+
+        return layers
+
+    @staticmethod
+    def get_columns(connection, layer_name):
+        """
+        Get the attribute columns of a layer of the master GeoPackage, without the primary key
+
+        :param connection: Connection to the master GeoPackage
+        :type connection: sqlite3.Connection
+
+        :param layer_name: Name of the layer in the master GeoPackage
+        :type layer_name: str
+
+        :return: List with the name of the columns
+        :rtype: list
+        """
+        # The table_info rows are (cid, name, type, notnull, dflt_value, pk)
+        table_info = connection.execute(f'PRAGMA table_info("{layer_name}")').fetchall()
+        return [column[1] for column in table_info if not column[5]]
+
+    @staticmethod
+    def get_geometry_column(connection, layer_name):
+        """
+        Get the geometry column of a layer of the master GeoPackage and its SRS ID
+
+        :param connection: Connection to the master GeoPackage
+        :type connection: sqlite3.Connection
+
+        :param layer_name: Name of the layer in the master GeoPackage
+        :type layer_name: str
+
+        :return: Name of the geometry column and its SRS ID, or None and 0 if the layer is a table
+        :rtype: tuple
+        """
+        geometry_column = connection.execute('SELECT column_name, srs_id FROM gpkg_geometry_columns '
+                                             'WHERE table_name = ?', (layer_name,)).fetchone()
+        if geometry_column:
+            return geometry_column
+
+        return None, 0
+
+
+def get_field_values(fields, features, field_name):
+    """
+    Get the values of a field of a list of features
+
+    :param fields: Fields of the features
+    :type fields: QgsFields
+
+    :param features: List of features
+    :type features: list
+
+    :param field_name: Name of the field
+    :type field_name: str
+
+    :return: Set with the values of the field, or an empty set if the features don't have it
+    :rtype: set
+    """
+    index = fields.lookupField(field_name)
+    if index == -1:
+        return set()
+
+    return {to_sqlite_value(feature.attributes()[index]) for feature in features}
+
+
+def to_gpkg_geometry(geometry, srs_id):
+    """
+    Convert a geometry to a GeoPackage geometry blob, which is the WKB with the GeoPackage header
+
+    :param geometry: Geometry to convert
+    :type geometry: QgsGeometry
+
+    :param srs_id: SRS ID of the geometry column
+    :type srs_id: int
+
+    :return: GeoPackage geometry blob
+    :rtype: bytes
+    """
+    # Header: magic 'GP', version 0, flags 1 (little endian, without envelope) and the SRS ID
+    header = b'GP' + bytes((0, 1)) + struct.pack('<i', srs_id)
+    return header + bytes(geometry.asWkb())
+
+
+def to_sqlite_value(value):
+    """
+    Convert an attribute value to a value that can be stored with SQLite
+
+    :param value: Attribute value
+    :type value: object
+
+    :return: SQLite value
+    :rtype: object
+    """
+    if isinstance(value, QVariant):
+        return None if value.isNull() else value.value()
+    elif isinstance(value, QDate):
+        return value.toString('yyyy-MM-dd') if value.isValid() else None
+    elif isinstance(value, QDateTime):
+        return value.toString(Qt.ISODate) if value.isValid() else None
+
+    return value
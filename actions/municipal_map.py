@@ -10,7 +10,6 @@ and make the layout editable for the user.
 ***************************************************************************/
 """
 
-import numpy as np
 import os
 import shutil
 
@@ -28,6 +27,7 @@ from qgis.core.additions.edit import edit
 from ..config import *
 from ..utils import *
 from .adt_postgis_connection import PgADTConnection
+from .dictionaries import load_dictionary
 
 
 class MunicipalMap:
@@ -63,12 +63,9 @@ class MunicipalMap:
         # ADT PostGIS connection
         self.pg_adt = PgADTConnection(HOST, DBNAME, USER, PWD, SCHEMA)
         self.pg_adt.connect()
-        self.rec_table = self.pg_adt.get_table('reconeixement')
-        self.dogc_table = self.pg_adt.get_table('pa_pub_dogc')
-        self.mtt_table = self.pg_adt.get_table('memoria_treb_top')
         self.project = QgsProject.instance()
-        self.arr_municipality_data = np.genfromtxt(LAYOUT_MUNI_DATA, dtype=None, encoding='utf-8-sig', delimiter=';', names=True)
-        self.arr_lines_data = np.genfromtxt(LAYOUT_LINE_DATA, dtype=None, encoding='utf-8-sig', delimiter=';', names=True)
+        self.dic_municipality_data = load_dictionary(LAYOUT_MUNI_DATA, 'utf-8-sig')
+        self.dic_lines = load_dictionary(LAYOUT_LINE_DATA, 'utf-8-sig')
         self.layout_manager = self.project.layoutManager()
         # ######
         # Input dependant
@@ -85,6 +82,8 @@ class MunicipalMap:
         self.municipality_sup = self.get_municipality_sup()
         self.municipality_lines = self.get_municipality_lines()
         self.mtt_dates = {}
+        # Dictionary with the line ID as key and the list of its DOGC publications as value, fetched once
+        self.dogc_features = None
         self.rec_text = self.get_rec_dogc_text()
         self.mtt_text = self.get_mtt_text()
 
@@ -104,9 +103,7 @@ class MunicipalMap:
         :return: muni_nomens: Nomens of the municipality
         :rtype: muni_nomens: str
         """
-        data = np.where(self.arr_municipality_data['id_area'] == f'"{self.municipality_id}"')
-        index = data[0][0]
-        muni_data = self.arr_municipality_data[index]
+        muni_data = self.dic_municipality_data.get('id_area', self.municipality_id)
         muni_name = muni_data[1]
         muni_nomens = muni_data[5]
         QgsMessageLog.logMessage(f'Nom i nomenclatura de municipi: {muni_name}, {muni_nomens}', level=Qgis.Info)
@@ -156,10 +153,12 @@ class MunicipalMap:
         :rtype: tuple
         """
         rec_text_list = []
+        # The actes de reconeixement of all the lines are fetched with a single query
+        lines_rec_features = self.pg_adt.get_grouped_features('reconeixement', 'id_linia', self.municipality_lines,
+                                                              '"vig_act_rec" is True',
+                                                              ('data_act_rec', 'obs_act_rec', 'tipus_doc_ref'))
         for line_id in self.municipality_lines:
-            self.rec_table.selectByExpression(f'"id_linia"={line_id} and "vig_act_rec" is True')
-
-            for rec in self.rec_table.getSelectedFeatures():
+            for rec in lines_rec_features[line_id]:
                 text = ''
                 rec_date = rec['data_act_rec']
                 if isinstance(rec['obs_act_rec'], str):
@@ -205,10 +204,15 @@ class MunicipalMap:
         :rtype: str
         """
         date_ = date.toString("yyyy-MM-dd")
-        self.dogc_table.selectByExpression(f'"id_linia"={line_id} AND "vig_pub_dogc" is True AND '
-                                           f'"data_doc"=\'{date_}\' AND "tip_pub_dogc" != \'2\'')   # tip_pub_dogc = 2 -> Correcció d'errades, que no poden sortir al document
+        if self.dogc_features is None:
+            # The DOGC publications of all the lines are fetched with a single query
+            self.dogc_features = self.pg_adt.get_grouped_features('pa_pub_dogc', 'id_linia', self.municipality_lines,
+                                                                  '"vig_pub_dogc" is True AND "tip_pub_dogc" != \'2\'',   # tip_pub_dogc = 2 -> Correcció d'errades, que no poden sortir al document
+                                                                  ('tit_pub_dogc', 'data_doc'))
         dogc_text = ''
-        for dogc in self.dogc_table.getSelectedFeatures():
+        for dogc in self.dogc_features.get(int(line_id), []):
+            if not dogc['data_doc'] or dogc['data_doc'].toString("yyyy-MM-dd") != date_:
+                continue
             title = dogc['tit_pub_dogc']
             dogc_text = normalize_dogc_title(title)
             break
@@ -223,11 +227,12 @@ class MunicipalMap:
         :rtype: tuple
         """
         mtt_text_list = []
+        # The MTT of all the lines are fetched with a single query
+        lines_mtt_features = self.pg_adt.get_grouped_features('memoria_treb_top', 'id_linia', self.municipality_lines,
+                                                              '"vig_mtt" is True', ('data_doc',))
         for line_id in self.municipality_lines:
             muni_1_nomens, muni_2_nomens = self.get_municipality_nomens(line_id)
-            self.mtt_table.selectByExpression(f'"id_linia" = {line_id} AND "vig_mtt" is True')
-
-            for mtt in self.mtt_table.getSelectedFeatures():
+            for mtt in lines_mtt_features[line_id]:
                 date = mtt['data_doc']
                 self.mtt_dates[line_id] = date.toString("yyyyMMdd")   # Add to the MTT dates dict, will be used later
                 string_date = self.get_string_date(date)
@@ -253,7 +258,7 @@ class MunicipalMap:
         :return: muni_2_nomens - Way to name the second municipality
         :rtype: muni_2_nomens: str
         """
-        muni_data = self.arr_lines_data[np.where(self.arr_lines_data['IDLINIA'] == line_id)][0]
+        muni_data = self.dic_lines.get('IDLINIA', line_id)
         muni_1_nomens = muni_data[3]
         muni_2_nomens = muni_data[4]
 
@@ -10,6 +10,7 @@ of Catalonia with the newest boundary lines.
 """
 
 import datetime
+import hashlib
 import os
 
 from qgis.core import (QgsVectorLayer,
@@ -19,14 +20,18 @@ from qgis.core import (QgsVectorLayer,
                        QgsMessageLog,
                        Qgis,
                        QgsProcessingFeatureSourceDefinition,
+                       QgsProject,
+                       QgsFeatureRequest,
+                       QgsField,
+                       QgsWkbTypes,
                        QgsExpression)
-from qgis.core.additions.edit import edit
+from PyQt5.QtCore import QVariant
 from PyQt5.QtWidgets import QMessageBox
 
 import processing
 
 from ..config import *
-from .adt_postgis_connection import PgADTConnection
+from .adt_postgis_connection import PgADTConnection, get_in_clause
 
 from ..utils import remove_temp_shapefiles
 
@@ -35,14 +40,38 @@ from ..utils import remove_temp_shapefiles
 
 # TODO IMPORTANTE: faltan las líneas y geometrías que no tienen SR
 
+# Maximum number of line IDs sent to the database in a single IN clause
+IN_CLAUSE_CHUNK_SIZE = 500
+# Name of the trams view of every type of line
+TRAMS_VIEWS = {'rep': 'v_tram_linia_rep', 'mtt': 'v_tram_linia_mem'}
+# Field of the delta lines layer with the type of change of every line
+CHANGE_FIELD = 'CANVI'
+# Types of change of a line compared with the previous BM: added, with a new geometry or attributes, with the
+# same geometry and attributes but a new DATAALTA, or removed
+CHANGE_NEW = 'nova'
+CHANGE_MODIFIED = 'modificada'
+CHANGE_REDATED = 'redatada'
+CHANGE_DELETED = 'eliminada'
+
 
 class UpdateBM:
     """ Update BM-5M class """
 
-    def __init__(self, date_last_update):
+    def __init__(self, date_last_update, dissolve_in_db=False):
+        """
+        Constructor
+
+        :param date_last_update: date of the last update, with the format YYYYMMDDHHMM
+        :type date_last_update: str
+
+        :param dissolve_in_db: indicates whether to dissolve the trams of every line in the database, instead of
+                               copying them to the working environment and dissolving them with QGIS
+        :type dissolve_in_db: bool
+        """
         # Initialize instance attributes
         # Common
         self.date_last_update = date_last_update
+        self.dissolve_in_db = dissolve_in_db
         self.crs = QgsCoordinateReferenceSystem("EPSG:25831")
         # ADT PostGIS connection
         self.pg_adt = PgADTConnection(HOST, DBNAME, USER, PWD, SCHEMA)
@@ -59,12 +88,16 @@ class UpdateBM:
         self.lines_work_layer = None
         # Set output layer's path
         self.lines_output_path = os.path.join(UPDATE_BM_OUTPUT_DIR, 'bm5mv21sh0tlm1_NEW_0.shp')
+        self.lines_delta_path = os.path.join(UPDATE_BM_OUTPUT_DIR, 'bm5mv21sh0tlm1_DELTA_0.shp')
         # Report config
         self.report_path = os.path.join(UPDATE_BM_LOG_DIR, f'BM_update_{self.new_data_alta}.txt')
         self.new_rep_list = []
         self.new_rep_parcial_list = []
         self.new_mtt_list = []
         self.new_mtt_parcial_list = []
+        # Dict with the ID of the changed lines as key and a tuple with the type of change and the length
+        # difference as value
+        self.lines_changes = {}
 
     # #####################
     # Getters and setters
@@ -133,23 +166,91 @@ class UpdateBM:
 
         return line_geom_dict
 
+    def get_merged_lines_geometry(self, lines_list, layer_type):
+        """
+        Get the new geometry of every new boundary line, merging its trams in the database
+
+        :param lines_list: list of the new lines ID
+        :type lines_list: list
+
+        :param layer_type: type of the lines layers. Could be 'rep' or 'mtt'
+        :type layer_type: str
+
+        :return: dict with the geometry of every new line
+        :rtype: dict
+        """
+        line_geom_dict = {}
+        if not lines_list:
+            return line_geom_dict
+
+        for expression in self.get_expressions(lines_list):
+            # ST_LineMerge returns a LineString or a MultiLineString, so the geometry type is fixed to MultiLineString
+            query = f'SELECT id_linia, ST_Multi(ST_LineMerge(ST_Union(shape))) AS shape ' \
+                    f'FROM {self.pg_adt.schema}.{TRAMS_VIEWS[layer_type]} WHERE {expression} GROUP BY id_linia'
+            layer = self.pg_adt.get_query_layer(query, 'id_linia', wkb_type=QgsWkbTypes.MultiLineString)
+            if not layer.isValid():
+                raise ValueError(f"No s'han pogut dissoldre els trams de les línies a PostGIS -- {query}")
+            for line in layer.getFeatures():
+                line_geom_dict[int(line['id_linia'])] = line.geometry()
+
+        missing_lines = sorted(set(map(int, lines_list)) - set(line_geom_dict))
+        if missing_lines:
+            QgsMessageLog.logMessage(f"No s'han trobat els trams de les línies: {', '.join(map(str, missing_lines))}",
+                                     level=Qgis.Warning)
+
+        return line_geom_dict
+
+    def get_dissolved_lines_geometry(self, lines_list, layer_type):
+        """
+        Get the new geometry of every new boundary line, dissolving its trams in the database or with QGIS
+
+        :param lines_list: list of the new lines ID
+        :type lines_list: list
+
+        :param layer_type: type of the lines layers. Could be 'rep' or 'mtt'
+        :type layer_type: str
+
+        :return: dict with the geometry of every new line
+        :rtype: dict
+        """
+        if self.dissolve_in_db:
+            return self.get_merged_lines_geometry(lines_list, layer_type)
+
+        line_type = layer_type.upper()
+        new_lines_layer = QgsVectorLayer(os.path.join(UPDATE_BM_WORK_DIR, f'{line_type}_noves_linies.shp'))
+        self.dissolve_line_trams(new_lines_layer, line_type)
+
+        return self.get_lines_geometry(lines_list, layer_type)
+
     @staticmethod
     def get_expression(lines_list):
         """
-        Return a QGIS expression with the given lines ID
+        Return a SQL expression with the given lines ID
 
         :param lines_list: list of the new lines ID
         :type lines_list: list
 
-        :return: QGIS expression to filter by the new lines ID
+        :return: SQL expression to filter by the new lines ID
         :rtype: str
         """
-        expression = f'"id_linia"={lines_list[0]}'
+        return get_in_clause('id_linia', lines_list)
+
+    def get_expressions(self, lines_list):
+        """
+        Return the SQL expressions with the given lines ID, split in chunks so that very long lists of lines don't
+        make a single huge query
 
-        for id_linia in lines_list[1:]:
-            expression = f'{expression} OR "id_linia"={id_linia}'
+        :param lines_list: list of the new lines ID
+        :type lines_list: list
+
+        :return: list of SQL expressions to filter by the new lines ID. There is always at least one expression
+        :rtype: list
+        """
+        if not lines_list:
+            return [self.get_expression(lines_list)]
 
-        return expression
+        return [self.get_expression(lines_list[i:i + IN_CLAUSE_CHUNK_SIZE])
+                for i in range(0, len(lines_list), IN_CLAUSE_CHUNK_SIZE)]
 
     # ####################
     # Date and time management
@@ -194,25 +295,36 @@ class UpdateBM:
         Copy the new lines geometries from the database to the working environment. Only copies the selected
         lines that are ready for updating
         """
-        key = 'id_tram_linia'
-
         # REP
-        rep_layer = self.pg_adt.get_layer('v_tram_linia_rep', key)
-        expression_rep = self.get_expression(self.new_rep_list)
-        rep_layer.selectByExpression(expression_rep)
         rep_path = os.path.join(UPDATE_BM_WORK_DIR, 'REP_noves_linies.shp')
-        QgsVectorFileWriter.writeAsVectorFormat(rep_layer, rep_path, 'utf-8', self.crs,
-                                                'ESRI Shapefile', onlySelected=True)
-        rep_layer.removeSelection()
-
+        self.copy_line_trams(TRAMS_VIEWS['rep'], self.new_rep_list, rep_path)
         # MTT
-        mtt_layer = self.pg_adt.get_layer('v_tram_linia_mem', key)
-        expression_mtt = self.get_expression(self.new_mtt_list)
-        mtt_layer.selectByExpression(expression_mtt)
         mtt_path = os.path.join(UPDATE_BM_WORK_DIR, 'MTT_noves_linies.shp')
-        QgsVectorFileWriter.writeAsVectorFormat(mtt_layer, mtt_path, 'utf-8', self.crs,
-                                                'ESRI Shapefile', onlySelected=True)
-        mtt_layer.removeSelection()
+        self.copy_line_trams(TRAMS_VIEWS['mtt'], self.new_mtt_list, mtt_path)
+
+    def copy_line_trams(self, view_name, lines_list, output_path):
+        """
+        Copy the trams of the given lines from the database to a shapefile. The filter by line ID is sent to the
+        database, chunk by chunk, so only the trams of the new lines are transferred
+
+        :param view_name: name of the trams view in the database
+        :type view_name: str
+
+        :param lines_list: list of the new lines ID
+        :type lines_list: list
+
+        :param output_path: path of the output shapefile
+        :type output_path: str
+        """
+        for i, expression in enumerate(self.get_expressions(lines_list)):
+            layer = self.pg_adt.get_layer(view_name, 'id_tram_linia', expression)
+            options = QgsVectorFileWriter.SaveVectorOptions()
+            options.driverName = 'ESRI Shapefile'
+            options.fileEncoding = 'utf-8'
+            if i > 0:
+                options.actionOnExistingFile = QgsVectorFileWriter.AppendToLayerNoNewFields
+            QgsVectorFileWriter.writeAsVectorFormatV2(layer, output_path, QgsProject.instance().transformContext(),
+                                                      options)
 
     @staticmethod
     def dissolve_line_trams(line_layer, line_type):
@@ -230,65 +342,131 @@ class UpdateBM:
         processing.run("native:dissolve", params)
 
     def update_new_lines(self):
-        """ Endpoint to update the new lines geometries and attributes """
-        self.update_new_rep()
-        self.update_new_mtt()
-
-    def update_new_rep(self):
-        """ Update the geometries and attributes of the new REP lines """
-        new_rep_lines_layer = QgsVectorLayer(os.path.join(UPDATE_BM_WORK_DIR, 'REP_noves_linies.shp'))
-        # Dissolve the replantejament's lines layer
-        self.dissolve_line_trams(new_rep_lines_layer, 'REP')
-        # Get a dict with the new lines's geometry and its ID
-        rep_lines_geom = self.get_lines_geometry(self.new_rep_list, 'rep')
-
-        with edit(self.lines_work_layer):
-            for line in self.lines_work_layer.getFeatures():
-                line_id = line['IDLINIA']
-                if line_id in self.new_rep_list and line_id in rep_lines_geom:
-                    new_line_geom = rep_lines_geom[line_id]
-                    self.lines_work_layer.changeGeometry(line.id(), new_line_geom)
-
-        # Loop again to update attributes
-        # It seems not compatible to update the geometry and the attributes in the same loop
-        with edit(self.lines_work_layer):
-            for line in self.lines_work_layer.getFeatures():
-                line_id = line['IDLINIA']
-                if line_id in self.new_rep_list and line_id in rep_lines_geom:
-                    line['ESTAT'] = 1
-                    line['DATAALTA'] = self.new_data_alta
-                    self.lines_work_layer.updateFeature(line)
-
-    def update_new_mtt(self):
-        """ Update the geometries and the attributes of the new MTT lines """
-        new_mtt_lines_layer = QgsVectorLayer(os.path.join(UPDATE_BM_WORK_DIR, 'MTT_noves_linies.shp'))
-        # Dissolve the replantejament's lines layer
-        self.dissolve_line_trams(new_mtt_lines_layer, 'MTT')
-        # Get a dict with the new lines's geometry and its ID
-        mtt_lines_geom = self.get_lines_geometry(self.new_mtt_list, 'mtt')
-
-        with edit(self.lines_work_layer):
-            for line in self.lines_work_layer.getFeatures():
-                line_id = line['IDLINIA']
-                if line_id in self.new_mtt_list and line_id in mtt_lines_geom:
-                    new_line_geom = mtt_lines_geom[line_id]
-                    self.lines_work_layer.changeGeometry(line.id(), new_line_geom)
-
-        # Loop again to update attributes.
-        # It seems not compatible to update the geometry and the attributes in the same loop
-        with edit(self.lines_work_layer):
-            for line in self.lines_work_layer.getFeatures():
-                line_id = line['IDLINIA']
-                if line_id in self.new_mtt_list and line_id in mtt_lines_geom:
-                    line['ESTAT'] = 2
-                    line['DATAALTA'] = self.new_data_alta
-                    self.lines_work_layer.updateFeature(line)
+        """ Update the geometries and attributes of the new REP and MTT lines, in a single pass """
+        # Get a dict with the new lines's geometry and its ID, dissolving the trams of every line
+        rep_lines_geom = self.get_dissolved_lines_geometry(self.new_rep_list, 'rep')
+        mtt_lines_geom = self.get_dissolved_lines_geometry(self.new_mtt_list, 'mtt')
+        # Dict with the line ID as key and a tuple with its new geometry and its ESTAT as value.
+        # When a line has both a new REP and a new MTT, the MTT takes precedence, so it's added last
+        new_lines = {}
+        for line_id, line_geom in rep_lines_geom.items():
+            new_lines[line_id] = (line_geom, 1)
+        for line_id, line_geom in mtt_lines_geom.items():
+            new_lines[line_id] = (line_geom, 2)
+
+        lines_index = self.get_lines_index()
+        estat_index = self.lines_work_layer.fields().lookupField('ESTAT')
+        data_alta_index = self.lines_work_layer.fields().lookupField('DATAALTA')
+        geometry_map = {}
+        attributes_map = {}
+        for line_id, (line_geom, estat) in new_lines.items():
+            for fid in lines_index.get(line_id, ()):
+                geometry_map[fid] = line_geom
+                attributes_map[fid] = {estat_index: estat, data_alta_index: self.new_data_alta}
+
+        provider = self.lines_work_layer.dataProvider()
+        provider.changeGeometryValues(geometry_map)
+        provider.changeAttributeValues(attributes_map)
+        self.lines_work_layer.reload()
+
+    def get_lines_index(self):
+        """
+        Get the index of the working lines layer by line ID
+
+        :return: lines_index: Dictionary with the line ID as key and the list of its features' ID as value
+        :rtype: dict
+        """
+        lines_index = {}
+        request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(['IDLINIA'], self.lines_work_layer.fields())
+        for line in self.lines_work_layer.getFeatures(request):
+            lines_index.setdefault(int(line['IDLINIA']), []).append(line.id())
+
+        return lines_index
 
     def export_lines_layer(self):
         """ Export the working lines layer as the output lines layer, with all the updated data """
         QgsVectorFileWriter.writeAsVectorFormat(self.lines_work_layer, self.lines_output_path, 'utf-8', self.crs,
                                                 'ESRI Shapefile')
 
+    # ####################
+    # Change detection
+    @staticmethod
+    def get_lines_hashes(layer):
+        """
+        Get the hash of the geometry and the key attributes of every line of a lines layer. The DATAALTA is not
+        part of the hash, so that the redated lines can be told apart from the modified ones. When a line has
+        several features, the hashes of all of them are combined, sorted so that their order doesn't matter
+
+        :param layer: lines layer
+        :type layer: QgsVectorLayer
+
+        :return: lines_hashes: dict with the line ID as key and a tuple with the hash, the DATAALTA and the length
+                               of the line as value
+        :rtype: dict
+        """
+        lines_parts = {}
+        fields = [field.name() for field in layer.fields() if field.name().upper() != 'DATAALTA']
+        for line in layer.getFeatures():
+            part_hash = hashlib.sha1()
+            part_hash.update(bytes(line.geometry().asWkb()))
+            for field in fields:
+                part_hash.update(f'|{line[field]}'.encode('utf-8'))
+            lines_parts.setdefault(int(line['IDLINIA']), []).append((part_hash.hexdigest(), str(line['DATAALTA']),
+                                                                      line.geometry().length()))
+
+        lines_hashes = {}
+        for line_id, parts in lines_parts.items():
+            line_hash = hashlib.sha1('|'.join(sorted(part[0] for part in parts)).encode('utf-8')).hexdigest()
+            data_alta = tuple(sorted(part[1] for part in parts))
+            lines_hashes[line_id] = (line_hash, data_alta, sum(part[2] for part in parts))
+
+        return lines_hashes
+
+    def detect_lines_changes(self):
+        """ Compare the updated lines with the lines of the previous BM and get the lines that have changed """
+        previous_hashes = self.get_lines_hashes(self.lines_input_layer)
+        lines_hashes = self.get_lines_hashes(self.lines_work_layer)
+        for line_id, (line_hash, data_alta, length) in lines_hashes.items():
+            if line_id not in previous_hashes:
+                self.lines_changes[line_id] = (CHANGE_NEW, length)
+                continue
+            previous_hash, previous_data_alta, previous_length = previous_hashes[line_id]
+            if line_hash != previous_hash:
+                self.lines_changes[line_id] = (CHANGE_MODIFIED, length - previous_length)
+            elif data_alta != previous_data_alta:
+                self.lines_changes[line_id] = (CHANGE_REDATED, 0)
+        for line_id, (previous_hash, previous_data_alta, previous_length) in previous_hashes.items():
+            if line_id not in lines_hashes:
+                self.lines_changes[line_id] = (CHANGE_DELETED, -previous_length)
+
+    def export_delta_layer(self):
+        """ Export the changed lines as the delta lines layer, with the type of change of every line """
+        geometry_type = QgsWkbTypes.displayString(self.lines_work_layer.wkbType())
+        delta_layer = QgsVectorLayer(f'{geometry_type}?crs=EPSG:25831', 'delta', 'memory')
+        delta_provider = delta_layer.dataProvider()
+        delta_provider.addAttributes(self.lines_work_layer.fields().toList())
+        delta_provider.addAttributes([QgsField(CHANGE_FIELD, QVariant.String, len=10)])
+        delta_layer.updateFields()
+
+        features = []
+        # The deleted lines are only in the previous BM, and the rest of changed lines are in the updated one
+        for layer, deleted in ((self.lines_work_layer, False), (self.lines_input_layer, True)):
+            for line in layer.getFeatures():
+                line_id = int(line['IDLINIA'])
+                if line_id not in self.lines_changes:
+                    continue
+                change_type = self.lines_changes[line_id][0]
+                if (change_type == CHANGE_DELETED) != deleted:
+                    continue
+                line.setFields(delta_layer.fields(), False)
+                line.setAttributes(line.attributes() + [change_type])
+                features.append(line)
+        delta_provider.addFeatures(features)
+
+        QgsVectorFileWriter.writeAsVectorFormat(delta_layer, self.lines_delta_path, 'utf-8', self.crs,
+                                                'ESRI Shapefile')
+
     # #####################
     # Municipality base update
     def update_bm(self):
@@ -302,9 +480,13 @@ class UpdateBM:
         self.write_report()
         try:
             self.copy_data_to_work()
-            self.copy_sidm3_to_work()
+            if not self.dissolve_in_db:
+                self.copy_sidm3_to_work()
             self.update_new_lines()
             self.export_lines_layer()
+            self.detect_lines_changes()
+            self.export_delta_layer()
+            self.write_changes_report()
         except Exception as e:
             msg = f"-- ATENCIÓ -- El procés d'actualització no s'ha dut a terme correctament -- {e}"
             QgsMessageLog.logMessage(msg, level=Qgis.Warning)
@@ -394,6 +576,22 @@ class UpdateBM:
             f.write("-------------------------\n")
             f.write("\nImportant: els Replantejaments o MTT parcials o on falten trams no s'han actualitzat. S'ha de fer manualment.\n")
 
+    def write_changes_report(self):
+        """ Write the statistics of the lines that have changed since the previous BM in the log report """
+        with open(self.report_path, 'a+') as f:
+            f.write("\n")
+            f.write("Canvis respecte la BM anterior:\n")
+            f.write("-------------------------\n")
+            for change_type, label in ((CHANGE_NEW, 'noves'), (CHANGE_MODIFIED, 'modificades'),
+                                       (CHANGE_REDATED, 'amb nova data d\'alta'), (CHANGE_DELETED, 'eliminades')):
+                lines_id = [line_id for line_id, change in self.lines_changes.items() if change[0] == change_type]
+                f.write(f'Nº de línies {label}: {len(lines_id)}\n')
+            f.write(f'Nº total de línies de la capa delta: {len(self.lines_changes)}\n')
+            f.write("-------------------------\n")
+            f.write("Línia      Canvi           Diferència de longitud (m)\n")
+            for line_id, (change_type, length_difference) in sorted(self.lines_changes.items()):
+                f.write(f'{line_id:<10} {change_type:<15} {length_difference:.2f}\n')
+
 
 if __name__ == '__main__':
     date_ = input("Última data d'alta: ")
@@ -0,0 +1,45 @@
+# coding=utf-8
+"""ADT PostGIS connection helpers test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'Francisco.Martin@icgc.cat'
+__date__ = '2021-04-08'
+__copyright__ = 'Copyright 2021, ICGC'
+
+import unittest
+
+from ..actions.adt_postgis_connection import get_in_clause, quote_value, is_null
+
+
+class InClauseTest(unittest.TestCase):
+    """Test the SQL clauses sent to the database."""
+
+    def test_in_clause(self):
+        """Test that the values are quoted and listed."""
+        self.assertEqual(get_in_clause('id_linia', (45, 1045)), '"id_linia" IN (\'45\', \'1045\')')
+
+    def test_empty_in_clause(self):
+        """Test that an empty list of values doesn't match any row."""
+        self.assertEqual(get_in_clause('id_linia', ()), 'FALSE')
+
+    def test_quote_value(self):
+        """Test that the single quotes are escaped."""
+        self.assertEqual(quote_value("L'Hospitalet"), "'L''Hospitalet'")
+
+    def test_is_null(self):
+        """Test that only the missing values are NULL."""
+        self.assertTrue(is_null(None))
+        self.assertFalse(is_null(0))
+        self.assertFalse(is_null(''))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(InClauseTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,69 @@
+# coding=utf-8
+"""Batch DocDelim processing test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'Francisco.Martin@icgc.cat'
+__date__ = '2021-04-08'
+__copyright__ = 'Copyright 2021, ICGC'
+
+import os
+import tempfile
+import unittest
+
+from ..actions.batch_doc_delim import BatchDocDelim, check_doc_delim, get_python_executable
+
+
+class BatchDocDelimTest(unittest.TestCase):
+    """Test the search and the validation of the DocDelim directories."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.temp_directory = tempfile.TemporaryDirectory()
+        self.root_directory = self.temp_directory.name
+        self.doc_delim = self.make_doc_delim('DocDelim_1', (os.path.join('Cartografia', 'Punt.shp'),
+                                                            os.path.join('Cartografia', 'Lin_TramPpta.shp')))
+        self.make_doc_delim(os.path.join('Linies', 'DocDelim_2'), ())
+        os.makedirs(os.path.join(self.root_directory, 'Altres'))
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.temp_directory.cleanup()
+
+    def make_doc_delim(self, name, files):
+        """Make a DocDelim directory with the given files."""
+        doc_delim = os.path.join(self.root_directory, name)
+        for directory in ('Cartografia', 'Taules'):
+            os.makedirs(os.path.join(doc_delim, directory))
+        for file in files:
+            open(os.path.join(doc_delim, file), 'w').close()
+
+        return doc_delim
+
+    def test_find_doc_delims(self):
+        """Test that only the directories with the Cartografia and Taules directories are found."""
+        batch_doc_delim = BatchDocDelim(self.root_directory)
+        self.assertEqual(batch_doc_delim.find_doc_delims(),
+                         [self.doc_delim, os.path.join(self.root_directory, 'Linies', 'DocDelim_2')])
+
+    def test_check_doc_delim(self):
+        """Test that the missing files of every process are reported."""
+        self.assertEqual(check_doc_delim(self.doc_delim, ('decimetritzador',)), [])
+        self.assertEqual(check_doc_delim(self.doc_delim, ('poligonal',)),
+                         [f"Falta el fitxer {os.path.join('Cartografia', 'Pto_Polig.shp')}",
+                          f"Falta el fitxer {os.path.join('Taules', 'POLIGONA.dbf')}"])
+
+    def test_python_executable(self):
+        """Test that the Python interpreter exists."""
+        self.assertTrue(os.path.isfile(get_python_executable()))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(BatchDocDelimTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
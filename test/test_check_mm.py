@@ -0,0 +1,47 @@
+# coding=utf-8
+"""Check new MM watermark test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'Francisco.Martin@icgc.cat'
+__date__ = '2021-04-08'
+__copyright__ = 'Copyright 2021, ICGC'
+
+import unittest
+
+from ..actions.check_mm import get_watermark_clause, get_lost_keys_query, join_where
+
+
+class WatermarkTest(unittest.TestCase):
+    """Test the filtering of the records changed since the last check."""
+
+    def test_watermark_clause(self):
+        """Test that the records dated the same day as the watermark are included."""
+        self.assertEqual(get_watermark_clause('data_doc', '2021-04-08'),
+                         '("data_doc" != \'9999-12-31\') and ("data_doc" >= \'2021-04-08\')')
+
+    def test_no_watermark_clause(self):
+        """Test that all the dated records are included when there is no watermark."""
+        self.assertEqual(get_watermark_clause('data_doc', None), '("data_doc" != \'9999-12-31\')')
+
+    def test_lost_keys_query(self):
+        """Test that the vigent records of the keys of the last check are counted by the database."""
+        self.assertEqual(get_lost_keys_query('adt.memoria_treb_top', 'id_linia', 'vig_mtt', [45, 1045], '= 0'),
+                         'SELECT k.key AS "id_linia" FROM unnest(ARRAY[\'45\', \'1045\']::text[]) AS k(key) '
+                         'WHERE (SELECT count(*) FROM adt.memoria_treb_top t WHERE t."id_linia"::text = k.key '
+                         'AND t."vig_mtt" IS TRUE) = 0')
+
+    def test_join_where(self):
+        """Test that the empty clauses are ignored."""
+        self.assertEqual(join_where('a = 1', '', 'b = 2'), '(a = 1) and (b = 2)')
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(WatermarkTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
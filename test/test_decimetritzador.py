@@ -0,0 +1,85 @@
+# coding=utf-8
+"""Decimetritzador snap grid test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'Francisco.Martin@icgc.cat'
+__date__ = '2021-04-08'
+__copyright__ = 'Copyright 2021, ICGC'
+
+import unittest
+
+import numpy as np
+
+from ..actions.decimetritzador import SnapGrid, get_displacement_stats, SNAP_TOLERANCE, ROUNDING_BOUND
+
+
+class SnapGridTest(unittest.TestCase):
+    """Test the snapping of the coincident vertices to the same decimetre vertex."""
+
+    def test_round(self):
+        """Test that a vertex without coincident vertices is rounded."""
+        snapped = SnapGrid().snap(np.array([[400000.04, 4600000.26]]))
+        np.testing.assert_allclose(snapped, [[400000.0, 4600000.3]])
+
+    def test_snap_to_anchor(self):
+        """Test that a vertex snaps to the decimetre vertex of a coincident anchor."""
+        snap_grid = SnapGrid()
+        snap_grid.snap(np.array([[400000.04, 4600000.0]]), anchors=True)
+        snapped = snap_grid.snap(np.array([[400000.07, 4600000.0]]))
+        np.testing.assert_allclose(snapped, [[400000.0, 4600000.0]])
+
+    def test_anchors_not_snapped(self):
+        """Test that the anchors are only rounded."""
+        snapped = SnapGrid().snap(np.array([[400000.04, 4600000.0], [400000.07, 4600000.0]]), anchors=True)
+        np.testing.assert_allclose(snapped, [[400000.0, 4600000.0], [400000.1, 4600000.0]])
+
+    def test_snap_chain(self):
+        """Test that a chain of coincident vertices snaps together without moving a vertex too far."""
+        snap_grid = SnapGrid()
+        first = snap_grid.snap(np.array([[400000.04, 4600000.0], [400000.08, 4600000.0]]))
+        second = snap_grid.snap(np.array([[400000.12, 4600000.0], [400000.5, 4600000.0]]))
+        np.testing.assert_allclose(first, [[400000.0, 4600000.0], [400000.0, 4600000.0]])
+        # The vertex would move 0.12 m to the decimetre vertex of the chain, so it's only rounded
+        np.testing.assert_allclose(second, [[400000.1, 4600000.0], [400000.5, 4600000.0]])
+
+    def test_long_chain_bounded(self):
+        """Test that no vertex of a long chain of coincident vertices moves farther than the bound."""
+        coordinates = np.column_stack((400000.0 + 0.04 * np.arange(20), np.full(20, 4600000.0)))
+        snapped = SnapGrid().snap(coordinates)
+        self.assertLessEqual(np.max(np.hypot(*(snapped - coordinates).T)), SNAP_TOLERANCE + ROUNDING_BOUND)
+
+    def test_short_tram_not_collapsed(self):
+        """Test that the endpoints of a tram shorter than the tolerance are not snapped to the same vertex."""
+        snapped = SnapGrid().snap(np.array([[400000.04, 4600000.0], [400000.07, 4600000.0]]), tram_endpoints=True)
+        np.testing.assert_allclose(snapped, [[400000.0, 4600000.0], [400000.1, 4600000.0]])
+
+
+class DisplacementStatsTest(unittest.TestCase):
+    """Test the displacement statistics of the changed vertices."""
+
+    def test_displacement_stats(self):
+        """Test that only the changed vertices are counted."""
+        coordinates = np.array([[0.0, 0.0], [0.03, 0.04], [1.0, 1.06]])
+        snapped = np.array([[0.0, 0.0], [0.0, 0.0], [1.0, 1.1]])
+        count, max_displacement, mean_displacement = get_displacement_stats(coordinates, snapped,
+                                                                            np.array([False, True, True]))
+        self.assertEqual(count, 2)
+        self.assertAlmostEqual(max_displacement, 0.05)
+        self.assertAlmostEqual(mean_displacement, 0.045)
+
+    def test_no_displacement(self):
+        """Test the statistics when no vertex is changed."""
+        self.assertEqual(get_displacement_stats(np.zeros((2, 2)), np.zeros((2, 2)), np.array([False, False])),
+                         (0, 0.0, 0.0))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(SnapGridTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,76 @@
+# coding=utf-8
+"""Dictionaries test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'Francisco.Martin@icgc.cat'
+__date__ = '2021-04-08'
+__copyright__ = 'Copyright 2021, ICGC'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ..actions.dictionaries import Dictionary, normalize_key
+
+
+class NormalizeKeyTest(unittest.TestCase):
+    """Test the normalization of the dictionaries' keys."""
+
+    def test_integer_and_padded_string(self):
+        """Test that an integer and its zero-padded text have the same key."""
+        self.assertEqual(normalize_key(45), '45')
+        self.assertEqual(normalize_key('0045'), '45')
+        self.assertEqual(normalize_key('"0045"'), '45')
+
+    def test_zero(self):
+        """Test that a padded zero is not left empty."""
+        self.assertEqual(normalize_key('0000'), '0')
+
+    def test_text(self):
+        """Test that the non numeric keys are only unquoted."""
+        self.assertEqual(normalize_key("'S'"), 'S')
+        self.assertEqual(normalize_key('Abrera'), 'Abrera')
+
+
+class DictionaryTest(unittest.TestCase):
+    """Test the keyed access to a dictionary CSV file."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'lines.csv')
+        with open(self.path, 'w') as f:
+            f.write('IDLINIA;CODIMUNI1;CODIMUNI2;LIMCOSTA\n')
+            f.write('45;1;2;N\n')
+            f.write('1045;2;;S\n')
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.directory)
+
+    def test_get_padded_id(self):
+        """Test that a line is found by its zero-padded ID."""
+        dictionary = Dictionary(self.path)
+        line_data = dictionary.get('IDLINIA', '0045')
+        self.assertIsNotNone(line_data)
+        self.assertEqual(line_data['LIMCOSTA'], 'N')
+        self.assertEqual(dictionary.get('IDLINIA', '1045')['LIMCOSTA'], 'S')
+
+    def test_get_missing_id(self):
+        """Test that a missing line returns None."""
+        dictionary = Dictionary(self.path)
+        self.assertIsNone(dictionary.get('IDLINIA', '0046'))
+        self.assertEqual(dictionary.get_all('IDLINIA', 46), [])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(NormalizeKeyTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,61 @@
+# coding=utf-8
+"""Line graph test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'Francisco.Martin@icgc.cat'
+__date__ = '2021-04-08'
+__copyright__ = 'Copyright 2021, ICGC'
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from ..actions import line_graph
+from ..actions.line_graph import LineGraph, to_municipality_id
+
+
+class LineGraphTest(unittest.TestCase):
+    """Test the municipalities of the lines loaded from the lines dictionary."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'lines.csv')
+        with open(self.path, 'w') as f:
+            f.write('IDLINIA;CODIMUNI1;CODIMUNI2;LIMCOSTA\n')
+            f.write('45;1;2;N\n')
+            f.write('1045;2;;S\n')
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.directory)
+
+    def test_municipality_id(self):
+        """Test that the empty and not valid municipality IDs are None."""
+        self.assertEqual(to_municipality_id('"0002"'), 2)
+        self.assertIsNone(to_municipality_id(-1))
+        self.assertIsNone(to_municipality_id('0'))
+        self.assertIsNone(to_municipality_id(''))
+
+    def test_coast_line(self):
+        """Test that a coast line only belongs to its municipality."""
+        graph = LineGraph.__new__(LineGraph)
+        with mock.patch.object(line_graph, 'DIC_LINES', self.path):
+            graph.load_municipalities()
+        self.assertEqual(graph.line_municipalities(1045), (2, None))
+        self.assertEqual(graph.municipality_lines(2), (45, 1045))
+        self.assertNotIn(-1, graph.municipalities_lines)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(LineGraphTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -26,13 +26,14 @@ from datetime import datetime as dt
 
 # Import QGIS libraries
 from qgis.core import (Qgis,
+                       QgsApplication,
                        QgsVectorFileWriter,
                        QgsMessageLog,
                        QgsProject,
                        QgsVectorLayer)
 # Import PyQt5 libraries
-from PyQt5.QtCore import QSize
-from PyQt5.QtGui import QIntValidator, QIcon
+from PyQt5.QtCore import QSize, QRegExp
+from PyQt5.QtGui import QIntValidator, QRegExpValidator, QIcon
 from PyQt5.QtWidgets import (QMenu,
                              QToolButton,
                              QComboBox,
@@ -52,6 +53,7 @@ from .actions.decimetritzador import *
 from .actions.check_mm import *
 from .actions.update_bm import *
 from .actions.manage_poligonal import *
+from .actions.batch_doc_delim import *
 from .actions.cartographic_document import *
 from .actions.line_del_to_rep import *
 from .actions.municipal_map import *
@@ -555,20 +557,22 @@ class UDTPlugin:
                 return
             # Check if the function is called as a Generador MMC constructor
             # If it is, just return the instance. If not, call some method
-            self.generador_mmc = GeneradorMMC(municipality_id, data_alta)
+            # The municipality's data computed by the checker is shared by all the Generador MMC instances
+            context = generador_mmc_checker.context
+            self.generador_mmc = GeneradorMMC(municipality_id, data_alta, context=context)
             if constructor:
                 return self.generador_mmc
 
             if generation_file == 'layers':
-                generador_mmc_layers = GeneradorMMCLayers(municipality_id, data_alta)
+                generador_mmc_layers = GeneradorMMCLayers(municipality_id, data_alta, context=context)
                 generador_mmc_layers.generate_mmc_layers()
                 self.show_success_message('Capes amb geometria generades. Revisa el log.')
             elif generation_file == 'metadata-table':
-                generador_mmc_metadata_table = GeneradorMMCMetadataTable(municipality_id, data_alta)
+                generador_mmc_metadata_table = GeneradorMMCMetadataTable(municipality_id, data_alta, context)
                 generador_mmc_metadata_table.generate_metadata_table()
                 self.show_success_message('Taula de metadades generada. Revisa-la.')
             elif generation_file == 'metadata-file':
-                generador_mmc_metadata_file = GeneradorMMCMetadata(municipality_id, data_alta)
+                generador_mmc_metadata_file = GeneradorMMCMetadata(municipality_id, data_alta, context=context)
                 generador_mmc_metadata_file.generate_metadata_file()
                 self.show_success_message('Metadades generades. Revisa-les.')
 
@@ -685,11 +689,12 @@ class UDTPlugin:
                     'remove-layers-canvas'.
         :type job: str
         """
+        master = self.agregador_dlg.masterCheckBox.isChecked()
         # Check that exists all the necessary data in the workspace
-        input_data_ok = check_agregador_input_data()
+        input_data_ok = check_agregador_input_data(master)
         if not input_data_ok:
             return
-        agregador_mmc = AgregadorMMC()
+        agregador_mmc = AgregadorMMC(master)
         # en funcion del job hacer una cosa u otra
         if job == 'add-data':
             agregador_mmc.add_municipal_map_data()
@@ -710,7 +715,7 @@ class UDTPlugin:
         input_directory_ok = self.validate_input_directory(input_directory)
 
         if input_directory_ok:
-            import_agregador_data(input_directory)
+            import_agregador_data(input_directory, self.agregador_dlg.masterCheckBox.isChecked())
             self.show_success_message('Dades del MMC importades correctament')
 
     # #######################
@@ -725,7 +730,8 @@ class UDTPlugin:
 
     def configure_eliminador_mmc_dialog(self):
         """ Configure the Eliminador MMC dialog """
-        self.eliminador_dlg.municipiID.setValidator(QIntValidator())
+        # One municipality ID or several ones separated by commas
+        self.eliminador_dlg.municipiID.setValidator(QRegExpValidator(QRegExp(r'\d+(\s*,\s*\d+)*')))
         # Buttons #######
         self.eliminador_dlg.rmDataBtn.clicked.connect(self.init_eliminador_mmc)
         self.eliminador_dlg.rmTempBtn.clicked.connect(lambda: self.remove_temp_files('eliminador'))
@@ -735,7 +741,11 @@ class UDTPlugin:
     def init_eliminador_mmc(self):
         """ Run the Eliminador MMC process """
         # Get input data
-        municipality_id = self.eliminador_dlg.municipiID.text()
+        municipality_ids = [municipality_id.strip() for municipality_id in self.eliminador_dlg.municipiID.text().split(',')]
+        if len(municipality_ids) > 1:
+            self.init_eliminador_mmc_batch(municipality_ids)
+            return
+        municipality_id = municipality_ids[0]
         # Validate the municipality ID input
         municipality_id_ok = self.validate_municipality_id(municipality_id)
 
@@ -756,6 +766,32 @@ class UDTPlugin:
                 else:
                     self.show_error_message('El municipi introduit no té mapa municipal considerat.')
 
+    def init_eliminador_mmc_batch(self, municipality_ids):
+        """
+        Run the Eliminador MMC process for several municipalities at once
+
+        :param municipality_ids: List with the ID of the municipalities to remove
+        :type municipality_ids: list
+        """
+        for municipality_id in municipality_ids:
+            municipality_id_ok = self.validate_municipality_id(municipality_id)
+            if not municipality_id_ok:
+                return
+        # Check that exists the input Municipal Map of Catalonia and all the necessary layers
+        input_data_ok = check_eliminador_input_data()
+        if not input_data_ok:
+            return
+
+        eliminador_mmc_batch = EliminadorMMCBatch(municipality_ids)
+        # Check that the municipalities to remove exist in the input Municipal Map of Catalonia
+        for eliminador_mmc in eliminador_mmc_batch.eliminadors:
+            if not eliminador_mmc.check_mm_exists(eliminador_mmc.municipality_codi_ine):
+                self.show_error_message(f'El municipi {eliminador_mmc.municipality_id} no té mapa municipal considerat.')
+                return
+
+        eliminador_mmc_batch.remove_municipalities_data()
+        self.show_success_message('Mapes municipals esborrats.')
+
     # #################################################
     # Transformations
     # #######################
@@ -778,6 +814,9 @@ class UDTPlugin:
         input_directory_ok = self.validate_input_directory(input_directory)
 
         if input_directory_ok:
+            if self.decimetritzador_dlg.decimetritzadorBatchCheckBox.isChecked():
+                self.run_batch_doc_delim(input_directory, ('decimetritzador',))
+                return
             decimetritzador = Decimetritzador(input_directory)
             decimetritzador_data_ok = decimetritzador.check_input_data()
             if decimetritzador_data_ok:
@@ -802,12 +841,29 @@ class UDTPlugin:
         input_directory_ok = self.validate_input_directory(input_directory)
 
         if input_directory_ok:
+            if self.poligonal_dlg.poligonalBatchCheckBox.isChecked():
+                self.run_batch_doc_delim(input_directory, ('poligonal',))
+                return
             poligonal_manager = ManagePoligonal(input_directory)
             poligonal_data_ok = poligonal_manager.check_input_data()
             if poligonal_data_ok:
                 poligonal_manager.update_poligonal_table()
                 self.show_success_message('Taula POLIGONA actualitzada')
 
+    # #######################
+    # Batch DocDelim
+    def run_batch_doc_delim(self, root_directory, processes):
+        """ Run the processes over all the DocDelim directories of the root directory, in a QGIS background task """
+        # Keep a reference to the task, otherwise it's deleted before the task manager runs it
+        self.batch_doc_delim_task = BatchDocDelimTask(root_directory, processes)
+        report_path = self.batch_doc_delim_task.batch_doc_delim.report_path
+        self.batch_doc_delim_task.taskCompleted.connect(
+            lambda: self.show_success_message(f'DocDelim processats. Si us plau, consulta el resum a {report_path}'))
+        self.batch_doc_delim_task.taskTerminated.connect(
+            lambda: self.show_error_message("No s'han pogut processar els DocDelim. Si us plau, consulta el registre "
+                                            "de missatges"))
+        QgsApplication.taskManager().addTask(self.batch_doc_delim_task)
+
     # #######################
     # Official line to non official line
     def show_del_to_rep_dialog(self):
@@ -914,7 +970,8 @@ class UDTPlugin:
         date_last_update_ok = self.validate_date_last_update(date_last_update)
 
         if date_last_update_ok:
-            bm_updater = UpdateBM(date_last_update)
+            dissolve_in_db = self.update_bm_dlg.dissolveDbCheckBox.isChecked()
+            bm_updater = UpdateBM(date_last_update, dissolve_in_db)
             bm_data_ok = bm_updater.check_bm_data()
             if bm_data_ok:
                 new_data_alta = bm_updater.update_bm()
@@ -941,7 +998,15 @@ class UDTPlugin:
     # Check new MM
     def analysis_check_mm(self):
         """ Perform an analysis that checks if there are any municipalities ready to generate them Municipal Map """
-        check_mm = CheckMM()
+        full = False
+        # If there is a previous check, only the affected municipalities are checked unless the user asks otherwise
+        if os.path.exists(os.path.join(CHECK_MM_LOCAL_DIR, CHECK_MM_SNAPSHOT_NAME)):
+            answer = QMessageBox.question(self.iface.mainWindow(), 'Anàlisi de nous MM',
+                                          "Vols tornar a comprovar tots els municipis? Si no, només es comproven "
+                                          "els municipis afectats pels canvis des de l'última comprovació.",
+                                          QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            full = answer == QMessageBox.Yes
+        check_mm = CheckMM(full)
         check_mm.get_new_mm()
         self.show_success_message('Anàlisi de nous MM realitzat. Si us plau, ves al report per veure els resultats.')
 
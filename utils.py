@@ -81,6 +81,34 @@ def point_num_to_text(num_fita):
     return num_fita_txt
 
 
+def get_fita_attributes(fita_mem_feature):
+    """
+    Get the MMC attributes of a point from its feature in the v_fita_mem view
+
+    :param fita_mem_feature: Feature of the point in the v_fita_mem view
+    :type fita_mem_feature: QgsFeature
+
+    :return: fita_attributes: Dictionary with the MMC field name as key and its value as value
+    :rtype: dict
+    """
+    id_u_fita = fita_mem_feature['id_u_fita']
+    # A point without id_u_fita gets an empty IdUFita, as a point that doesn't exist in the database
+    if id_u_fita is None or (isinstance(id_u_fita, QVariant) and id_u_fita.isNull()):
+        id_u_fita = ''
+    else:
+        id_u_fita = id_u_fita[:-2]
+    fita_attributes = {
+        'IdUFita': id_u_fita,
+        'IdFita': coordinates_to_id_fita(fita_mem_feature['point_x'], fita_mem_feature['point_y']),
+        'IdFitaR': point_num_to_text(fita_mem_feature['num_fita']),
+        'IdSector': fita_mem_feature['num_sector'],
+        'NumTermes': fita_mem_feature['num_termes'],
+        'Monument': 'S' if fita_mem_feature['trobada'] == 1 else 'N'
+    }
+
+    return fita_attributes
+
+
 def normalize_dogc_title(title):
     """ Normalize a DOGC title in order to capitalize it """
     normalized_title = title.replace("CORRECCIÓ D'ERRADES", "Correcció d'errades").replace("DECRET", "Decret")\